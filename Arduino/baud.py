@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Baud rate negotiation for the Pi-Arduino UART.
+
+The link always comes up at BASEBAUD.  capabilities() first asks the
+firmware what it supports:
+
+   H                firmware answers CAPS|{feature}|..., e.g. CAPS|baud|seq;
+                    older firmware has no H command and ignores it
+
+Only firmware that lists 'baud' is negotiated with; negotiate() then tries
+each faster rate in turn:
+
+   N{rate}          firmware answers BAUD|{rate} and switches, or BAUD|NO
+   NT{hex}          (at the new rate, ECHOES times) firmware answers
+                    T|{hex}|{crc}, crc = CRC16-CCITT of the hex text
+   NC               commit, firmware answers BAUD|OK
+
+N is not a command of the firmware before the handshake either (its B
+runs actuator A), so a stray probe does nothing.
+
+If an echo is lost, garbled or has a bad CRC the host does not commit,
+goes back to the previous rate and the firmware reverts on its own after
+REVERT seconds without NC.  Probing stops at the first rate that fails,
+the fastest rate that passed is kept.
+
+Only the standard library is used so calibrate.py can import this module
+as a script next to config.py.
+'''
+
+import binascii
+import os
+import time
+
+BASEBAUD = 115200
+RATES = (230400, 500000, 1000000)
+ECHOES = 4
+REVERT = 1.0       # firmware falls back to the previous rate after this without NC
+SETTLE = 0.05      # let the firmware finish BAUD|{rate} and switch UART speed
+
+HELLO = 'H'
+CAPS = 'CAPS|'
+
+def crc(text):
+   return '{:04X}'.format(binascii.crc_hqx(text.encode(), 0xFFFF))
+
+def readReply(ser, prefix, timeout, handle=None):
+   '''First line starting with prefix, other lines go to handle(line), None on timeout.'''
+   deadline = time.monotonic() + timeout
+   while time.monotonic() < deadline:
+     line = ser.readline().decode(errors='replace').strip()
+     if(line.startswith(prefix)):
+        return line
+     if(len(line) > 0 and handle is not None):
+        try:
+          handle(line)
+        except Exception as ex:
+          print('{}: {}'.format(line, ex))
+   return None
+
+def capabilities(ser, timeout=0.5, handle=None):
+   '''Features the firmware lists in its CAPS| reply to H, an empty set without one.'''
+   ser.write('{}\n'.format(HELLO).encode())
+   ser.flush()
+   savedTimeout = ser.timeout
+   ser.timeout = 0.1
+   try:
+     reply = readReply(ser, CAPS, timeout, handle)
+   finally:
+     ser.timeout = savedTimeout
+   if(reply is None):
+      return set()
+   return set(feature for feature in reply[len(CAPS):].split('|') if feature)
+
+def echo(ser, timeout=0.5, handle=None):
+   '''One echo-and-CRC round trip at the current rate.'''
+   payload = os.urandom(16).hex()
+   ser.write('NT{}\n'.format(payload).encode())
+   ser.flush()
+   reply = readReply(ser, 'T|', timeout, handle)
+   return reply == 'T|{}|{}'.format(payload, crc(payload))
+
+def tryRate(ser, rate, echoes=ECHOES, timeout=0.5, handle=None):
+   '''Switch both ends to rate, True if the link holds and the switch is committed.'''
+   previous = ser.baudrate
+   ser.write('N{}\n'.format(rate).encode())
+   ser.flush()
+   reply = readReply(ser, 'BAUD|', timeout, handle)
+   if(reply != 'BAUD|{}'.format(rate)):
+      return False
+
+   time.sleep(SETTLE)
+   ser.baudrate = rate
+   ser.reset_input_buffer()
+
+   if(all(echo(ser, timeout, handle) for i in range(echoes))):
+      ser.write(b'NC\n')
+      ser.flush()
+      if(readReply(ser, 'BAUD|OK', timeout, handle) is not None):
+         return True
+
+   # no commit: the firmware drops back by itself after REVERT
+   ser.baudrate = previous
+   time.sleep(REVERT)
+   ser.reset_input_buffer()
+   return False
+
+def negotiate(ser, rates=RATES, echoes=ECHOES, timeout=0.5, handle=None):
+   '''
+   Probe rates in increasing order from the port's current rate and
+   return the fastest one that passed; the port is left at that rate.
+   '''
+   savedTimeout = ser.timeout
+   ser.timeout = 0.1
+   try:
+     for rate in sorted(rates):
+       if(rate <= ser.baudrate):
+          continue
+       start = time.monotonic()
+       ok = tryRate(ser, rate, echoes, timeout, handle)
+       print('baud {} {} ({:.0f} ms)'.format(rate, 'ok' if ok else 'failed', (time.monotonic() - start) * 1000))
+       if(not ok):
+          break
+
+     if(not echo(ser, timeout, handle)):
+        print('baud {} echo failed after negotiation'.format(ser.baudrate))
+   finally:
+     ser.timeout = savedTimeout
+   return ser.baudrate
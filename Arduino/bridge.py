@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Coalescing delivery of firmware status to the GUI thread.
+
+comm.Arduino hands every decoded frame to publish() on the reader thread.
+The bridge keeps only the newest value per channel and a QTimer in the
+GUI thread delivers it at no more than maxRate per second, so a flood of
+S|/A|/E|/PR| frames costs one label update per tick instead of one queued
+signal per frame.  received, delivered and merged counters show how much
+was coalesced.
+
+Callbacks added with subscribe() run on the reader thread for every frame,
+for consumers such as the protocol engines' pressure checks that must not
+miss a sample.  They must be quick and must not touch widgets.
+'''
+
+import threading
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+CHANNELS = ('S', 'A', 'E', 'PR')
+
+class CoalescingBridge(QObject):
+   statusReady = pyqtSignal(int, int, int, float)
+   AstatusReady = pyqtSignal(int, int, int, float)
+   positionReady = pyqtSignal(int, int, str, int)
+   pressureReady = pyqtSignal(str)
+
+   def __init__(self, arduino, maxRate=30, parent=None):
+     super(CoalescingBridge, self).__init__(parent)
+
+     self.lock = threading.Lock()
+     self.latest = {}
+     self.received = dict.fromkeys(CHANNELS, 0)
+     self.delivered = dict.fromkeys(CHANNELS, 0)
+     self.merged = dict.fromkeys(CHANNELS, 0)
+     self.subscribers = {channel: [] for channel in CHANNELS}
+
+     self.signals = {'S': self.statusReady, 'A': self.AstatusReady,
+                     'E': self.positionReady, 'PR': self.pressureReady}
+
+     self.timer = QTimer(self)
+     self.timer.timeout.connect(self.flush)
+     self.setMaxRate(maxRate)
+
+     arduino.addListener(self.publish)
+
+   def setMaxRate(self, maxRate):
+     self.maxRate = maxRate
+     self.timer.start(max(1, int(1000 / maxRate)))
+
+   def subscribe(self, channel, callback):
+     with self.lock:
+       self.subscribers[channel].append(callback)
+
+   def unsubscribe(self, channel, callback):
+     with self.lock:
+       if(callback in self.subscribers[channel]):
+          self.subscribers[channel].remove(callback)
+
+   def publish(self, tag, values):
+     '''Reader thread: remember the newest value, run every-frame subscribers.'''
+     if(tag not in self.received):
+        return
+     with self.lock:
+       self.received[tag] += 1
+       if(tag in self.latest):
+          self.merged[tag] += 1
+       self.latest[tag] = values
+       subscribers = list(self.subscribers[tag])
+     for callback in subscribers:
+       try:
+         callback(*values)
+       except Exception as ex:
+         print('{} subscriber: {}'.format(tag, ex))
+
+   def flush(self):
+     '''GUI thread: deliver the newest value of every channel that changed.'''
+     with self.lock:
+       pending = self.latest
+       self.latest = {}
+       for tag in pending:
+         self.delivered[tag] += 1
+     for tag, values in pending.items():
+       self.signals[tag].emit(*values)
+
+   def stats(self):
+     with self.lock:
+       return {tag: {'received': self.received[tag], 'delivered': self.delivered[tag],
+                     'merged': self.merged[tag]} for tag in CHANNELS}
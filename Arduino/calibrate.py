@@ -9,6 +9,7 @@ import sys
 import time
 
 
+import baud
 import config
 
 
@@ -16,15 +17,17 @@ import serial
 
 
 class Arduino():
-   def __init__(self, parent=None):
+   def __init__(self, port='/dev/ttyS0', baudRates=None, parent=None):
       super(Arduino, self).__init__()
       print('init Arduino communication')
 
       try:
-        self.serialCOM = serial.Serial('/dev/ttyS0', 115200, timeout=10, write_timeout=1)
+        self.serialCOM = serial.Serial(port, 115200, timeout=10, write_timeout=1)
         time.sleep(2)
         print(self.serialCOM)
         self.connected = True
+        if(baudRates and 'baud' in baud.capabilities(self.serialCOM)):
+           baud.negotiate(self.serialCOM, baudRates)
       except Exception as ex:
          print(str(ex))
 
@@ -72,7 +75,9 @@ if __name__ == '__main__':
     config = config.Configuration()
     config.getConfig()
     print(config.calibration)
-    comm = Arduino()
+    # optional argument overrides the configured port, e.g. the emulator's pty
+    port = sys.argv[1] if len(sys.argv) > 1 else config.port
+    comm = Arduino(port, config.baudRates)
 
     print('Be sure KneeSpa app is not running.')
     input('Clear all weight/pressure - Press Enter when ready.')
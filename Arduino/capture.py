@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Capture and replay of serial traffic.
+
+A capture file is the magic b'KSCAP1' followed by one record per line or
+frame seen on the link:
+
+   <d c B H   time.monotonic(), direction b'<' in / b'>' out,
+              kind (0 text line, otherwise the binary frame type), length
+   data       the line without its newline, or the frame payload
+
+comm.Arduino(capture='session.cap') appends every inbound and outbound
+message.  Replayer feeds the inbound records of a capture back through
+handleCOM/handleFrame at the recorded pace, speed times faster, or as fast
+as possible (speed=None), which doubles as a parser throughput benchmark:
+
+   python -m Arduino.capture dump session.cap
+   python -m Arduino.capture replay session.cap [--speed 10 | --max]
+'''
+
+import argparse
+import struct
+import threading
+import time
+
+MAGIC = b'KSCAP1'
+RECORD = struct.Struct('<dcBH')
+INBOUND = b'<'
+OUTBOUND = b'>'
+TEXT = 0
+
+class CaptureWriter():
+   def __init__(self, filename):
+     self.filename = filename
+     self.file = open(filename, 'ab')
+     if(self.file.tell() == 0):
+        self.file.write(MAGIC)
+     self.lock = threading.Lock()
+     self.records = 0
+
+   def write(self, direction, data, kind=TEXT, now=None):
+     now = time.monotonic() if now is None else now
+     if(isinstance(data, str)):
+        data = data.encode()
+     with self.lock:
+       self.file.write(RECORD.pack(now, direction, kind, len(data)))
+       self.file.write(data)
+       self.records += 1
+
+   def flush(self):
+     with self.lock:
+       self.file.flush()
+
+   def close(self):
+     with self.lock:
+       self.file.close()
+
+def readCapture(filename):
+   '''Yield (time, direction, kind, data) for every record in a capture.'''
+   with open(filename, 'rb') as f:
+     if(f.read(len(MAGIC)) != MAGIC):
+        raise ValueError('{} is not a capture file'.format(filename))
+     while True:
+       header = f.read(RECORD.size)
+       if(len(header) < RECORD.size):
+          return
+       when, direction, kind, length = RECORD.unpack(header)
+       data = f.read(length)
+       if(len(data) < length):
+          return
+       yield when, direction, kind, data
+
+class NullPort():
+   '''Stands in for the serial port during a replay, outbound writes go nowhere.'''
+   timeout = 0
+   in_waiting = 0
+
+   def write(self, data):
+     return len(data)
+
+   def flush(self):
+     pass
+
+class Replayer():
+   def __init__(self, arduino, filename, speed=1.0):
+     self.arduino = arduino
+     self.filename = filename
+     self.speed = speed          # None replays as fast as possible
+     self.running = False
+     self.lines = 0
+     self.errors = 0
+     self.elapsed = 0.0
+
+   def stop(self):
+     self.running = False
+
+   def run(self):
+     self.running = True
+     start = time.monotonic()
+     first = None
+     for when, direction, kind, data in readCapture(self.filename):
+       if(not self.running):
+          break
+       if(direction != INBOUND):
+          continue
+       if(first is None):
+          first = when
+       if(self.speed is not None):
+          delay = (when - first) / self.speed - (time.monotonic() - start)
+          if(delay > 0):
+             time.sleep(delay)
+       try:
+         if(kind == TEXT):
+            self.arduino.handleCOM(None, data.decode(errors='replace'))
+         else:
+            self.arduino.handleFrame(None, kind, data)
+       except Exception as ex:
+         self.errors += 1
+         print('{}: {}'.format(data, ex))
+       self.lines += 1
+     self.elapsed = time.monotonic() - start
+     self.running = False
+     return self.report()
+
+   def report(self):
+     return {'lines': self.lines, 'errors': self.errors, 'seconds': round(self.elapsed, 3),
+             'linesPerSecond': round(self.lines / self.elapsed, 1) if self.elapsed > 0 else 0.0}
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description='Inspect or replay a serial capture')
+   parser.add_argument('action', choices=['dump', 'replay'])
+   parser.add_argument('filename')
+   parser.add_argument('--speed', type=float, default=1.0, help='replay speed factor')
+   parser.add_argument('--max', action='store_true', help='replay as fast as possible')
+   args = parser.parse_args(argv)
+
+   if(args.action == 'dump'):
+      first = None
+      for when, direction, kind, data in readCapture(args.filename):
+        first = when if first is None else first
+        text = data.decode(errors='replace') if kind == TEXT else '<frame 0x{:02x} {}>'.format(kind, data.hex())
+        print('{:10.3f} {} {}'.format(when - first, direction.decode(), text))
+      return
+
+   from Arduino import comm
+   arduino = comm.Arduino(replay=args.filename, replaySpeed=None if args.max else args.speed)
+   print(arduino.run())
+
+if __name__ == '__main__':
+   main()
@@ -7,9 +7,63 @@ from time import sleep
 import os
 from datetime import datetime, timedelta
 import sys
+import threading
 import time
 import serial
 
+from Arduino import framing
+from Arduino.baud import negotiate, capabilities, HELLO
+from Arduino.capture import CaptureWriter, Replayer, NullPort, INBOUND, OUTBOUND, TEXT
+from Arduino.commands import CommandQueue
+from Arduino.latency import LatencyRecorder
+from Arduino.telemetry import TelemetryRing, STATUS, ASTATUS
+
+class ReaderStats():
+   '''
+   Counters kept by the serial reader thread.
+
+   lines          complete lines dispatched since start
+   bytes          raw bytes read since start
+   linesPerSecond dispatch rate over the last reporting window
+   queueDepth     complete lines waiting for dispatch after the last read
+   maxQueueDepth  worst queueDepth seen
+   inWaiting      bytes still buffered by the OS after the last read
+   '''
+   def __init__(self, window=1.0):
+     self.window = window
+     self.lines = 0
+     self.bytes = 0
+     self.linesPerSecond = 0.0
+     self.queueDepth = 0
+     self.maxQueueDepth = 0
+     self.inWaiting = 0
+
+     self.windowStart = time.monotonic()
+     self.windowLines = 0
+
+   def read(self, count, pending, inWaiting):
+     self.bytes += count
+     self.queueDepth = pending
+     self.inWaiting = inWaiting
+     if(pending > self.maxQueueDepth):
+        self.maxQueueDepth = pending
+
+   def dispatched(self):
+     self.lines += 1
+     self.windowLines += 1
+     if(self.queueDepth > 0):
+        self.queueDepth -= 1
+
+     now = time.monotonic()
+     if(now - self.windowStart >= self.window):
+        self.linesPerSecond = self.windowLines / (now - self.windowStart)
+        self.windowStart = now
+        self.windowLines = 0
+
+   def report(self):
+     return {'lines': self.lines, 'bytes': self.bytes, 'linesPerSecond': round(self.linesPerSecond, 1),
+             'queueDepth': self.queueDepth, 'maxQueueDepth': self.maxQueueDepth, 'inWaiting': self.inWaiting}
+
 class Arduino(QObject):
    finished = pyqtSignal()
    progress = pyqtSignal(int)
@@ -21,7 +75,65 @@ class Arduino(QObject):
    AstatusEmit = pyqtSignal(int, int, int, float)
    intReady = pyqtSignal(int)
    displayWeightEmit = pyqtSignal(str)
+   weightEmit = pyqtSignal(float, float)   # lbs, settling confidence (nan from older firmware)
+   refusedEmit = pyqtSignal(str, str)      # command, why it was not written
+
+   # 'drain' dispatches every buffered line as soon as it arrives,
+   # 'readline' is the original readline + sleep(0.1) loop
+   readerModes = ['drain', 'readline']
+
+   # 'binary' negotiates the framed protocol in framing.py at connect time
+   # when the firmware lists 'bin', and stays on text otherwise
+   wireModes = ['text', 'binary']
+
+   def __init__(self, port='/dev/ttyS0', baud=115200, readerMode='drain', wireMode='text', taggedCommands=False,
+                statusSignals=True, capture=None, replay=None, replaySpeed=1.0, baudRates=None, parent=None):
+      super(Arduino, self).__init__(parent)
+
+      self.port = port
+      self.baud = baud
+      # faster rates to try at connect time, e.g. baud.RATES; only used
+      # when the firmware lists 'baud' in its CAPS| reply (baud.py)
+      self.baudRates = baudRates
+      self.capabilities = set()
+
+      if(readerMode not in self.readerModes):
+         raise ValueError('unknown reader mode {}'.format(readerMode))
+      if(wireMode not in self.wireModes):
+         raise ValueError('unknown wire mode {}'.format(wireMode))
+      self.readerMode = readerMode
+      self.wireMode = wireMode
+      self.framing = False
+      self.decoder = framing.FrameDecoder()
+      self.stats = ReaderStats()
+      self.connected = False
+
+      # taggedCommands needs firmware that echoes the id as DONE|{seq}, it
+      # is dropped at connect time unless the firmware lists 'seq'
+      self.taggedCommands = taggedCommands
+      self.commands = CommandQueue(self.write, tagged=taggedCommands)
+      # the engine, reader (controller), EStop and GUI threads all write;
+      # after X the stopped run's commands are refused until resume() at
+      # the next run, the operator's go out through sendManual()
+      self.writeLock = threading.Lock()
+      self.stopped = False
+      self.latency = LatencyRecorder()
+
+      # every S|/A|/PR| sample lands in the ring buffer; with statusSignals
+      # off the per-frame statusEmit/AstatusEmit/positionEmit/pressureEmit
+      # signals are not sent and consumers poll telemetry or use a
+      # bridge.CoalescingBridge registered with addListener()
+      self.telemetry = TelemetryRing()
+      self.statusSignals = statusSignals
+      self.listeners = []
 
+      # capture appends every line/frame in both directions to a capture
+      # file; replay runs a capture back through the parser instead of
+      # opening the port (replaySpeed None = as fast as possible)
+      self.capture = None if capture is None else CaptureWriter(capture)
+      self.replay = replay
+      self.replaySpeed = replaySpeed
+      self.replayer = None
 
    @pyqtSlot()
    def procCounter(self): # A slot takes no params
@@ -35,10 +147,18 @@ class Arduino(QObject):
    @pyqtSlot()
    def run(self):
 
+      if(self.replay is not None):
+         self.serialCOM = NullPort()
+         self.replayer = Replayer(self, self.replay, self.replaySpeed)
+         report = self.replayer.run()
+         print('replay {}'.format(report))
+         self.finished.emit()
+         return report
+
       print('startSerial')
 
       try:
-        self.serialCOM = serial.Serial('/dev/ttyS0', 115200, timeout=10, write_timeout=1)
+        self.serialCOM = serial.Serial(self.port, self.baud, timeout=10, write_timeout=1)
         time.sleep(2)
         print(self.serialCOM)
         self.connected = True
@@ -49,55 +169,279 @@ class Arduino(QObject):
 
       self.command = ''
 
+      self.negotiateCapabilities(self.serialCOM)
+      self.taggedCommands = self.taggedCommands and self.supports('seq')
+      self.commands.tagged = self.taggedCommands
+
+      if(self.baudRates and self.supports('baud')):
+         self.negotiateBaud(self.serialCOM)
+
+      if(self.wireMode == 'binary' and self.readerMode == 'drain' and self.supports('bin')):
+         self.negotiateFraming(self.serialCOM)
+
       self.readFromCOM(self.serialCOM)
 
+   def negotiateCapabilities(self, ser):
+      '''Ask the firmware what it supports, nothing beyond plain text without an answer.'''
+      handle = lambda line: (self.record(INBOUND, line), self.handleCOM(ser, line))
+      self.record(OUTBOUND, HELLO)
+      self.capabilities = capabilities(ser, handle=handle)
+      print('firmware capabilities {}'.format(sorted(self.capabilities) or 'none'))
+      return self.capabilities
+
+   def supports(self, feature):
+      return feature in self.capabilities
+
+   def negotiateBaud(self, ser):
+      '''Move the link to the fastest of baudRates that passes the echo check.'''
+      handle = lambda line: (self.record(INBOUND, line), self.handleCOM(ser, line))
+      self.baud = negotiate(ser, self.baudRates, handle=handle)
+      print('baud {}'.format(self.baud))
+      return self.baud
+
+   def negotiateFraming(self, ser, timeout=1.0):
+      '''Ask the firmware for binary frames, lines seen meanwhile are handled as usual.'''
+      ser.write((framing.ENABLE + '\n').encode())
+      self.record(OUTBOUND, framing.ENABLE)
+      ser.flush()
+
+      savedTimeout = ser.timeout
+      ser.timeout = 0.1
+      deadline = time.monotonic() + timeout
+      try:
+        while time.monotonic() < deadline:
+          reading = ser.readline().decode(errors='replace').strip()
+          if(len(reading) > 0):
+            self.record(INBOUND, reading)
+          if(reading == framing.ACK):
+            self.framing = True
+            self.decoder.framing = True
+            break
+          if(len(reading) > 0):
+            self.handleCOM(ser, reading)
+      finally:
+        ser.timeout = savedTimeout
+
+      print('binary framing {}'.format('on' if self.framing else 'not supported, using text'))
+      return self.framing
+
    def handleCOM(self, ser, data):
 
-       s =  0
        tokens = data.split('|')
-       if(tokens[0] == 'DONE'):
+       values = tokens[1:]
+       if(tokens[0] == 'E'):
+          values = (int(tokens[1]), int(tokens[2]) , tokens[3], int(tokens[4]))
+       if(tokens[0] == 'S' or tokens[0] == 'A'):
+          values = (int(tokens[1]), int(tokens[2]) , int(tokens[3]), float(tokens[4]))
+       return self.dispatch(tokens[0], values)
+
+   def handleFrame(self, ser, msgType, payload):
+       tag, values = framing.decodeMessage(msgType, payload)
+       return self.dispatch(tag, values)
+
+   def addListener(self, listener):
+       '''listener(tag, values) is called on the reader thread for every message.'''
+       self.listeners.append(listener)
+
+   def removeListener(self, listener):
+       # a new list, the reader thread may be walking the old one
+       self.listeners = [l for l in self.listeners if l is not listener]
+
+   def dispatch(self, tag, values):
+
+       for listener in self.listeners:
+          listener(tag, values)
+
+       s =  0
+       if(tag == 'DONE'):
  #         print('self.doneEmit.emit()')
-          print(tokens)
+          print([tag] + list(values))
+          seq = int(values[0]) if len(values) > 0 and str(values[0]).isdigit() else None
+          self.latency.done(seq)
+          self.commands.acknowledge(seq)
           self.doneEmit.emit()
           s = 1
-       if(tokens[0] == 'P'):
-          self.positionEmit.emit(tokens[1])
-       if(tokens[0] == 'PR'):
-          self.pressureEmit.emit(tokens[1])
-       if(tokens[0] == 'E'):
-          self.positionEmit.emit(int(tokens[1]), int(tokens[2]) , tokens[3], int(tokens[4]))
-       if(tokens[0] == 'S'):
-          self.statusEmit.emit(int(tokens[1]), int(tokens[2]) , int(tokens[3]), float(tokens[4]))
-       if(tokens[0] == 'A'):
-          self.AstatusEmit.emit(int(tokens[1]), int(tokens[2]) , int(tokens[3]), float(tokens[4]))
-       if(tokens[0] == 'Ready to Go'):
+       if(tag == 'P'):
+          self.positionEmit.emit(values[0])
+       if(tag == 'PR'):
+          self.telemetry.writePressure(float(values[0]))
+          if(self.statusSignals):
+            self.pressureEmit.emit(values[0])
+       if(tag == 'E'):
+          if(self.statusSignals):
+            self.positionEmit.emit(*values)
+       if(tag == 'S'):
+          self.telemetry.write(STATUS, *values)
+          if(self.statusSignals):
+            self.statusEmit.emit(*values)
+       if(tag == 'A'):
+          self.telemetry.write(ASTATUS, *values)
+          if(self.statusSignals):
+            self.AstatusEmit.emit(*values)
+       if(tag == 'Ready to Go'):
+          self.latency.ready()
           print('self.readyToGoEmit.emit()')
           self.readyToGoEmit.emit()
-       if(tokens[0] == 'weight'):
-          self.displayWeightEmit.emit(tokens[1])
+       if(tag == 'weight'):
+          self.displayWeightEmit.emit(values[0])
+          self.weightEmit.emit(float(values[0]), float(values[1]) if len(values) > 1 else float('nan'))
        return s
 
    def readFromCOM(self, ser):
-      global startRun
+      if(self.readerMode == 'readline'):
+         self.readLinesFromCOM(ser)
+         return
+
+      while True:
+        try:
+          # blocks until at least one byte arrives, then takes everything buffered
+          chunk = ser.read(ser.in_waiting or 1)
+          if(len(chunk) == 0):
+            continue
+
+          items = self.decoder.feed(chunk)
+          self.stats.read(len(chunk), len(items), ser.in_waiting)
+
+          for item in items:
+            try:
+              if(item[0] == 'frame'):
+                self.record(INBOUND, item[2], item[1])
+                self.handleFrame(ser, item[1], item[2])
+              else:
+                self.record(INBOUND, item[1])
+                self.handleCOM(ser, item[1])
+            except Exception as ex:
+              print('{}: {}'.format(item, ex))
+            self.stats.dispatched()
+
+        except Exception as ex:
+          print(str(ex))
+          time.sleep(0.1)
+
+   def readLinesFromCOM(self, ser):
       while True:
         try:
           reading = ser.readline().decode().strip()
 #          print(reading)
           if(len(reading) > 0):
+            self.record(INBOUND, reading)
             s = self.handleCOM(ser, reading)
+            self.stats.dispatched()
 
         except Exception as ex:
           print(str(ex))
 
         time.sleep(0.1)
 
+   def record(self, direction, data, kind=TEXT):
+      if(self.capture is not None):
+         self.capture.write(direction, data, kind)
+
+   def closeCapture(self):
+      if(self.capture is not None):
+         self.capture.close()
+         self.capture = None
+
+   def readerStats(self):
+      report = self.stats.report()
+      report['frames'] = self.decoder.frames
+      report['crcErrors'] = self.decoder.crcErrors
+      return report
+
+   def dumpLatency(self, filename=None):
+      '''Print the per-opcode round-trip histograms, optionally saving them as JSON.'''
+      return self.latency.dump(filename)
+
+   def submit(self, command, timeout=None):
+     '''Queue a command and return a CommandFuture released by its own DONE.'''
+     return self.commands.submit(command, timeout)
 
    def send(self, command):
+     '''A command of the running protocol, refused after a stop like write().'''
+     return self.write(command)
 
+   def sendManual(self, command):
+     '''
+     An operator's command from the GUI.  A stop ends the run it stopped,
+     not the link: this goes out after one too, while the stopped run's
+     engine, pressure controller and streamed profile stay refused until
+     the next run.  False, with refusedEmit, when it could not be written.
+     '''
+     if(command.strip() == 'X'):
+        return self.write(command)
+     with self.writeLock:
+       try:
+         self.transmit(command)
+       except Exception as e:
+         print('cmd {} not sent, {}'.format(command.strip(), e))
+         self.refusedEmit.emit(command.strip(), str(e))
+         return False
+     return True
+
+   def sendLine(self, command):
+     '''
+     For commands that can follow another closely (V, Q).  Text commands
+     have no terminator, newlines on both sides keep this one apart; frames
+     are delimited already.
+     '''
+     return self.write(command if self.framing else '\n{}\n'.format(command))
+
+   def emergencyStop(self):
+     '''
+     X ahead of everything else: release every command waiting for its
+     channel or its DONE, drop the bytes not on the wire yet and write X.
+     In text mode X goes out as a line, so the firmware's
+     readStringUntil('\\n') takes it at once instead of after its timeout
+     and a command sent just before it cannot run into it.  From here on
+     write() refuses everything but X, so a V from the pressure controller
+     or a streamed segment cannot follow it, until resume(); sendManual()
+     still takes the operator's.  False when stopped already and nothing
+     was written.
+     '''
+     with self.writeLock:
+       self.commands.cancelAll()
+       if(self.stopped):
+          return False
+       self.stopped = True
+       try:
+         self.serialCOM.reset_output_buffer()
+       except Exception as e:
+         print(str(e))
+       self.transmit('X' if self.framing else '\nX\n')
+     return True
+
+   def resume(self):
+     '''Let commands out again after a stop, at the start of the next run.'''
+     with self.writeLock:
+       self.stopped = False
+
+   def write(self, command, seq=None):
+     '''One command onto the wire; False if it was refused after a stop.'''
+     stop = command.strip() == 'X'
+     with self.writeLock:
+       if(self.stopped and not stop):
+          print('cmd {} not sent, stopped'.format(command.strip()))
+          self.refusedEmit.emit(command.strip(), 'stopped')
+          return False
+       if(stop):
+          self.stopped = True
+          self.commands.cancelAll()
+       self.transmit(command, seq)
+     return True
+
+   def transmit(self, command, seq=None):
+     '''write() without the lock and the stop check, the caller holds writeLock.'''
+     if(not self.taggedCommands):
+       seq = None
      self.command = command + '\n'
      print('cmd {}'.format(command.strip()))
-     self.serialCOM.write(command.encode())                #transmit data serially 
+     self.latency.sent(command, seq)
+     self.record(OUTBOUND, command.strip() if seq is None else '{}@{}'.format(command.strip(), seq))
+     if(self.framing):
+       self.serialCOM.write(framing.encodeCommand(command, seq))
+     else:
+       if(seq is not None):
+         command = '{}@{}'.format(command.strip(), seq)
+       self.serialCOM.write(command.encode())                #transmit data serially 
      self.serialCOM.flush()
 #     self.doneEmit.emit()
-
-
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Sequence-numbered command queue for comm.Arduino.
+
+submit() tags a command with a sequence id, writes it as soon as no other
+command on the same actuator channel is in flight, and returns a
+CommandFuture that is released by exactly the acknowledgement it needs.
+
+Firmware that echoes the id ('DONE|17', or a sequenced DONE frame) is
+matched by id and commands on different channels are pipelined.  Without
+tagging a DONE cannot say which command finished, so the queue keeps one
+command in flight and a DONE that arrives with nothing outstanding is
+counted as stray instead of releasing the wrong waiter.
+'''
+
+import collections
+import threading
+import time
+
+SEQMODULO = 256     # ids fit the one-byte sequence field of a binary frame
+
+def channelOf(command):
+   '''Commands on the same channel move the same hardware and never overlap.'''
+   command = command.strip()
+   if(command[:3] in ('A12', 'I12') or command[:1] in ('P', 'J', 'R')):
+      return 'A'
+   if(command[:3] in ('A13', 'I13')):
+      return 'B'
+   if(command[:3] in ('A14', 'I14') or command[:1] == 'K'):
+      return 'C'
+   if(command[:1] == 'L'):
+      return 'L'
+   return command[:1]
+
+class CommandFuture():
+   def __init__(self, seq, command, channel):
+     self.seq = seq
+     self.command = command
+     self.channel = channel
+     self.sentAt = 0.0
+     self.ackedAt = 0.0
+     self.latency = None      # round trip in seconds once acknowledged
+     self.cancelled = False
+     self.event = threading.Event()
+
+   def done(self):
+     return self.event.is_set()
+
+   def wait(self, timeout=None):
+     '''True once acknowledged, False on timeout or cancel.'''
+     self.event.wait(timeout)
+     return self.event.is_set() and not self.cancelled
+
+   def result(self, timeout=None):
+     if(not self.wait(timeout)):
+        raise TimeoutError('{} #{} not acknowledged'.format(self.command, self.seq))
+     return self.latency
+
+   def __repr__(self):
+     return '<CommandFuture #{} {} {}>'.format(self.seq, self.command,
+             'cancelled' if self.cancelled else self.latency)
+
+class CommandQueue():
+   def __init__(self, write, tagged=False, history=500):
+     '''write(command, seq) puts one tagged command on the wire, False if it refused it.'''
+     self.write = write
+     self.tagged = tagged
+     self.condition = threading.Condition()
+     self.seq = 0
+     self.inFlight = collections.OrderedDict()
+     self.completed = collections.deque(maxlen=history)
+     self.strayAcks = 0
+     self.generation = 0     # bumped by cancelAll, a waiter from before it does not send
+
+   def nextSeq(self):
+     self.seq = self.seq % (SEQMODULO - 1) + 1     # 1..255, 0 means untagged
+     return self.seq
+
+   def busy(self, channel):
+     if(not self.tagged):
+        return len(self.inFlight) > 0
+     return any(f.channel == channel for f in self.inFlight.values())
+
+   def submit(self, command, timeout=None):
+     '''Send command once its channel is free and return its CommandFuture.'''
+     channel = channelOf(command)
+     with self.condition:
+       generation = self.generation
+       if(not self.condition.wait_for(lambda: not self.busy(channel) or self.generation != generation, timeout)):
+          raise TimeoutError('channel {} busy'.format(channel))
+       future = CommandFuture(self.nextSeq(), command, channel)
+       if(self.generation != generation):
+          # stopped while waiting for the channel
+          future.cancelled = True
+          future.event.set()
+          return future
+       self.inFlight[future.seq] = future
+       future.sentAt = time.monotonic()
+     try:
+       written = self.write(command, future.seq)
+     except Exception:
+       with self.condition:
+         self.inFlight.pop(future.seq, None)
+         self.condition.notify_all()
+       raise
+     if(written is False):
+        # refused, e.g. after a stop
+        with self.condition:
+          self.inFlight.pop(future.seq, None)
+          self.condition.notify_all()
+        future.cancelled = True
+        future.event.set()
+     return future
+
+   def acknowledge(self, seq=None):
+     '''Called from the reader thread for every DONE, seq when the firmware echoed it.'''
+     now = time.monotonic()
+     with self.condition:
+       if(seq is not None and seq in self.inFlight):
+          future = self.inFlight.pop(seq)
+       elif(seq is None and len(self.inFlight) > 0):
+          future = self.inFlight.popitem(last=False)[1]
+       else:
+          self.strayAcks += 1
+          return None
+       future.ackedAt = now
+       future.latency = now - future.sentAt
+       self.completed.append((future.seq, future.command, future.latency))
+       self.condition.notify_all()
+     future.event.set()
+     return future
+
+   def cancelAll(self):
+     '''Release every waiter, used by stop.'''
+     with self.condition:
+       self.generation += 1
+       futures = list(self.inFlight.values())
+       self.inFlight.clear()
+       self.condition.notify_all()
+     for future in futures:
+       future.cancelled = True
+       future.event.set()
+     return len(futures)
+
+   def latencies(self):
+     return list(self.completed)
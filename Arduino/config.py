@@ -15,6 +15,16 @@ class Configuration():
 
        self.flexionPosition = 0
        self.CFactor = 1900
+       self.port = '/dev/ttyS0'
+       self.capture = ''
+       self.baudRates = []
+       self.wireMode = 'text'
+       self.taggedCommands = False
+       self.concurrentMoves = 'off'
+       self.pressureControl = False
+       self.pressureGains = [400.0, 100.0, 0.0]
+       self.streamProfiles = False
+       self.estopPulse = 0.0
 
     def getConfig(self):
      
@@ -70,6 +80,66 @@ class Configuration():
           else:
              self.calibration = float(self.config['Options']['calibration'])
 
+          # serial device, point it at the pty printed by Arduino/emulator.py to run without hardware
+          if(not self.config.has_option(section, 'port')):
+             self.config.set('Options', 'port', str(self.port))
+          else:
+             self.port = self.config['Options']['port']
+
+          # file to record the serial traffic to (see Arduino/capture.py), empty for none
+          if(not self.config.has_option(section, 'capture')):
+             self.config.set('Options', 'capture', str(self.capture))
+          else:
+             self.capture = self.config['Options']['capture']
+
+          # faster UART rates to negotiate at connect time (see Arduino/baud.py), empty stays at 115200
+          if(not self.config.has_option(section, 'baudRates')):
+             self.config.set('Options', 'baudRates', ','.join(str(rate) for rate in self.baudRates))
+          else:
+             self.baudRates = [int(rate) for rate in Configuration.getList(self.config['Options']['baudRates']) if rate]
+
+          # 'binary' negotiates the framed protocol (see Arduino/framing.py), falls back to text
+          if(not self.config.has_option(section, 'wireMode')):
+             self.config.set('Options', 'wireMode', str(self.wireMode))
+          else:
+             self.wireMode = self.config['Options']['wireMode']
+
+          # firmware that answers DONE|{seq}, lets moves on different actuators overlap
+          if(not self.config.has_option(section, 'taggedCommands')):
+             self.config.set('Options', 'taggedCommands', str(self.taggedCommands))
+          else:
+             self.taggedCommands = self.config.getboolean('Options', 'taggedCommands')
+
+          # AC/AD pressure and angle moves: off (one after the other), on (together), sync (arrive together)
+          if(not self.config.has_option(section, 'concurrentMoves')):
+             self.config.set('Options', 'concurrentMoves', str(self.concurrentMoves))
+          else:
+             self.concurrentMoves = self.config['Options']['concurrentMoves']
+
+          # hold and ramp pressure from the streamed readings with V{speed} (Protocols/controller.py), needs firmware support
+          if(not self.config.has_option(section, 'pressureControl')):
+             self.config.set('Options', 'pressureControl', str(self.pressureControl))
+          else:
+             self.pressureControl = self.config.getboolean('Options', 'pressureControl')
+
+          # kp, ki, kd of the pressure controller, V speed units per lb
+          if(not self.config.has_option(section, 'pressureGains')):
+             self.config.set('Options', 'pressureGains', ','.join(str(gain) for gain in self.pressureGains))
+          else:
+             self.pressureGains = [float(gain) for gain in Configuration.getList(self.config['Options']['pressureGains'])]
+
+          # queue each run of moves and holds to the firmware as a profile (Protocols/streaming.py), needs firmware support
+          if(not self.config.has_option(section, 'streamProfiles')):
+             self.config.set('Options', 'streamProfiles', str(self.streamProfiles))
+          else:
+             self.streamProfiles = self.config.getboolean('Options', 'streamProfiles')
+
+          # seconds the stop path holds the EMERGENCYSTOP pin low, 0 leaves the pin alone
+          if(not self.config.has_option(section, 'estopPulse')):
+             self.config.set('Options', 'estopPulse', str(self.estopPulse))
+          else:
+             self.estopPulse = self.config.getfloat('Options', 'estopPulse')
+
         except Exception as e:
            print(str(e))
            print('Fatal error, could not load config file from "%s"' % self.configFile)
@@ -86,6 +156,16 @@ class Configuration():
 
        self.config.set('Options', 'unlock', str(self.unlock))
        self.config.set('Options', 'calibration', str(self.calibration))
+       self.config.set('Options', 'port', str(self.port))
+       self.config.set('Options', 'capture', str(self.capture))
+       self.config.set('Options', 'baudRates', ','.join(str(rate) for rate in self.baudRates))
+       self.config.set('Options', 'wireMode', str(self.wireMode))
+       self.config.set('Options', 'taggedCommands', str(self.taggedCommands))
+       self.config.set('Options', 'concurrentMoves', str(self.concurrentMoves))
+       self.config.set('Options', 'pressureControl', str(self.pressureControl))
+       self.config.set('Options', 'pressureGains', ','.join(str(gain) for gain in self.pressureGains))
+       self.config.set('Options', 'streamProfiles', str(self.streamProfiles))
+       self.config.set('Options', 'estopPulse', str(self.estopPulse))
 
        print('config written')
        try:
@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Virtual KneeSpa firmware on a pseudo-terminal.
+
+   python -m Arduino.emulator [--speed 1.0] [--done-delay 0] ...
+
+prints the pty path to give to comm.Arduino (or the 'port' option in
+kneespa.cfg, or calibrate.py's first argument) and then answers the
+firmware command set:
+
+   A12/A13/A14{inches}  move actuator A/B/C, DONE on arrival
+   K{position}          move C to a step position, DONE on arrival
+   I12/I13/I14{pos}     move an actuator to a raw position, DONE on arrival
+   P{lbs}               drive A until the load cell reads lbs, DONE
+   V{speed}             run A at speed/3200 of full speed, no DONE; A stops
+                        when no V came for velocityTimeout (controller.py)
+   Q{i}:{cmd}:{ms} QG QZ  queue and run a setpoint profile, QS|/QR|/QE|{i}
+                        per segment and QF|{count} at the end (streaming.py)
+   J{option}            jerk A back and forth, DONE
+   L0{cal} L1 L2{lbs} L3 L4 L5 L6   calibration/marks/weight/location
+   S                    S| status frame and DONE
+   X                    stop everything, no DONE
+   Y                    Reset| then Ready to Go
+   Z1                   switch to the binary framing in framing.py
+   H                    CAPS|{feature}|... for the features in capabilities
+   N{rate} NT{hex} NC   baud negotiation in baud.py
+
+Load is modelled as a spring: pressure = stiffness * (A - contact) once A
+is past the contact point.  While something moves the emulator streams
+A| (actuator A) or S| status frames and PR| pressure frames at
+statusInterval.  Commands tagged '@{seq}' are acknowledged with DONE|{seq}
+when 'seq' is in capabilities, otherwise with a bare DONE.
+
+A pty has no real line rate, so maxBaud stands in for the fastest rate the
+wiring can carry: above it every reply is garbled, which makes the echo
+check in baud.negotiate() fail and fall back.
+
+With clock= a Protocols.clock.SimulatedClock, actuator travel and delayed
+replies run in that clock's virtual time and the emulator jumps it to the
+next arrival instead of waiting, see Protocols/simulate.py.
+'''
+
+import argparse
+import binascii
+import os
+import select
+import sys
+import termios
+import threading
+import time
+import tty
+
+from Arduino import baud, framing
+
+A = 12
+B = 13
+C = 14
+
+PROFILE = -1        # seq of a profile segment's move, its arrival is QR| instead of DONE
+
+# what H lists, as Arduino/motor/motor.ino does
+CAPABILITIES = ('baud', 'bin', 'seq', 'speed', 'profile')
+
+class Axis():
+   def __init__(self, device, position=0.0):
+     self.device = device
+     self.position = position
+     self.target = position
+     self.speed = 0.0
+     self.seq = None
+     self.moving = False
+     self.velocity = 0.0
+
+   def moveTo(self, target, speed, seq):
+     self.target = target
+     self.speed = speed
+     self.seq = seq
+     self.moving = True
+     self.velocity = 0.0
+
+   def drive(self, velocity):
+     '''Open-ended move at velocity inches/s, never arrives.'''
+     self.moving = False
+     self.velocity = velocity
+
+   def stop(self):
+     self.target = self.position
+     self.moving = False
+     self.velocity = 0.0
+
+   def step(self, dt):
+     '''Advance by dt seconds, True on the tick the target is reached.'''
+     if(self.velocity != 0.0):
+        self.position = max(0.0, self.position + self.velocity * dt)
+        self.target = self.position
+        return False
+     if(not self.moving):
+        return False
+     delta = self.target - self.position
+     travel = self.speed * dt
+     if(abs(delta) <= travel):
+        self.position = self.target
+        self.moving = False
+        return True
+     self.position += travel if delta > 0 else -travel
+     return False
+
+class VirtualArduino():
+   def __init__(self, speed=1.0, CSpeed=1000.0, stiffness=20.0, contact=0.5,
+                doneDelay=0.0, commandLatency=0.0, statusInterval=0.1,
+                jerkInches=0.25, resetDelay=0.5, factor=3640, CFactor=3640,
+                calibration=-28369.0, tick=0.002, maxBaud=1000000, velocityTimeout=1.5, clock=None,
+                capabilities=CAPABILITIES):
+     self.speed = speed                  # inches/s for A12/A13/A14/P/J
+     self.CSpeed = CSpeed                # steps/s for K and I14
+     self.stiffness = stiffness          # lbs per inch of A past contact
+     self.contact = contact              # inches of A where the load starts
+     self.doneDelay = doneDelay          # firmware time from arrival to DONE
+     self.commandLatency = commandLatency  # time from command to motion start
+     self.statusInterval = statusInterval
+     self.jerkInches = jerkInches
+     self.resetDelay = resetDelay
+     self.factor = factor                # raw A/B position per 8 inches
+     self.CFactor = CFactor
+     self.calibration = calibration
+     self.tick = tick
+     self.maxBaud = maxBaud
+     self.capabilities = tuple(capabilities)   # () for firmware without the H handshake
+     self.velocityTimeout = velocityTimeout
+     self.velocityDeadline = None        # V running on A until then
+     self.clock = clock                  # None for real time
+     self.baud = baud.BASEBAUD
+     self.baudRevert = None              # (previous rate, deadline) until BC commits a switch
+
+     self.axes = {A: Axis(A), B: Axis(B), C: Axis(C)}
+     self.jerkReturn = None
+     self.pending = []                   # [(due, tag, values)] delayed output
+     self.clearProfile()
+     self.framing = False
+     self.decoder = framing.FrameDecoder()
+     self.received = []                  # (monotonic time, command) log
+     self.commandGap = 0.02              # commands without newline end after this idle time
+
+     self.master, self.slave = os.openpty()
+     tty.setraw(self.slave, termios.TCSANOW)
+     self.port = os.ttyname(self.slave)
+
+     self.running = False
+     self.thread = None
+     self.lock = threading.Lock()
+
+   def now(self):
+     return time.monotonic() if self.clock is None else self.clock.now()
+
+   ### output ###
+
+   def emit(self, tag, values=()):
+     if(self.framing):
+        data = framing.encodeMessage(tag, values)
+     else:
+        data = ('|'.join([tag] + [str(v) for v in values]) + '\r\n').encode()
+     if(self.baud > self.maxBaud):
+        data = bytes(b ^ 0x20 if i % 3 == 0 else b for i, b in enumerate(data))
+     try:
+       os.write(self.master, data)
+     except OSError:
+       pass
+
+   def later(self, delay, tag, values=()):
+     self.pending.append((self.now() + delay, tag, values))
+
+   def done(self, seq, delay=0.0):
+     if(seq == PROFILE):
+        self.segmentReached()
+        return
+     self.later(self.doneDelay + delay, 'DONE', () if seq is None else (seq,))
+
+   ### profiles ###
+
+   def clearProfile(self):
+     self.profile = []                   # [(index, command, seconds)] queued segments
+     self.profileRunning = False
+     self.profileEnd = False
+     self.profileCount = 0
+     self.segment = None                 # index of the running segment
+     self.hold = 0.0
+     self.holdUntil = None               # end of its hold, None while it moves
+
+   def profileCommand(self, command):
+     if(command == 'QG'):
+        self.profileRunning = True
+     elif(command == 'QZ'):
+        self.profileEnd = True
+     else:
+        index, move, ms = command[1:].split(':')
+        self.profile.append((int(index), move, int(ms) / 1000.0))
+
+   def segmentReached(self):
+     self.emit('QR', (self.segment,))
+     self.holdUntil = self.now() + self.hold
+
+   def runProfile(self, now):
+     if(not self.profileRunning):
+        return
+     if(self.segment is not None and self.holdUntil is not None and now >= self.holdUntil):
+        self.emit('QE', (self.segment,))
+        self.segment = None
+        self.profileCount += 1
+     if(self.segment is not None):
+        return
+     if(self.profile):
+        self.segment, move, self.hold = self.profile.pop(0)
+        self.holdUntil = None
+        self.emit('QS', (self.segment,))
+        if(move):
+           self.dispatch(move, PROFILE)
+        else:
+           self.segmentReached()
+     elif(self.profileEnd):
+        self.emit('QF', (self.profileCount,))
+        self.clearProfile()
+
+   def pressure(self):
+     return max(0.0, (self.axes[A].position - self.contact) * self.stiffness)
+
+   def raw(self, axis):
+     if(axis.device == C):
+        return int(axis.position)
+     return int(axis.position * self.factor / 8.0)
+
+   def status(self, tag='S'):
+     self.emit(tag, (self.raw(self.axes[A]), self.raw(self.axes[B]), self.raw(self.axes[C]),
+                     '{:.2f}'.format(self.pressure())))
+
+   ### commands ###
+
+   def execute(self, command, seq=None):
+     command = command.strip()
+     if('@' in command):
+        command, tag = command.rsplit('@', 1)
+        seq = int(tag) if tag.isdigit() else seq
+     if('seq' not in self.capabilities):
+        seq = None
+     if(len(command) == 0):
+        return
+     self.received.append((self.now(), command))
+
+     with self.lock:
+       try:
+         self.dispatch(command, seq)
+       except ValueError as ex:
+         print('emulator: bad command {} ({})'.format(command, ex))
+
+   def dispatch(self, command, seq):
+     op = command[0]
+     if(op == 'A' and command[1:3] in ('12', '13', '14')):
+        device = int(command[1:3])
+        inches = float(command[3:])
+        if(device == C):
+           self.move(C, inches * self.CFactor / 6.0, self.CSpeed, seq)
+        else:
+           self.move(device, inches, self.speed, seq)
+     elif(op == 'K'):
+        self.move(C, float(command[1:]), self.CSpeed, seq)
+     elif(op == 'I' and command[1:3] in ('12', '13', '14')):
+        device = int(command[1:3])
+        position = float(command[3:])
+        if(device == C):
+           self.move(C, position, self.CSpeed, seq)
+        else:
+           self.move(device, position * 8.0 / self.factor, self.speed, seq)
+     elif(op == 'Q' and 'profile' in self.capabilities):
+        self.profileCommand(command)
+     elif(op == 'V' and 'speed' in self.capabilities):
+        speed = max(-3200, min(3200, int(command[1:])))
+        self.axes[A].drive(speed * self.speed / 3200.0)
+        self.velocityDeadline = self.now() + self.velocityTimeout
+     elif(op == 'P'):
+        lbs = float(command[1:])
+        self.move(A, self.contact + lbs / self.stiffness, self.speed, seq)
+     elif(op == 'J'):
+        self.jerkReturn = self.axes[A].position
+        self.move(A, max(0.0, self.jerkReturn - self.jerkInches), self.speed, seq)
+     elif(op == 'L'):
+        self.calibrationCommand(command, seq)
+     elif(op == 'S'):
+        self.status()
+        self.done(seq)
+     elif(op == 'G'):
+        self.emit('P', (self.raw(self.axes[A]),))
+        self.done(seq)
+     elif(op == 'X'):
+        for axis in self.axes.values():
+          axis.stop()
+        self.velocityDeadline = None
+        self.clearProfile()
+        self.jerkReturn = None
+        self.pending = [p for p in self.pending if p[1] != 'DONE']
+     elif(op == 'Y'):
+        for axis in self.axes.values():
+          axis.stop()
+        self.velocityDeadline = None
+        self.clearProfile()
+        self.pending = []
+        self.framing = False
+        self.decoder.framing = False
+        self.baud = baud.BASEBAUD
+        self.baudRevert = None
+        self.emit('Reset')
+        self.later(self.resetDelay, 'Ready to Go')
+     elif(command == framing.ENABLE and 'bin' in self.capabilities):
+        self.emit(*framing.ACK.split('|', 1))
+        self.framing = True
+        self.decoder.framing = True
+     elif(op == 'R'):
+        self.move(A, 0.0, self.speed, seq)
+     elif(op == 'H' and self.capabilities):
+        self.emit('CAPS', self.capabilities)
+     elif(op == 'N' and 'baud' in self.capabilities):
+        self.baudCommand(command)
+
+   def move(self, device, target, speed, seq):
+     axis = self.axes[device]
+     if(device == A):
+        self.velocityDeadline = None
+     axis.moveTo(target, speed, seq)
+     if(self.commandLatency > 0):
+        axis.moving = False
+        self.pending.append((self.now() + self.commandLatency, 'start', (device,)))
+
+   def baudCommand(self, command):
+     if(command[:2] == 'NT'):
+        payload = command[2:]
+        self.emit('T', (payload, '{:04X}'.format(binascii.crc_hqx(payload.encode(), 0xFFFF))))
+        return
+     if(command == 'NC'):
+        if(self.baudRevert is not None):
+           self.baudRevert = None
+           self.emit('BAUD', ('OK',))
+        return
+     rate = int(command[1:])
+     if(rate not in (baud.BASEBAUD,) + baud.RATES):
+        self.emit('BAUD', ('NO',))
+        return
+     self.emit('BAUD', (rate,))
+     self.baudRevert = (self.baud, self.now() + baud.REVERT)
+     self.baud = rate
+
+   def calibrationCommand(self, command, seq):
+     stage = command[1:2]
+     if(stage == '0'):
+        if(len(command) > 2):
+           self.calibration = float(command[2:])
+        self.emit('step 0')
+     elif(stage == '1'):
+        self.emit('step 1')
+        self.done(seq)
+     elif(stage == '2'):
+        self.emit('step 2')
+     elif(stage == '3'):
+        self.emit('step 3', (self.calibration,))
+     elif(stage == '4'):
+        self.emit('weight', ('{:.2f}'.format(self.pressure()), '1.00'))
+     elif(stage == '5'):
+        self.done(seq)
+     elif(stage == '6'):
+        axis = self.axes[C]
+        self.emit('E', (self.raw(self.axes[A]), int(axis.position), C, 0))
+
+   ### simulation ###
+
+   def advance(self, dt):
+     now = self.now()
+     for axis in self.axes.values():
+       if(axis.step(dt)):
+          if(axis.device == A and self.jerkReturn is not None):
+             target, self.jerkReturn = self.jerkReturn, None
+             axis.moveTo(target, axis.speed, axis.seq)
+             continue
+          if(axis.device == C):
+             self.emit('E', (self.raw(self.axes[A]), int(axis.position), '{:.1f}'.format(self.pressure()), C))
+          self.done(axis.seq)
+
+     self.runProfile(now)
+
+     if(self.velocityDeadline is not None and now >= self.velocityDeadline):
+        self.axes[A].stop()
+        self.velocityDeadline = None
+
+     if(self.baudRevert is not None and now >= self.baudRevert[1]):
+        self.baud, self.baudRevert = self.baudRevert[0], None
+
+     due = [p for p in self.pending if p[0] <= now]
+     if(due):
+        self.pending = [p for p in self.pending if p[0] > now]
+        for when, tag, values in sorted(due, key=lambda p: p[0]):
+          if(tag == 'start'):
+             self.axes[values[0]].moving = True
+          else:
+             self.emit(tag, values)
+
+   def fastForward(self, wallSeconds):
+     '''
+     Jump a simulated clock to the next arrival or delayed reply.  While V
+     runs A the host closes the loop on the PR| frames, so the clock then
+     only moves with the wall clock.
+     '''
+     if(self.velocityDeadline is not None):
+        self.clock.advance(wallSeconds)
+        return
+     waits = [abs(axis.target - axis.position) / axis.speed
+              for axis in self.axes.values() if axis.moving and axis.speed > 0]
+     now = self.now()
+     waits += [when - now for when, tag, values in self.pending]
+     if(self.holdUntil is not None):
+        waits.append(self.holdUntil - now)
+     if(waits):
+        # at least a tick, a rounding remainder of a move would not move a large clock
+        self.clock.advance(max(self.tick, min(waits)))
+
+   def stream(self):
+     axisA = self.axes[A]
+     if(axisA.moving or self.velocityDeadline is not None):
+        self.status('A')
+        self.emit('PR', ('{:.2f}'.format(self.pressure()),))
+     elif(any(axis.moving for axis in self.axes.values())):
+        self.status('S')
+
+   def run(self):
+     self.emit('Ready to Go')
+     last = self.now()
+     lastStatus = last
+     lastRx = time.monotonic()
+     lastWall = lastRx
+     while self.running:
+       readable, _, _ = select.select([self.master], [], [], self.tick)
+       wall = time.monotonic()
+       if(readable):
+          try:
+            data = os.read(self.master, 4096)
+          except OSError:
+            data = b''
+          lastRx = wall
+          for item in self.decoder.feed(data):
+            if(item[0] == 'frame'):
+               msgType, payload, seq = framing.splitSeq(item[1], item[2])
+               self.execute(framing.decodeCommand(msgType, payload), seq)
+            else:
+               self.execute(item[1])
+       elif(len(self.decoder.buffer) > 0 and self.decoder.buffer[0] != framing.SYNC and wall - lastRx >= self.commandGap):
+          # the host writes commands without a newline, like Serial.readString() on the firmware
+          command = bytes(self.decoder.buffer).decode(errors='replace')
+          self.decoder.buffer.clear()
+          self.execute(command)
+
+       now = self.now()
+       with self.lock:
+         self.advance(now - last)
+         if(now - lastStatus >= self.statusInterval):
+            self.stream()
+            lastStatus = now
+         if(self.clock is not None and self.clock.simulated):
+            self.fastForward(wall - lastWall)
+       lastWall = wall
+       last = now
+
+   def start(self):
+     self.running = True
+     self.thread = threading.Thread(target=self.run, name='VirtualArduino', daemon=True)
+     self.thread.start()
+     return self.port
+
+   def close(self):
+     self.running = False
+     if(self.thread is not None):
+        self.thread.join()
+     os.close(self.master)
+     os.close(self.slave)
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description='Virtual KneeSpa firmware on a pty')
+   parser.add_argument('--speed', type=float, default=1.0, help='actuator speed, inches/s')
+   parser.add_argument('--c-speed', type=float, default=1000.0, help='C actuator speed, steps/s')
+   parser.add_argument('--stiffness', type=float, default=20.0, help='load, lbs per inch past contact')
+   parser.add_argument('--contact', type=float, default=0.5, help='A position where the load starts, inches')
+   parser.add_argument('--done-delay', type=float, default=0.0, help='seconds from arrival to DONE')
+   parser.add_argument('--latency', type=float, default=0.0, help='seconds from command to motion')
+   parser.add_argument('--status-interval', type=float, default=0.1, help='seconds between status frames')
+   parser.add_argument('--max-baud', type=int, default=1000000, help='fastest baud rate that works, replies are garbled above it')
+   args = parser.parse_args(argv)
+
+   emulator = VirtualArduino(speed=args.speed, CSpeed=args.c_speed, stiffness=args.stiffness,
+                             contact=args.contact, doneDelay=args.done_delay,
+                             commandLatency=args.latency, statusInterval=args.status_interval,
+                             maxBaud=args.max_baud)
+   print(emulator.start())
+   sys.stdout.flush()
+   try:
+     while True:
+       time.sleep(1)
+   except KeyboardInterrupt:
+     print('Ctrl/C')
+   emulator.close()
+
+if __name__ == '__main__':
+   main()
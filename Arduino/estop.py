@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Stop path that does not wait for the Qt event loop or an engine poll.
+
+trigger() only stamps the time and sets an event, so it is safe from the
+GUI thread, a signal handler or a GPIO edge callback.  The EStop thread,
+raised to SCHED_FIFO where the OS allows it, then in this order
+
+   arduino.emergencyStop()   X ahead of any queued command, every
+                             CommandFuture released
+   pin driven to its stop level (the run level is HIGH, set at setup)
+   every callback added with register(), e.g. the running engine's stop()
+
+and records trigger->X, trigger->pin and trigger->callbacks-done in
+histograms.  newSession() starts a new set of them and report() gives the
+session's numbers in milliseconds:
+
+   line = estop.StopLine(arduino, gpio=GPIO, pin=EMERGENCYSTOP, pulse=0.5)
+   line.register(worker.stop)
+   line.trigger('button')
+
+After pulse seconds without another trigger the pin goes back to the run
+level; pulse None leaves it asserted until release().
+'''
+
+import os
+import threading
+import time
+
+from Arduino.latency import LatencyHistogram
+
+STAGES = ('serial', 'pin', 'wake')
+
+class StopLine():
+   def __init__(self, arduino, gpio=None, pin=None, activeLow=True, pulse=0.5, priority=50):
+     self.arduino = arduino
+     self.gpio = gpio              # RPi.GPIO, or None to leave the pin alone
+     self.pin = pin
+     self.activeLow = activeLow
+     self.pulse = pulse
+     self.priority = priority
+
+     self.lock = threading.Lock()
+     self.event = threading.Event()
+     self.callbacks = []
+     self.requested = None
+     self.source = None
+     self.asserted = False
+     self.realtime = False
+
+     self.sessions = 0
+     self.stops = 0
+     self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+     self.last = None
+
+     self.thread = threading.Thread(target=self.run, name='EStop', daemon=True)
+     self.thread.start()
+
+   def register(self, callback):
+     with self.lock:
+       if(callback not in self.callbacks):
+          self.callbacks.append(callback)
+
+   def unregister(self, callback):
+     with self.lock:
+       self.callbacks = [c for c in self.callbacks if c != callback]
+
+   def trigger(self, source='button'):
+     '''Request a stop; returns at once, the EStop thread does the rest.'''
+     with self.lock:
+       if(self.requested is None):
+          self.requested = time.perf_counter()
+          self.source = source
+     self.event.set()
+
+   def newSession(self):
+     with self.lock:
+       self.sessions += 1
+       self.stops = 0
+       self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+       self.last = None
+
+   def report(self):
+     '''This session's stop latencies in milliseconds.'''
+     with self.lock:
+       report = {stage: histogram.report() for stage, histogram in self.histograms.items()}
+       report['stops'] = self.stops
+       report['last'] = self.last
+       report['realtime'] = self.realtime
+       return report
+
+   def raisePriority(self):
+     try:
+       os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+       return True
+     except (AttributeError, OSError, ValueError) as e:
+       print('estop thread keeps normal priority: {}'.format(e))
+       return False
+
+   def setPin(self, stop):
+     if(self.gpio is None or self.pin is None):
+        return False
+     level = (not stop) if self.activeLow else stop
+     try:
+       self.gpio.output(self.pin, self.gpio.HIGH if level else self.gpio.LOW)
+     except Exception as e:
+       print(str(e))
+       return False
+     self.asserted = stop
+     return True
+
+   def release(self):
+     '''Back to the run level.'''
+     return self.setPin(False)
+
+   def run(self):
+     self.realtime = self.raisePriority()
+     while True:
+       self.event.wait(self.pulse if self.asserted and self.pulse is not None else None)
+       if(not self.event.is_set()):
+          self.release()      # pulse over without another trigger
+          continue
+       self.event.clear()
+       with self.lock:
+         requested, source = self.requested, self.source
+         self.requested = None
+         callbacks = list(self.callbacks)
+       if(requested is None):
+          continue
+       self.stop(requested, source, callbacks)
+
+   def stop(self, requested, source, callbacks):
+     stamps = {}
+     try:
+       self.arduino.emergencyStop()
+     except Exception as e:
+       print(str(e))
+     stamps['serial'] = time.perf_counter()
+     if(self.setPin(True)):
+        stamps['pin'] = time.perf_counter()
+     for callback in callbacks:
+       try:
+         callback()
+       except Exception as e:
+         print(str(e))
+     stamps['wake'] = time.perf_counter()
+
+     last = {stage: round((stamp - requested) * 1000.0, 3) for stage, stamp in stamps.items()}
+     last['source'] = source
+     with self.lock:
+       self.stops += 1
+       for stage, stamp in stamps.items():
+         self.histograms[stage].record(stamp - requested)
+       self.last = last
+     print('estop {}'.format(last))
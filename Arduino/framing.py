@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Compact binary framing for the Pi <-> Arduino serial link.
+
+   SYNC(0xA5) LEN TYPE PAYLOAD[LEN] CRC16
+
+LEN is the payload length, fields are packed little-endian and the CRC16
+(CCITT, init 0xFFFF, stored little-endian) covers LEN, TYPE and PAYLOAD.
+The sync byte never occurs in the firmware's ASCII output, so text lines
+and frames can share the link while the mode is being negotiated.  A
+frame that fails its CRC is dropped up to the next sync byte, none of it
+reaches handleCOM.
+
+Setting SEQFLAG in TYPE marks a frame whose first payload byte is the
+sequence id of a queued command (commands.py); the firmware echoes it in
+a sequenced DONE.
+
+The host asks for framing with the text command 'Z1' when the firmware
+lists 'bin' in its capabilities (baud.capabilities()); it answers 'BIN|1'
+and switches until it is reset, Arduino/motor/motor.ino does.  Anything
+else keeps the text protocol.
+'''
+
+import struct
+
+SYNC = 0xA5
+HEADER = 3         # SYNC LEN TYPE
+TRAILER = 2        # CRC16
+MAXPAYLOAD = 255
+
+ENABLE = 'Z1'
+ACK = 'BIN|1'
+
+SEQFLAG = 0x40
+
+# host -> firmware
+CMD_TEXT = 0x01      # any command without a packed form, ASCII
+CMD_MOVE_A = 0x10    # A12{inches}/A13{inches}   <Bf  actuator, inches
+CMD_MOVE_K = 0x11    # K{position}               <i   position
+CMD_MOVE_I = 0x12    # I12/I13/I14{position}     <Bi  actuator, position
+CMD_PRESSURE = 0x13  # P{lbs}                    <f   lbs
+CMD_STOP = 0x14      # X
+CMD_STATUS = 0x15    # S
+CMD_RESET = 0x16     # Y
+
+# firmware -> host, keyed by the text tag they replace
+MSG_TEXT = 0x81      # free-form log line
+MSG_DONE = 0x82      # DONE
+MSG_READY = 0x83     # Ready to Go
+MSG_STATUS = 0x84    # S|posA|posB|steps|pressure   <iiif  pressure in lbs
+MSG_ASTATUS = 0x85   # A|posA|posB|steps|pressure   <iiif
+MSG_POSITION = 0x86  # E|position|steps|pressure|actuator  <iifi  pressure in lbs
+MSG_PRESSURE = 0x87  # PR|lbs                       <f
+MSG_WEIGHT = 0x88    # weight|lbs[|confidence]      <f[f]
+
+STATUS = struct.Struct('<iiif')
+POSITION = struct.Struct('<iifi')
+MOVE = struct.Struct('<Bf')
+MOVEI = struct.Struct('<Bi')
+INT = struct.Struct('<i')
+FLOAT = struct.Struct('<f')
+WEIGHT = struct.Struct('<ff')
+
+def _crcTable():
+   table = []
+   for i in range(256):
+     crc = i << 8
+     for bit in range(8):
+       if(crc & 0x8000):
+          crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+       else:
+          crc = (crc << 1) & 0xFFFF
+     table.append(crc)
+   return table
+
+CRCTABLE = _crcTable()
+
+def crc16(data, crc=0xFFFF):
+   for b in data:
+     crc = ((crc << 8) & 0xFFFF) ^ CRCTABLE[(crc >> 8) ^ b]
+   return crc
+
+def encodeFrame(msgType, payload=b''):
+   if(len(payload) > MAXPAYLOAD):
+      raise ValueError('payload too long ({} bytes)'.format(len(payload)))
+   body = bytes((len(payload), msgType)) + payload
+   return bytes((SYNC,)) + body + struct.pack('<H', crc16(body))
+
+def withSeq(msgType, payload, seq):
+   if(seq is None):
+      return msgType, payload
+   return msgType | SEQFLAG, bytes((seq,)) + payload
+
+def splitSeq(msgType, payload):
+   '''Return (type, payload, seq), seq is None for an untagged frame.'''
+   if(msgType & SEQFLAG and len(payload) > 0):
+      return msgType & ~SEQFLAG, payload[1:], payload[0]
+   return msgType, payload, None
+
+def packCommand(command):
+   command = command.strip()
+   try:
+     if(command == 'X'):
+        return CMD_STOP, b''
+     if(command == 'S'):
+        return CMD_STATUS, b''
+     if(command == 'Y'):
+        return CMD_RESET, b''
+     if(command[:3] in ('A12', 'A13')):
+        return CMD_MOVE_A, MOVE.pack(int(command[1:3]), float(command[3:]))
+     if(command[:3] in ('I12', 'I13', 'I14')):
+        return CMD_MOVE_I, MOVEI.pack(int(command[1:3]), int(command[3:]))
+     if(command[:1] == 'K'):
+        return CMD_MOVE_K, INT.pack(int(command[1:]))
+     if(command[:1] == 'P'):
+        return CMD_PRESSURE, FLOAT.pack(float(command[1:]))
+   except (ValueError, struct.error):
+     pass
+   return CMD_TEXT, command.encode()
+
+def encodeCommand(command, seq=None):
+   '''Frame a text command, packing the opcodes that have a binary form.'''
+   return encodeFrame(*withSeq(*packCommand(command), seq))
+
+def decodeCommand(msgType, payload):
+   '''Inverse of encodeCommand, returns the equivalent text command.'''
+   msgType, payload, seq = splitSeq(msgType, payload)
+   if(msgType == CMD_STOP):
+      return 'X'
+   if(msgType == CMD_STATUS):
+      return 'S'
+   if(msgType == CMD_RESET):
+      return 'Y'
+   if(msgType == CMD_MOVE_A):
+      actuator, inches = MOVE.unpack(payload)
+      return 'A{}{}'.format(actuator, round(inches, 3))
+   if(msgType == CMD_MOVE_I):
+      return 'I{}{}'.format(*MOVEI.unpack(payload))
+   if(msgType == CMD_MOVE_K):
+      return 'K{}'.format(*INT.unpack(payload))
+   if(msgType == CMD_PRESSURE):
+      return 'P{}'.format(round(FLOAT.unpack(payload)[0], 2))
+   return payload.decode(errors='replace')
+
+def encodeMessage(tag, values=()):
+   '''Firmware side: frame a status message given its text tag and fields.'''
+   if(tag == 'DONE'):
+      return encodeFrame(*withSeq(MSG_DONE, b'', int(values[0]) if values else None))
+   if(tag == 'Ready to Go'):
+      return encodeFrame(MSG_READY)
+   if(tag in ('S', 'A')):
+      positionA, positionB, steps, pressure = values
+      payload = STATUS.pack(int(positionA), int(positionB), int(steps), float(pressure))
+      return encodeFrame(MSG_STATUS if tag == 'S' else MSG_ASTATUS, payload)
+   if(tag == 'E'):
+      position, steps, pressure, actuator = values
+      return encodeFrame(MSG_POSITION, POSITION.pack(int(position), int(steps), float(pressure), int(actuator)))
+   if(tag == 'PR'):
+      return encodeFrame(MSG_PRESSURE, FLOAT.pack(float(values[0])))
+   if(tag == 'weight'):
+      if(len(values) > 1):
+         return encodeFrame(MSG_WEIGHT, WEIGHT.pack(float(values[0]), float(values[1])))
+      return encodeFrame(MSG_WEIGHT, FLOAT.pack(float(values[0])))
+   return encodeFrame(MSG_TEXT, '|'.join([tag] + [str(v) for v in values]).encode())
+
+def decodeMessage(msgType, payload):
+   '''Host side: return (tag, values) with the same tags handleCOM uses.'''
+   msgType, payload, seq = splitSeq(msgType, payload)
+   if(msgType == MSG_DONE):
+      return 'DONE', (() if seq is None else (seq,))
+   if(msgType == MSG_READY):
+      return 'Ready to Go', ()
+   if(msgType in (MSG_STATUS, MSG_ASTATUS)):
+      positionA, positionB, steps, pressure = STATUS.unpack(payload)
+      return ('S' if msgType == MSG_STATUS else 'A'), (positionA, positionB, steps, round(pressure, 2))
+   if(msgType == MSG_POSITION):
+      position, steps, pressure, actuator = POSITION.unpack(payload)
+      return 'E', (position, steps, '{:.1f}'.format(pressure), actuator)
+   if(msgType == MSG_PRESSURE):
+      return 'PR', ('{:.2f}'.format(FLOAT.unpack(payload)[0]),)
+   if(msgType == MSG_WEIGHT):
+      if(len(payload) == WEIGHT.size):
+         weight, confidence = WEIGHT.unpack(payload)
+         return 'weight', ('{:.2f}'.format(weight), '{:.2f}'.format(confidence))
+      return 'weight', ('{:.2f}'.format(FLOAT.unpack(payload)[0]),)
+   tokens = payload.decode(errors='replace').split('|')
+   return tokens[0], tuple(tokens[1:])
+
+class FrameDecoder():
+   '''
+   Incremental decoder for a byte stream carrying text lines and, once
+   framing is on, binary frames.  feed() returns a list of
+   ('line', str) and ('frame', type, payload) items in arrival order.
+   '''
+   def __init__(self, framing=False):
+     self.framing = framing
+     self.buffer = bytearray()
+     self.frames = 0
+     self.crcErrors = 0
+     self.resync = False    # after a CRC error, bytes up to the next SYNC are dropped
+
+   def feed(self, data):
+     self.buffer += data
+     items = []
+     buf = self.buffer
+     while buf:
+       if(self.resync):
+          sync = buf.find(SYNC)
+          if(sync < 0):
+             buf.clear()
+             break
+          del buf[:sync]
+          self.resync = False
+
+       sync = buf.find(SYNC) if self.framing else -1
+       newline = buf.find(b'\n')
+
+       if(newline >= 0 and (sync < 0 or newline < sync)):
+          line = bytes(buf[:newline]).decode(errors='replace').strip()
+          del buf[:newline + 1]
+          if(len(line) > 0):
+             items.append(('line', line))
+          continue
+
+       if(sync < 0):
+          break
+       if(sync > 0):
+          # text before a frame without its newline yet, keep it for later
+          line = bytes(buf[:sync]).decode(errors='replace').strip()
+          del buf[:sync]
+          if(len(line) > 0):
+             items.append(('line', line))
+
+       if(len(buf) < HEADER):
+          break
+       length = buf[1]
+       end = HEADER + length + TRAILER
+       if(len(buf) < end):
+          break
+       body = bytes(buf[1:HEADER + length])
+       crc, = struct.unpack_from('<H', buf, HEADER + length)
+       if(crc != crc16(body)):
+          # the length may be the corrupt byte, so drop everything up to
+          # the next sync byte; none of the frame is text
+          self.crcErrors += 1
+          del buf[:1]
+          self.resync = True
+          continue
+       items.append(('frame', body[1], body[2:]))
+       self.frames += 1
+       del buf[:end]
+     return items
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Pin access for the HX711 drivers.
+
+hx711.py and hx711.x.py only clock PD_SCK and read DOUT, through one of
+
+    RPiGPIOBackend   RPi.GPIO, the default
+    GpiodBackend     the Linux GPIO character device (/dev/gpiochipN) through
+                     libgpiod's Python bindings, v1 or v2
+    EmulatedBackend  an HX711 in software: 24 bit conversions at rate,
+                     channel and gain picked by the 25th-27th pulse, power
+                     down when PD_SCK stays high, so the drivers' bit decode,
+                     gain switching and filters run on any Linux box
+
+    hx = HX711(5, 6, backend=backends.GpiodBackend('/dev/gpiochip0'))
+    hx = HX711(5, 6, backend=backends.EmulatedBackend(value=250000, noise=25))
+
+RPi.GPIO and gpiod are imported by their backend only, so neither is
+needed for the other two.
+
+The 24 bit decode (Backend.read_bits, to_signed) and the pulses that
+pick the next channel and gain (NEXT_INPUT, GAIN_PULSES) live here too,
+both drivers and the emulation share them.
+"""
+
+import random
+import threading
+import time
+
+
+# pulses per read -> (channel, gain) of the next conversion
+NEXT_INPUT = {25: ('A', 128), 26: ('B', 32), 27: ('A', 64)}
+
+# (channel, gain) -> pulses after the 24 data bits that select it
+GAIN_PULSES = {next_input: pulses - 24 for pulses, next_input in NEXT_INPUT.items()}
+
+
+def to_signed(word):
+    """
+    to_signed converts a 24 bit two's complement reading to an int.
+
+    Args:
+        word(int): the 24 data bits, MSB first.
+
+    Returns: int
+    """
+    return -(word & 0x800000) + (word & 0x7fffff)
+
+
+class Backend:
+    """
+    Backend is the interface the drivers use: setup() once, then
+    set_clock() and read_data() or pulse() for every bit.
+    """
+
+    # seconds the driver waits after setup, a real chip needs to settle
+    startup = 1.0
+
+    def setup(self, dout, pd_sck):
+        """
+        setup makes pd_sck an output at LOW and dout an input.
+
+        Args:
+            dout(int): pin number of the Data pin.
+            pd_sck(int): pin number of the Clock pin.
+        """
+        raise NotImplementedError
+
+    def set_clock(self, level):
+        """set_clock drives PD_SCK HIGH (True) or LOW (False)."""
+        raise NotImplementedError
+
+    def read_data(self):
+        """read_data returns the DOUT level, 0 or 1."""
+        raise NotImplementedError
+
+    def pulse(self):
+        """
+        pulse clocks one bit: PD_SCK HIGH then LOW, and returns DOUT
+        sampled after the falling edge, when it is stable.
+
+        Returns: int 0 or 1
+        """
+        self.set_clock(True)
+        self.set_clock(False)
+        return self.read_data()
+
+    def read_bits(self, count, timeout=None):
+        """
+        read_bits clocks out count bits, MSB first: the 24 data bits of a
+        conversion, or the 1 to 3 after them that select the next one.
+
+        Args:
+            count(int): number of pulses.
+            timeout(float): Optional, seconds one pulse may take.  PD_SCK
+                HIGH for 60 us powers the chip down, so after a slower
+                pulse the bits are not trusted.
+
+        Returns: int the bits read, or None after a pulse slower than timeout
+        """
+        word = 0
+        if timeout is None:
+            for _ in range(count):
+                word = (word << 1) | self.pulse()
+            return word
+        for _ in range(count):
+            start = time.perf_counter()
+            bit = self.pulse()
+            if time.perf_counter() - start >= timeout:
+                return None
+            word = (word << 1) | bit
+        return word
+
+    def cleanup(self):
+        """cleanup releases the pins."""
+
+
+class RPiGPIOBackend(Backend):
+    """
+    RPiGPIOBackend drives the pins with RPi.GPIO.  Pin numbers are in the
+    numbering the application set with GPIO.setmode(), unless mode is given.
+    """
+
+    def __init__(self, gpio=None, mode=None):
+        """
+        Args:
+            gpio(module): Optional, RPi.GPIO or a module with its API.
+            mode(str): Optional, 'BCM' or 'BOARD' to set the numbering in
+                setup(); None leaves it to the application.
+        """
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self._gpio = gpio
+        self._mode = mode
+        self._dout = None
+        self._pd_sck = None
+
+    def setup(self, dout, pd_sck):
+        self._dout = dout
+        self._pd_sck = pd_sck
+        if self._mode is not None:
+            self._gpio.setmode(getattr(self._gpio, self._mode))
+        self._gpio.setup(pd_sck, self._gpio.OUT)
+        self._gpio.setup(dout, self._gpio.IN)
+
+    def set_clock(self, level):
+        self._gpio.output(self._pd_sck, level)
+
+    def read_data(self):
+        return int(self._gpio.input(self._dout))
+
+    def pulse(self):
+        output = self._gpio.output
+        output(self._pd_sck, True)
+        output(self._pd_sck, False)
+        return int(self._gpio.input(self._dout))
+
+    def read_bits(self, count, timeout=None):
+        if timeout is not None:
+            return Backend.read_bits(self, count, timeout)
+        output, read, pd_sck, dout = self._gpio.output, self._gpio.input, self._pd_sck, self._dout
+        word = 0
+        for _ in range(count):
+            output(pd_sck, True)
+            output(pd_sck, False)
+            word = (word << 1) | int(read(dout))
+        return word
+
+    def cleanup(self):
+        if self._pd_sck is not None:
+            self._gpio.cleanup((self._pd_sck, self._dout))
+
+
+class GpiodBackend(Backend):
+    """
+    GpiodBackend drives the pins through the GPIO character device with
+    the gpiod bindings; pins are line offsets on chip.  Works without
+    RPi.GPIO, e.g. on a Pi 5 or any board with a gpiochip.
+    """
+
+    def __init__(self, chip='/dev/gpiochip0', consumer='hx711'):
+        """
+        Args:
+            chip(str): Optional, path of the gpiochip device.
+            consumer(str): Optional, label of the requested lines.
+        """
+        import gpiod
+        self._gpiod = gpiod
+        self._chip = chip
+        self._consumer = consumer
+        self._request = None
+        self._clock_line = None
+        self._data_line = None
+
+    def setup(self, dout, pd_sck):
+        gpiod = self._gpiod
+        self._dout = dout
+        self._pd_sck = pd_sck
+        if hasattr(gpiod, 'request_lines'):
+            # libgpiod 2: one request for both lines
+            from gpiod.line import Direction, Value
+            self._high, self._low = Value.ACTIVE, Value.INACTIVE
+            self._request = gpiod.request_lines(
+                self._chip, consumer=self._consumer,
+                config={pd_sck: gpiod.LineSettings(direction=Direction.OUTPUT, output_value=Value.INACTIVE),
+                        dout: gpiod.LineSettings(direction=Direction.INPUT)})
+        else:
+            # libgpiod 1: a line object per pin
+            chip = gpiod.Chip(self._chip)
+            self._clock_line = chip.get_line(pd_sck)
+            self._clock_line.request(consumer=self._consumer, type=gpiod.LINE_REQ_DIR_OUT, default_vals=[0])
+            self._data_line = chip.get_line(dout)
+            self._data_line.request(consumer=self._consumer, type=gpiod.LINE_REQ_DIR_IN)
+
+    def set_clock(self, level):
+        if self._request is not None:
+            self._request.set_value(self._pd_sck, self._high if level else self._low)
+        else:
+            self._clock_line.set_value(1 if level else 0)
+
+    def read_data(self):
+        if self._request is not None:
+            return 1 if self._request.get_value(self._dout) == self._high else 0
+        return self._data_line.get_value()
+
+    def cleanup(self):
+        if self._request is not None:
+            self._request.release()
+            self._request = None
+        for line in (self._clock_line, self._data_line):
+            if line is not None:
+                line.release()
+        self._clock_line = self._data_line = None
+
+
+class EmulatedBackend(Backend):
+    """
+    EmulatedBackend is an HX711 behind the pins.  DOUT goes LOW when a
+    conversion is ready, every rising edge of PD_SCK after that shifts out
+    the next of its 24 bits (two's complement, MSB first, saturating like
+    the chip) and 25, 26 or 27 pulses in all select channel A/128, B/32 or
+    A/64 for the next one.  PD_SCK held HIGH for more than 60 us powers it
+    down; it comes back on A/128.
+
+    A reading is value (gain 128 counts, half of it at gain 64) or value_B
+    for channel B, plus Gaussian noise, and with probability spikes one of
+    spike_values instead.  Set load to a callable(channel, gain) -> int to
+    generate readings some other way.
+    """
+
+    startup = 0.0
+
+    def __init__(self, value=0, value_B=0, noise=0.0, spikes=0.0, spike_values=(0, 0x7fffff),
+                 rate=80.0, load=None):
+        """
+        Args:
+            value(int): Optional, channel A reading at gain 128.
+            value_B(int): Optional, channel B reading.
+            noise(float): Optional, standard deviation of the readings.
+            spikes(float): Optional, probability of a reading in spike_values.
+            spike_values((int)): Optional, readings a spike takes.
+            rate(float): Optional, conversions per second (10 or 80 on the
+                chip), None for a conversion always ready.
+            load(callable): Optional, reading for (channel, gain).
+        """
+        self.value = value
+        self.value_B = value_B
+        self.noise = noise
+        self.spikes = spikes
+        self.spike_values = tuple(spike_values)
+        self.rate = rate
+        self.load = load
+        self.conversions = 0
+        self._lock = threading.Lock()
+        self._word = 0
+        self._bit = 1
+        self._power_on()
+
+    def setup(self, dout, pd_sck):
+        with self._lock:
+            self._power_on()
+
+    def _period(self):
+        return 1.0 / self.rate if self.rate else 0.0
+
+    def _power_on(self):
+        self._next = ('A', 128)
+        self._pulses = 0
+        self._reading = False
+        self._armed = False
+        self._high_since = None
+        self._ready_at = time.monotonic() + self._period()
+
+    def _sample(self, channel, gain):
+        if self.load is not None:
+            reading = self.load(channel, gain)
+        elif self.spikes and random.random() < self.spikes:
+            reading = random.choice(self.spike_values)
+        else:
+            reading = self.value_B if channel == 'B' else self.value * gain // 128
+            if self.noise:
+                reading += random.gauss(0.0, self.noise)
+        # the chip saturates instead of wrapping
+        return min(max(int(reading), -0x800000), 0x7fffff) & 0xffffff
+
+    def _rising(self, now):
+        if not self._reading or (self._pulses >= 25 and self._armed):
+            if not self._armed:
+                if self._reading:
+                    self._pulses += 1  # gain pulses past the 27th change nothing
+                return
+            # the first pulse after DOUT went LOW latches the conversion
+            self._word = self._sample(*self._next)
+            self.conversions += 1
+            self._reading = True
+            self._armed = False
+            self._pulses = 0
+        self._pulses += 1
+        if self._pulses <= 24:
+            self._bit = (self._word >> (24 - self._pulses)) & 0x1
+        else:
+            # DOUT goes HIGH on the 25th pulse until the next conversion
+            self._next = NEXT_INPUT.get(self._pulses, self._next)
+            if self._pulses == 25:
+                self._ready_at = now + self._period()
+
+    def _dout(self, now):
+        if self._reading and self._pulses < 25:
+            return self._bit
+        if now >= self._ready_at:
+            self._armed = True  # the driver saw DOUT LOW, the next pulse reads
+            return 0
+        return 1
+
+    def set_clock(self, level):
+        with self._lock:
+            now = time.monotonic()
+            if level:
+                if self._high_since is None:
+                    self._high_since = now
+                    self._rising(now)
+            elif self._high_since is not None:
+                if now - self._high_since > 0.00006:
+                    self._power_on()  # was powered down, starts again
+                self._high_since = None
+
+    def read_data(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._high_since is not None and now - self._high_since > 0.00006:
+                return 1  # powered down
+            return self._dout(now)
+
+    def pulse(self):
+        # both edges at once, the emulation never sees a slow pulse
+        with self._lock:
+            self._rising(time.monotonic())
+            if self._reading and self._pulses < 25:
+                return self._bit
+            return 1
+
+
+def main(argv=None):
+    """
+    main times the HX711 driver's bit decode against the emulated chip:
+
+        python backends.py [--readings 2000]
+    """
+    import argparse
+    import hx711
+
+    parser = argparse.ArgumentParser(description='Time the HX711 bit decode on the emulated backend')
+    parser.add_argument('--readings', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    backend = EmulatedBackend(value=-123456, value_B=4321, noise=25, rate=None)
+    hx = hx711.HX711(5, 6, backend=backend)
+    for byte_format in ('MSB', 'LSB'):
+        hx.set_reading_format(byte_format, 'MSB')
+        for gain in (128, 64, 32):
+            hx.set_gain(gain)
+            start = time.perf_counter()
+            for _ in range(args.readings):
+                hx.read_long()
+            elapsed = time.perf_counter() - start
+            print('{} gain {:3} {:8.1f} us/reading'.format(byte_format, gain, elapsed / args.readings * 1e6))
+
+
+if __name__ == '__main__':
+    main()
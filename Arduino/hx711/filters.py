@@ -0,0 +1,708 @@
+#!/usr/bin/env python3
+"""
+Robust estimators for batches of HX711 readings.
+
+Every filter works on a list of readings and, with NumPy installed, also on
+an array with one window of readings per row (axis=-1), using np.partition
+instead of sorting.  Without NumPy, and for lists shorter than the filter's
+SMALL entry where the array round trip costs more than sorting, the same
+functions run the plain Python versions the drivers used so far, so results
+do not depend on whether NumPy is there.  A list in gives a list out on
+both paths.
+
+SlidingFilter keeps its window between calls for a reading per
+conversion: median and MAD come from an indexable skiplist in O(log n) per
+sample, optionally smoothed and with spikes rejected.  settle() reads
+until the readings stop moving instead of a fixed number of times.
+
+   python filters.py [--windows 30 1000] [--batch 64] [--crossover]
+
+times the Python and NumPy paths against each other, --crossover also
+measures the SMALL entries.
+"""
+
+import argparse
+import collections
+import math
+import random
+import statistics as stat
+import time
+import timeit
+
+try:
+    import numpy as np
+except ImportError:  # the filters still work, only slower
+    np = None
+
+# Lists at least this long take the NumPy path, shorter ones the Python
+# one; arrays always take NumPy.  The lengths are where crossover() found
+# NumPy faster (python filters.py --crossover, re-measure on the Pi): a
+# NumPy call costs microseconds whatever the length and statistics.median
+# sorts in C, so a 30 reading window stays in Python.
+SMALL = {
+    'mean': 8,
+    'median': 384,
+    'trimmed_mean': 40,
+    'winsorized_mean': 40,
+    'outliers_filter': 48,
+    'hampel': 32,
+}
+
+
+def _vectorize(values, name):
+    if np is None:
+        return False
+    return isinstance(values, np.ndarray) or len(values) >= SMALL[name]
+
+
+def _array(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+def mean(values, axis=-1):
+    """
+    mean returns the arithmetic mean of values.
+
+    Args:
+        values([int] || ndarray): readings, one window per row for arrays.
+        axis(int): Optional, axis of the readings in an array.
+
+    Returns: float, or an array of floats for a batch.
+    """
+    if not _vectorize(values, 'mean'):
+        return stat.mean(values)
+    return _array(values).mean(axis=axis)
+
+
+def median(values, axis=-1):
+    """
+    median returns the middle reading, or the mean of the two middle
+    readings for an even count, like HX711.read_median.
+
+    Args:
+        values([int] || ndarray): readings, one window per row for arrays.
+        axis(int): Optional, axis of the readings in an array.
+
+    Returns: float, or an array of floats for a batch.
+    """
+    if not _vectorize(values, 'median'):
+        return stat.median(values)
+    data = _array(values)
+    n = data.shape[axis]
+    if n == 0:
+        raise ValueError('median of no readings')
+    middle = n // 2
+    if n & 0x1:
+        return np.take(np.partition(data, middle, axis=axis), middle, axis=axis)
+    part = np.partition(data, [middle - 1, middle], axis=axis)
+    return (np.take(part, middle - 1, axis=axis) + np.take(part, middle, axis=axis)) / 2.0
+
+
+def trimmed_mean(values, proportion=0.2, axis=-1):
+    """
+    trimmed_mean drops int(n * proportion) readings from each end and
+    returns the mean of the rest, like HX711.read_average.
+
+    Args:
+        values([int] || ndarray): readings, one window per row for arrays.
+        proportion(float): Optional, share cut from each end, below 0.5.
+        axis(int): Optional, axis of the readings in an array.
+
+    Returns: float, or an array of floats for a batch.
+    """
+    if not 0 <= proportion < 0.5:
+        raise ValueError('proportion must be in [0, 0.5). Received: {}'.format(proportion))
+    if not _vectorize(values, 'trimmed_mean'):
+        data = sorted(values)
+        cut = int(len(data) * proportion)
+        return stat.mean(data[cut:len(data) - cut])
+    data = np.moveaxis(_array(values), axis, -1)
+    n = data.shape[-1]
+    cut = int(n * proportion)
+    if cut == 0:
+        return data.mean(axis=-1)
+    part = np.partition(data, [cut, n - cut - 1], axis=-1)
+    return part[..., cut:n - cut].mean(axis=-1)
+
+
+def winsorized_mean(values, proportion=0.2, axis=-1):
+    """
+    winsorized_mean clamps the int(n * proportion) lowest and highest
+    readings to the nearest kept reading and returns the mean.
+
+    Args:
+        values([int] || ndarray): readings, one window per row for arrays.
+        proportion(float): Optional, share clamped at each end, below 0.5.
+        axis(int): Optional, axis of the readings in an array.
+
+    Returns: float, or an array of floats for a batch.
+    """
+    if not 0 <= proportion < 0.5:
+        raise ValueError('proportion must be in [0, 0.5). Received: {}'.format(proportion))
+    if not _vectorize(values, 'winsorized_mean'):
+        data = sorted(values)
+        cut = int(len(data) * proportion)
+        if cut:
+            data = [data[cut]] * cut + data[cut:len(data) - cut] + [data[-cut - 1]] * cut
+        return stat.mean(data)
+    data = np.moveaxis(_array(values), axis, -1)
+    n = data.shape[-1]
+    cut = int(n * proportion)
+    if cut == 0:
+        return data.mean(axis=-1)
+    part = np.partition(data, [cut, n - cut - 1], axis=-1)
+    low = part[..., cut:cut + 1]
+    high = part[..., n - cut - 1:n - cut]
+    return np.clip(data, low, high).mean(axis=-1)
+
+
+def outliers_filter(data_list, m=2.0):
+    """
+    outliers_filter drops falsy readings (failed reads) and then every
+    reading whose distance to the median is m or more median absolute
+    deviations.  Same result as outliers_filter in hx711.x.py.
+
+    Args:
+        data_list([int]): List of int. It can contain Bool False that is removed.
+        m(float): Optional, lower removes more outliers.
+
+    Returns: list of filtered data. Excluding outliers.
+    """
+    if not _vectorize(data_list, 'outliers_filter'):
+        data = [num for num in data_list if num]
+        data_median = stat.median(data)
+        abs_distance = [abs(num - data_median) for num in data]
+        mdev = stat.median(abs_distance)
+        if not mdev:
+            # all data samples in the list have the same value
+            return data
+        return [num for num, distance in zip(data, abs_distance) if distance / mdev < m]
+    # one window: a sort each for the median and the MAD is fewer NumPy
+    # calls than median()'s partitions; the readings keep their type
+    data = np.asarray(data_list)
+    data = data[data != 0]
+    abs_distance = np.abs(data - _sorted_median(np.sort(data)))
+    mdev = _sorted_median(np.sort(abs_distance))
+    if not mdev:
+        return data.tolist()
+    return data[abs_distance / mdev < m].tolist()
+
+
+def _sorted_median(ordered):
+    n = len(ordered)
+    if n == 0:
+        raise ValueError('median of no readings')
+    if n & 0x1:
+        return ordered[n // 2]
+    return (ordered[n // 2 - 1] + ordered[n // 2]) / 2.0
+
+
+def outliers_mean(batch, m=2.0, axis=-1):
+    """
+    outliers_mean is the mean of each window after outliers_filter, for a
+    batch of windows at once (NumPy only).
+
+    Args:
+        batch(ndarray): readings, one window per row.
+        m(float): Optional, lower removes more outliers.
+        axis(int): Optional, axis of the readings.
+
+    Returns: array of floats, one per window.
+    """
+    if np is None:
+        return [mean(outliers_filter(window, m)) for window in batch]
+    data = np.moveaxis(_array(batch), axis, -1)
+    valid = data != 0
+    count = valid.sum(axis=-1, keepdims=True)
+    center = _valid_median(np.where(valid, data, np.inf), count)
+    distance = np.where(valid, np.abs(data - center), np.inf)
+    mdev = _valid_median(distance, count)
+    keep = valid & ((mdev == 0) | (distance < m * mdev))
+    return np.where(keep, data, 0.0).sum(axis=-1) / keep.sum(axis=-1)
+
+
+def _valid_median(data, count):
+    # median of the first count readings per row once sorted, the padding
+    # is +inf and sorts last; np.nanmedian is several times slower
+    ordered = np.sort(data, axis=-1)
+    low = np.take_along_axis(ordered, (count - 1) // 2, axis=-1)
+    high = np.take_along_axis(ordered, count // 2, axis=-1)
+    return (low + high) / 2.0
+
+
+def hampel(values, window=7, n_sigmas=3.0):
+    """
+    hampel replaces every reading further than n_sigmas scaled MADs from
+    the median of the window around it by that median.  The first and
+    last window // 2 readings are kept as they are.
+
+    Args:
+        values([int] || ndarray): readings, one series per row for arrays.
+        window(int): Optional, odd number of readings the median is taken over.
+        n_sigmas(float): Optional, threshold in standard deviations.
+
+    Returns: list of readings, same length, or an array for an array.
+    """
+    if window < 3 or not window & 0x1:
+        raise ValueError('window must be odd and at least 3. Received: {}'.format(window))
+    k = 1.4826  # MAD to standard deviation for normal noise
+    half = window // 2
+    if not _vectorize(values, 'hampel'):
+        data = list(values)
+        result = list(data)
+        for i in range(half, len(data) - half):
+            around = data[i - half:i + half + 1]
+            center = stat.median(around)
+            mad = k * stat.median([abs(v - center) for v in around])
+            if abs(data[i] - center) > n_sigmas * mad:
+                result[i] = center
+        return result
+    data = _array(values)
+    result = data.copy()
+    if data.shape[-1] < window:
+        return result if isinstance(values, np.ndarray) else result.tolist()
+    windows = np.lib.stride_tricks.sliding_window_view(data, window, axis=-1)
+    center = median(windows)
+    mad = k * median(np.abs(windows - center[..., None]))
+    inner = result[..., half:data.shape[-1] - half]
+    outlier = np.abs(inner - center) > n_sigmas * mad
+    inner[outlier] = center[outlier]
+    return result if isinstance(values, np.ndarray) else result.tolist()
+
+
+class IndexableSkiplist:
+    """
+    IndexableSkiplist is a sorted multiset with O(log n) insert, remove,
+    lookup by index and rank by value.  Every link stores how many values
+    it skips, which gives the index of a value on the way down.
+    """
+
+    def __init__(self, capacity):
+        self._levels = max(1, int(math.log(max(capacity, 2), 2)) + 1)
+        self._head = [math.inf, [None] * self._levels, [1] * self._levels]
+        self._nil = [math.inf, [], []]
+        self._head[1] = [self._nil] * self._levels
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._size:
+            raise IndexError('skiplist index out of range')
+        node = self._head
+        index += 1
+        for level in reversed(range(self._levels)):
+            while node[2][level] <= index:
+                index -= node[2][level]
+                node = node[1][level]
+        return node[0]
+
+    def insert(self, value):
+        # a random height with probability 1/2 per level
+        height = 1
+        while height < self._levels and random.random() < 0.5:
+            height += 1
+        node = [value, [None] * height, [None] * height]
+        chain = [None] * self._levels
+        steps = [0] * self._levels
+        current = self._head
+        for level in reversed(range(self._levels)):
+            while current[1][level][0] <= value:
+                steps[level] += current[2][level]
+                current = current[1][level]
+            chain[level] = current
+        skipped = 0
+        for level in range(height):
+            previous = chain[level]
+            node[1][level] = previous[1][level]
+            previous[1][level] = node
+            node[2][level] = previous[2][level] - skipped
+            previous[2][level] = skipped + 1
+            skipped += steps[level]
+        for level in range(height, self._levels):
+            chain[level][2][level] += 1
+        self._size += 1
+
+    def remove(self, value):
+        chain = [None] * self._levels
+        current = self._head
+        for level in reversed(range(self._levels)):
+            while current[1][level][0] < value:
+                current = current[1][level]
+            chain[level] = current
+        node = chain[0][1][0]
+        if node[0] != value:
+            raise KeyError('not found')
+        for level in range(len(node[1])):
+            previous = chain[level]
+            previous[2][level] += node[2][level] - 1
+            previous[1][level] = node[1][level]
+        for level in range(len(node[1]), self._levels):
+            chain[level][2][level] -= 1
+        self._size -= 1
+
+    def rank(self, value):
+        """rank returns how many values are smaller than value."""
+        count = 0
+        current = self._head
+        for level in reversed(range(self._levels)):
+            while current[1][level][0] < value:
+                count += current[2][level]
+                current = current[1][level]
+        return count
+
+
+class SlidingFilter:
+    """
+    SlidingFilter is the median and MAD of the last size readings, updated
+    in O(log n) per reading instead of sorting the window again.
+
+    With spike set, a reading further than spike scaled MADs from the
+    window median is rejected: it still goes into the window, so a real
+    step is followed once it fills half of it, but the output takes the
+    median instead.  With alpha set, the output is exponentially smoothed,
+    value = alpha * reading + (1 - alpha) * value, else it is the median.
+    Both cost the same per reading whatever the window size.
+
+        window = SlidingFilter(31, alpha=0.3, spike=4.0)
+        for raw in readings:
+            value = window.update(raw)
+    """
+
+    def __init__(self, size=31, alpha=None, spike=None, min_samples=5):
+        """
+        Args:
+            size(int): readings kept in the window.
+            alpha(float): Optional, smoothing factor in (0, 1], None for the median.
+            spike(float): Optional, rejection threshold in standard deviations.
+            min_samples(int): Optional, readings needed before spikes are rejected.
+        """
+        if size <= 0:
+            raise ValueError('size must be greater than zero. Received: {}'.format(size))
+        if alpha is not None and not 0 < alpha <= 1:
+            raise ValueError('alpha must be in (0, 1]. Received: {}'.format(alpha))
+        if spike is not None and spike <= 0:
+            raise ValueError('spike must be greater than zero. Received: {}'.format(spike))
+        self.size = size
+        self.alpha = alpha
+        self.spike = spike
+        self.min_samples = max(3, min_samples)
+        self.reset()
+
+    def reset(self):
+        self._window = collections.deque()
+        self._sorted = IndexableSkiplist(self.size)
+        self.value = None
+        self.count = 0
+        self.spikes = 0
+
+    def __len__(self):
+        return len(self._window)
+
+    def update(self, reading):
+        """
+        update adds reading, drops the oldest one past size readings and
+        returns the new output value.
+
+        Returns: float
+        """
+        spiked = False
+        if self.spike is not None and len(self._window) >= self.min_samples:
+            center = self.median()
+            mad = 1.4826 * self.mad(center)
+            spiked = mad > 0 and abs(reading - center) > self.spike * mad
+
+        if len(self._window) == self.size:
+            self._sorted.remove(self._window.popleft())
+        self._window.append(reading)
+        self._sorted.insert(reading)
+        self.count += 1
+
+        if spiked:
+            self.spikes += 1
+        if self.alpha is None:
+            self.value = self.median()
+        else:
+            sample = self.median() if spiked else reading
+            if self.value is None:
+                self.value = float(sample)
+            else:
+                self.value += self.alpha * (sample - self.value)
+        return self.value
+
+    def median(self):
+        """
+        median returns the median of the window, the mean of the two middle
+        readings for an even count.
+        """
+        n = len(self._sorted)
+        if not n:
+            raise ValueError('median of no readings')
+        if n & 0x1:
+            return self._sorted[n // 2]
+        return (self._sorted[n // 2 - 1] + self._sorted[n // 2]) / 2.0
+
+    def mad(self, center=None):
+        """
+        mad returns the median absolute deviation of the window from center,
+        by default its median.  The distances below and above center are
+        two sorted runs of the skiplist, so the middle one is found by
+        bisecting between them in O(log^2 n) without building any list.
+        """
+        n = len(self._sorted)
+        if not n:
+            raise ValueError('mad of no readings')
+        if center is None:
+            center = self.median()
+        split = self._sorted.rank(center)
+        if n & 0x1:
+            return self._kth_distance(n // 2, center, split)
+        return (self._kth_distance(n // 2 - 1, center, split) +
+                self._kth_distance(n // 2, center, split)) / 2.0
+
+    def _kth_distance(self, k, center, split):
+        # k-th smallest (from 0) of below[i] = center - sorted[split - 1 - i]
+        # and above[j] = sorted[split + j] - center, both ascending
+        below = split
+        above = len(self._sorted) - split
+        low, high = max(0, k + 1 - above), min(k + 1, below)
+        # i readings from below and k + 1 - i from above; find the right i
+        while low < high:
+            i = (low + high) // 2
+            j = k - i
+            if j >= 0 and (center - self._sorted[split - 1 - i]) < (self._sorted[split + j] - center):
+                low = i + 1
+            else:
+                high = i
+        i = low
+        j = k + 1 - i
+        candidates = []
+        if i > 0:
+            candidates.append(center - self._sorted[split - i])
+        if j > 0:
+            candidates.append(self._sorted[split + j - 1] - center)
+        return max(candidates)
+
+
+Settled = collections.namedtuple('Settled', ['value', 'settled', 'confidence', 'readings',
+                                             'seconds', 'deviation', 'drift'])
+
+
+def settle(read, noise, drift=None, window=6, max_readings=100, timeout=None):
+    """
+    settle calls read() until the last window readings are steady: their
+    standard deviation is within noise and the mean of the newer half is
+    within drift of the older half's (a load still creeping or ringing
+    fails that even when the noise is low).  It gives up after
+    max_readings readings or timeout seconds.
+
+    Args:
+        read(callable): returns one reading, falsy (False) for a failed one.
+        noise(float): allowed standard deviation, in the units of read().
+        drift(float): Optional, allowed change between the window halves,
+            noise by default.
+        window(int): Optional, readings that have to be steady, at least 2.
+        max_readings(int): Optional, readings before giving up.
+        timeout(float): Optional, seconds before giving up.
+
+    Returns: Settled(value, settled, confidence, readings, seconds,
+        deviation, drift).  value is the mean of the last window readings.
+        confidence is noise^2 / (noise^2 + sem^2 + drift^2) with sem the
+        standard error of value: near 1 for a steady load, 0.5 when the
+        uncertainty equals noise.  value is None if no reading succeeded.
+    """
+    if window < 2:
+        raise ValueError('window must be at least 2. Received: {}'.format(window))
+    if noise <= 0:
+        raise ValueError('noise must be greater than zero. Received: {}'.format(noise))
+    if drift is None:
+        drift = noise
+    start = time.monotonic()
+    last = collections.deque(maxlen=window)
+    readings = 0
+    settled = False
+    deviation = change = 0.0
+    while readings < max_readings:
+        if timeout is not None and time.monotonic() - start >= timeout:
+            break
+        reading = read()
+        readings += 1
+        if not reading:
+            continue
+        last.append(reading)
+        if len(last) < window:
+            continue
+        deviation = stat.pstdev(last)
+        half = window // 2
+        values = list(last)
+        change = stat.mean(values[half:]) - stat.mean(values[:half])
+        if deviation <= noise and abs(change) <= drift:
+            settled = True
+            break
+    seconds = time.monotonic() - start
+    if not last:
+        return Settled(None, False, 0.0, readings, seconds, None, None)
+    if len(last) < window:
+        deviation = stat.pstdev(last) if len(last) > 1 else noise
+        change = 0.0
+    sem = deviation / math.sqrt(len(last))
+    confidence = noise ** 2 / (noise ** 2 + sem ** 2 + change ** 2)
+    return Settled(stat.mean(last), settled, confidence, readings, seconds, deviation, change)
+
+
+def _windows(size, count):
+    # 24 bit readings around a load, a few spikes and failed reads (False)
+    windows = []
+    for _ in range(count):
+        window = [int(random.gauss(250000, 40)) for _ in range(size)]
+        for i in random.sample(range(size), max(1, size // 30)):
+            window[i] = random.choice([False, 8388607, -8388608])
+        windows.append(window)
+    return windows
+
+
+def benchmark(sizes=(30, 1000), batch=64, repeat=5):
+    """
+    benchmark times every filter on the Python and the NumPy path.
+
+    Args:
+        sizes((int)): Optional, readings per window.
+        batch(int): Optional, windows per batched call.
+        repeat(int): Optional, best of repeat runs is reported.
+
+    Returns: list of (name, size, python_us, numpy_us, batched_us) tuples,
+        microseconds per window.
+    """
+    global np
+    numpy = np
+    filters = [('median', median), ('trimmed_mean', trimmed_mean),
+               ('winsorized_mean', winsorized_mean), ('outliers_filter', outliers_filter),
+               ('hampel', hampel)]
+    rows = []
+    for size in sizes:
+        windows = _windows(size, batch)
+        clean = [[v if v else 1 for v in window] for window in windows]
+        for name, function in filters:
+            data = windows if name == 'outliers_filter' else clean
+            timing = []
+            for module in (None, numpy):
+                np = module
+                inputs = data if module is None else [module.asarray(w, dtype=module.float64) for w in data]
+                run = lambda: [function(window) for window in inputs]
+                timing.append(min(timeit.repeat(run, number=1, repeat=repeat)) / batch * 1e6)
+            np = numpy
+            batched = None
+            if numpy is not None and name != 'hampel':
+                stacked = numpy.asarray(data, dtype=numpy.float64)
+                call = (lambda: outliers_mean(stacked)) if name == 'outliers_filter' else (lambda: function(stacked))
+                batched = min(timeit.repeat(call, number=1, repeat=repeat)) / batch * 1e6
+            rows.append((name, size, timing[0], timing[1] if numpy is not None else None, batched))
+    return rows
+
+
+def benchmark_sliding(sizes=(31, 1001), readings=5000):
+    """
+    benchmark_sliding times a median and MAD per reading: sorting the window
+    again against SlidingFilter.update.
+
+    Returns: list of (size, resort_us, sliding_us) tuples, microseconds per reading.
+    """
+    rows = []
+    for size in sizes:
+        data = [random.gauss(250000, 40) for _ in range(readings + size)]
+        window = collections.deque(data[:size], maxlen=size)
+
+        def resort():
+            for reading in data[size:]:
+                window.append(reading)
+                center = stat.median(window)
+                stat.median([abs(v - center) for v in window])
+
+        sliding = SlidingFilter(size, alpha=0.3, spike=4.0)
+        for reading in data[:size]:
+            sliding.update(reading)
+
+        def update():
+            for reading in data[size:]:
+                sliding.update(reading)
+
+        rows.append((size, timeit.timeit(resort, number=1) / readings * 1e6,
+                     timeit.timeit(update, number=1) / readings * 1e6))
+    return rows
+
+
+def crossover(sizes=(8, 16, 24, 32, 40, 48, 64, 96, 128, 192, 256, 384, 512), batch=64, repeat=5):
+    """
+    crossover measures the SMALL entries: for every filter the shortest
+    list from which on the NumPy path, list in and out, beats the Python
+    path at every size measured.
+
+    Args:
+        sizes((int)): Optional, list lengths to time, ascending.
+        batch(int): Optional, lists per timing.
+        repeat(int): Optional, best of repeat runs is compared.
+
+    Returns: dict of filter name to length, None where Python stayed faster.
+    """
+    if np is None:
+        raise RuntimeError('crossover needs NumPy')
+    filters = [('mean', mean), ('median', median), ('trimmed_mean', trimmed_mean),
+               ('winsorized_mean', winsorized_mean), ('outliers_filter', outliers_filter),
+               ('hampel', hampel)]
+    saved = dict(SMALL)
+    result = {}
+    try:
+        for name, function in filters:
+            faster = []
+            for size in sizes:
+                windows = _windows(size, batch)
+                data = windows if name == 'outliers_filter' else [[v if v else 1 for v in w] for w in windows]
+                run = lambda: [function(window) for window in data]
+                timing = []
+                for small in (size + 1, 0):
+                    SMALL[name] = small
+                    timing.append(min(timeit.repeat(run, number=1, repeat=repeat)))
+                faster.append(timing[1] < timing[0])
+            result[name] = None
+            for i in range(len(sizes) - 1, -1, -1):
+                if not faster[i]:
+                    break
+                result[name] = sizes[i]
+    finally:
+        SMALL.update(saved)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the HX711 filters on the Python and NumPy paths')
+    parser.add_argument('--windows', type=int, nargs='+', default=[30, 1000], help='readings per window')
+    parser.add_argument('--batch', type=int, default=64, help='windows per batched call')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--crossover', action='store_true', help='measure the SMALL list lengths too')
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print('numpy not installed, only the Python path is timed')
+    print('{:16} {:>6} {:>12} {:>12} {:>12} {:>8}'.format('filter', 'window', 'python us', 'numpy us',
+                                                          'batched us', 'speedup'))
+    for name, size, python, vector, batched in benchmark(args.windows, args.batch, args.repeat):
+        best = min(t for t in (vector, batched) if t is not None) if np is not None else None
+        print('{:16} {:>6} {:>12.1f} {:>12} {:>12} {:>8}'.format(
+            name, size, python,
+            '-' if vector is None else '{:.1f}'.format(vector),
+            '-' if batched is None else '{:.1f}'.format(batched),
+            '-' if best is None else '{:.1f}x'.format(python / best)))
+
+    print('\n{:16} {:>6} {:>12} {:>12}'.format('median+mad', 'window', 'resort us', 'sliding us'))
+    for size, resort, sliding in benchmark_sliding(args.windows):
+        print('{:16} {:>6} {:>12.1f} {:>12.1f}'.format('', size, resort, sliding))
+
+    if args.crossover and np is not None:
+        print('\n{:16} {:>6} {:>6}'.format('filter', 'SMALL', 'now'))
+        for name, size in crossover(batch=args.batch, repeat=args.repeat).items():
+            print('{:16} {:>6} {:>6}'.format(name, '-' if size is None else size, SMALL[name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,22 @@
 #
 
-import RPi.GPIO as GPIO
+import collections
+import contextlib
+import itertools
 import time
 import threading
 
+import backends
+import filters
+
+
+# Bits of a byte in reverse order, for the LSB bit format.
+REVERSED = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
 
 
 class HX711:
 
-    def __init__(self, dout, pd_sck, gain=128):
+    def __init__(self, dout, pd_sck, gain=128, backend=None):
         self.PD_SCK = pd_sck
 
         self.DOUT = dout
@@ -17,9 +25,11 @@ class HX711:
         # software try to access get values from the class at the same time.
         self.readLock = threading.Lock()
         
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.PD_SCK, GPIO.OUT)
-        GPIO.setup(self.DOUT, GPIO.IN)
+        # Pin access, RPi.GPIO in BCM numbering unless another
+        # backends.Backend is given (gpiod, or the emulated chip for running
+        # without hardware).
+        self.backend = backend if backend is not None else backends.RPiGPIOBackend(mode='BCM')
+        self.backend.setup(self.DOUT, self.PD_SCK)
 
         self.GAIN = 0
 
@@ -37,56 +47,65 @@ class HX711:
         self.byte_format = 'MSB'
         self.bit_format = 'MSB'
 
+        # Optional filter for read_average(), e.g. filters.outliers_filter;
+        # None keeps the 20% trimmed mean.
+        self.dataFilter = None
+
+        # Continuous acquisition, see start_sampling().  The sampler thread
+        # appends (timestamp, raw value) pairs to the ring and feeds each
+        # value to a filters.SlidingFilter over the newest filterSize of
+        # them (median, optionally smoothed and with spikes rejected) for
+        # the filtered estimate.
+        self.sampler = None
+        self.sampling = False
+        self.sampleCondition = threading.Condition()
+        self.ring = collections.deque(maxlen=256)
+        self.sampleCount = 0
+        self.filterSize = 3
+        self.smoothing = None
+        self.spike = None
+        self.window = None
+        self.filtered = None
+        self.filteredTime = None
+        self.pollInterval = 0.0005
+
         self.set_gain(gain)
 
-        # Think about whether this is necessary.
-        time.sleep(1)
+        # Think about whether this is necessary.  (The emulated backend
+        # has nothing to settle.)
+        time.sleep(self.backend.startup)
 
         
     def convertFromTwosComplement24bit(self, inputValue):
-        return -(inputValue & 0x800000) + (inputValue & 0x7fffff)
+        return backends.to_signed(inputValue)
 
     
     def is_ready(self):
-        return GPIO.input(self.DOUT) == 0
+        return self.backend.read_data() == 0
 
     
     def set_gain(self, gain):
-        if gain is 128:
-            self.GAIN = 1
-        elif gain is 64:
-            self.GAIN = 3
-        elif gain is 32:
-            self.GAIN = 2
+        # Channel B only has gain 32, A has 128 and 64.
+        self.GAIN = backends.GAIN_PULSES.get(('B' if gain == 32 else 'A', gain), self.GAIN)
 
-        GPIO.output(self.PD_SCK, False)
+        self.backend.set_clock(False)
 
         # Read out a set of raw bytes and throw it away.
         self.readRawBytes()
 
         
     def get_gain(self):
-        if self.GAIN == 1:
-            return 128
-        if self.GAIN == 3:
-            return 64
-        if self.GAIN == 2:
-            return 32
-
-        # Shouldn't get here.
-        return 0
+        channel, gain = backends.NEXT_INPUT.get(24 + self.GAIN, (None, 0))
+
+        # Shouldn't get 0 here.
+        return gain
         
 
     def readNextBit(self):
        # Clock HX711 Digital Serial Clock (PD_SCK).  DOUT will be
        # ready 1us after PD_SCK rising edge, so we sample after
        # lowering PD_SCL, when we know DOUT will be stable.
-       GPIO.output(self.PD_SCK, True)
-       GPIO.output(self.PD_SCK, False)
-       value = GPIO.input(self.DOUT)
-
-       # Convert Boolean to int and return it.
-       return int(value)
+       return self.backend.pulse()
 
 
     def readNextByte(self):
@@ -116,20 +135,23 @@ class HX711:
            pass
 
         # Read three bytes of data from the HX711.
-        firstByte  = self.readNextByte()
-        secondByte = self.readNextByte()
-        thirdByte  = self.readNextByte()
+        word = self.backend.read_bits(24)
 
         # HX711 Channel and gain factor are set by number of bits read
         # after 24 data bits.
-        for i in range(self.GAIN):
-           # Clock a bit out of the HX711 and throw it away.
-           self.readNextBit()
+        self.backend.read_bits(self.GAIN)
 
         # Release the Read Lock, now that we've finished driving the HX711
         # serial interface.
         self.readLock.release()           
 
+        firstByte  = word >> 16
+        secondByte = (word >> 8) & 0xff
+        thirdByte  = word & 0xff
+        if self.bit_format == 'LSB':
+           # Each byte was built from the bottom.
+           firstByte, secondByte, thirdByte = REVERSED[firstByte], REVERSED[secondByte], REVERSED[thirdByte]
+
         # Depending on how we're configured, return an orderd list of raw byte
         # values.
         if self.byte_format == 'LSB':
@@ -139,6 +161,11 @@ class HX711:
 
 
     def read_long(self):
+        # While the sampler thread owns the chip, everybody else gets the
+        # next conversion it reads instead of clocking the chip themselves.
+        if self.sampling and threading.current_thread() is not self.sampler:
+            return self.wait_samples(1)[0]
+
         # Get a sample from the HX711 in the form of raw bytes.
         dataBytes = self.readRawBytes()
 
@@ -185,16 +212,12 @@ class HX711:
         for x in range(times):
             valueList += [self.read_long()]
 
-        valueList.sort()
-
-        # We'll be trimming 20% of outlier samples from top and bottom of collected set.
-        trimAmount = int(len(valueList) * 0.2)
-
-        # Trim the edge case values.
-        valueList = valueList[trimAmount:-trimAmount]
-
-        # Return the mean of remaining samples.
-        return sum(valueList) / len(valueList)
+        # Drop the outliers with the data filter if one is set, else trim
+        # 20% of samples from top and bottom of the collected set, and
+        # return the mean of the rest (np.partition with NumPy).
+        if self.dataFilter is not None:
+            return float(filters.mean(self.dataFilter(valueList)))
+        return float(filters.trimmed_mean(valueList, 0.2))
 
 
     # A median-based read method, might help when getting random value spikes
@@ -212,45 +235,59 @@ class HX711:
        for x in range(times):
           valueList += [self.read_long()]
 
-       valueList.sort()
-
-       # If times is odd we can just take the centre value.
-       if (times & 0x1) == 0x1:
-          return valueList[len(valueList) // 2]
-       else:
-          # If times is even we have to take the arithmetic mean of
-          # the two middle values.
-          midpoint = len(valueList) / 2
-          return sum(valueList[midpoint:midpoint+2]) / 2.0
+       # The centre value if times is odd, else the arithmetic mean of the
+       # two middle values.
+       return filters.median(valueList)
 
 
     # Compatibility function, uses channel A version
-    def get_value(self, times=3):
-        return self.get_value_A(times)
+    def get_value(self, times=3, fresh=False):
+        return self.get_value_A(times, fresh)
 
 
-    def get_value_A(self, times=3):
+    def get_value_A(self, times=3, fresh=False):
+        # While sampling, the latest filtered estimate comes back at once;
+        # fresh=True still waits for times new conversions.
+        if self.sampling and not fresh:
+            return self.latest_value() - self.get_offset_A()
         return self.read_median(times) - self.get_offset_A()
 
 
     def get_value_B(self, times=3):
-        # for channel B, we need to set_gain(32)
-        g = self.get_gain()
-        self.set_gain(32)
-        value = self.read_median(times) - self.get_offset_B()
-        self.set_gain(g)
+        # for channel B, we need to set_gain(32), the sampler is paused so
+        # no channel B conversion ends up in the channel A ring
+        with self.sampling_paused():
+            g = self.get_gain()
+            self.set_gain(32)
+            value = self.read_median(times) - self.get_offset_B()
+            self.set_gain(g)
         return value
 
     # Compatibility function, uses channel A version
-    def get_weight(self, times=3):
-        return self.get_weight_A(times)
+    def get_weight(self, times=3, fresh=False):
+        return self.get_weight_A(times, fresh)
 
 
-    def get_weight_A(self, times=3):
-        value = self.get_value_A(times)
+    def get_weight_A(self, times=3, fresh=False):
+        value = self.get_value_A(times, fresh)
         value = value / self.REFERENCE_UNIT
         return value
 
+    def get_weight_settled(self, noise=None, drift=None, window=6, max_readings=60, timeout=None):
+        # The channel A weight once the last window conversions are steady,
+        # or the best estimate when max_readings/timeout run out; see
+        # filters.settle.  noise and drift are in weight units, noise
+        # defaults to 100 raw units.
+        unit = abs(self.REFERENCE_UNIT)
+        rawNoise = 100 if noise is None else noise * unit
+        rawDrift = None if drift is None else drift * unit
+        result = filters.settle(self.read_long, rawNoise, rawDrift, window, max_readings, timeout)
+        if result.value is None:
+            return result
+        return result._replace(value=(result.value - self.get_offset_A()) / self.REFERENCE_UNIT,
+                               deviation=result.deviation / unit,
+                               drift=result.drift / self.REFERENCE_UNIT)
+
     def get_weight_B(self, times=3):
         value = self.get_value_B(times)
         value = value / self.REFERENCE_UNIT_B
@@ -280,24 +317,40 @@ class HX711:
         return value
 
 
+    def tare_settled(self, noise=100, drift=None, window=6, max_readings=60, timeout=None):
+        # Like tare_A(), but reads only until the last window conversions
+        # are steady (filters.settle) instead of a fixed number of times,
+        # noise and drift in raw units.  The offset is set only when they
+        # settled; returns the filters.Settled either way.
+        result = filters.settle(self.read_long, noise, drift, window, max_readings, timeout)
+
+        if self.DEBUG_PRINTING:
+            print("Tare settled:", result)
+
+        if result.settled:
+            self.set_offset_A(result.value)
+        return result
+
+
     def tare_B(self, times=15):
         # Backup REFERENCE_UNIT value
         backupReferenceUnit = self.get_reference_unit_B()
         self.set_reference_unit_B(1)
 
         # for channel B, we need to set_gain(32)
-        backupGain = self.get_gain()
-        self.set_gain(32)
+        with self.sampling_paused():
+            backupGain = self.get_gain()
+            self.set_gain(32)
 
-        value = self.read_average(times)
+            value = self.read_average(times)
 
-        if self.DEBUG_PRINTING:
-            print("Tare B value:", value)
-        
-        self.set_offset_B(value)
+            if self.DEBUG_PRINTING:
+                print("Tare B value:", value)
 
-        # Restore gain/channel/reference unit settings.
-        self.set_gain(backupGain)
+            self.set_offset_B(value)
+
+            # Restore gain/channel/reference unit settings.
+            self.set_gain(backupGain)
         self.set_reference_unit_B(backupReferenceUnit)
        
         return value
@@ -322,6 +375,14 @@ class HX711:
             
 
 
+    def set_data_filter(self, data_filter):
+        # data_filter takes the list of readings and returns the ones to
+        # average, None goes back to the trimmed mean.
+        if data_filter is not None and not callable(data_filter):
+            raise TypeError("HX711::set_data_filter(): data_filter must be callable!")
+        self.dataFilter = data_filter
+
+
     # sets offset for channel A for compatibility reasons
     def set_offset(self, offset):
         self.set_offset_A(offset)
@@ -385,8 +446,8 @@ class HX711:
         # Cause a rising edge on HX711 Digital Serial Clock (PD_SCK).  We then
         # leave it held up and wait 100 us.  After 60us the HX711 should be
         # powered down.
-        GPIO.output(self.PD_SCK, False)
-        GPIO.output(self.PD_SCK, True)
+        self.backend.set_clock(False)
+        self.backend.set_clock(True)
 
         time.sleep(0.0001)
 
@@ -401,7 +462,7 @@ class HX711:
         self.readLock.acquire()
 
         # Lower the HX711 Digital Serial Clock (PD_SCK) line.
-        GPIO.output(self.PD_SCK, False)
+        self.backend.set_clock(False)
 
         # Wait 100 us for the HX711 to power back up.
         time.sleep(0.0001)
@@ -419,8 +480,124 @@ class HX711:
 
 
     def reset(self):
-        self.power_down()
-        self.power_up()
+        with self.sampling_paused():
+            self.power_down()
+            self.power_up()
+
+
+    # Continuous acquisition.  A dedicated thread reads every conversion
+    # as soon as DOUT goes low (10 or 80 per second, by the RATE pin) into
+    # a timestamped ring buffer, so get_value()/get_weight() return the
+    # latest filtered estimate without waiting for a conversion, and
+    # read_long()/read_median()/read_average() (and so tare()) wait for
+    # fresh conversions from the ring instead of clocking the chip.
+    def start_sampling(self, capacity=256, filter_size=3, smoothing=None, spike=None):
+        # smoothing is the exponential smoothing factor of the estimate
+        # (None: the plain window median), spike the distance in standard
+        # deviations (from the window MAD) past which a conversion is
+        # rejected as a spike.  The window costs O(log filter_size) per
+        # conversion whatever its size.
+        if self.sampling:
+            return
+        if filter_size <= 0:
+            raise ValueError("HX711::start_sampling(): filter_size must be greater than zero!")
+
+        with self.sampleCondition:
+            self.ring = collections.deque(maxlen=capacity)
+            self.filterSize = filter_size
+            self.smoothing = smoothing
+            self.spike = spike
+            self.window = filters.SlidingFilter(filter_size, alpha=smoothing, spike=spike)
+            self.filtered = None
+            self.filteredTime = None
+
+        self.sampling = True
+        self.sampler = threading.Thread(target=self.sample_loop, name='HX711', daemon=True)
+        self.sampler.start()
+
+
+    def stop_sampling(self):
+        if not self.sampling:
+            return
+        self.sampling = False
+        self.sampler.join()
+        self.sampler = None
+
+        # Wake anybody still waiting for a sample, they will see the
+        # sampler is gone.
+        with self.sampleCondition:
+            self.sampleCondition.notify_all()
+
+
+    @contextlib.contextmanager
+    def sampling_paused(self):
+        # For gain/channel changes and power cycling, which must not race
+        # the sampler thread.
+        wasSampling = self.sampling
+        self.stop_sampling()
+        try:
+            yield
+        finally:
+            if wasSampling:
+                self.start_sampling(self.ring.maxlen, self.filterSize, self.smoothing, self.spike)
+
+
+    def sample_loop(self):
+        while self.sampling:
+            # Poll DOUT instead of spinning in readRawBytes(), the chip
+            # only has a conversion every 12.5 or 100 ms.
+            if not self.is_ready():
+                time.sleep(self.pollInterval)
+                continue
+
+            value = self.read_long()
+            now = time.monotonic()
+
+            with self.sampleCondition:
+                self.ring.append((now, value))
+                self.sampleCount += 1
+
+                self.filtered = self.window.update(value)
+                self.filteredTime = now
+
+                self.sampleCondition.notify_all()
+
+
+    def latest_value(self, timeout=None):
+        # The filtered raw estimate; only waits before the first conversion.
+        with self.sampleCondition:
+            if self.filtered is None:
+                self.sampleCondition.wait_for(lambda: self.filtered is not None or not self.sampling, timeout)
+            if self.filtered is None:
+                raise TimeoutError("HX711::latest_value(): no sample from the HX711")
+            return self.filtered
+
+
+    def wait_samples(self, count, timeout=None):
+        # Block until count conversions newer than the call are in the
+        # ring and return their raw values, oldest first.
+        with self.sampleCondition:
+            if count > self.ring.maxlen:
+                raise ValueError("HX711::wait_samples(): count is larger than the ring buffer!")
+            target = self.sampleCount + count
+            if not self.sampleCondition.wait_for(lambda: self.sampleCount >= target or not self.sampling, timeout):
+                raise TimeoutError("HX711::wait_samples(): %d samples did not arrive" % count)
+            if self.sampleCount < target:
+                raise RuntimeError("HX711::wait_samples(): sampling stopped")
+
+            # Copy out before releasing the lock, every append past maxlen
+            # drops the oldest entry and shifts the rest.  If the waiter
+            # woke too late the oldest of the count are gone and the
+            # oldest still in the ring take their place.
+            first = max(len(self.ring) - (self.sampleCount - target + count), 0)
+            return [v for t, v in itertools.islice(self.ring, first, first + count)]
+
+
+    def samples_since(self, since):
+        # (timestamp, raw value) pairs from the ring newer than since, a
+        # time.monotonic() value.
+        with self.sampleCondition:
+            return [(t, v) for t, v in self.ring if t > since]
 
 
 # EOF - hx711.py
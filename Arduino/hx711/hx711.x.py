@@ -6,7 +6,8 @@ This file holds HX711 class
 import statistics as stat
 import time
 
-import RPi.GPIO as GPIO
+import backends
+import filters
 
 
 class HX711:
@@ -18,7 +19,8 @@ class HX711:
                  dout_pin,
                  pd_sck_pin,
                  gain_channel_A=128,
-                 select_channel='A'):
+                 select_channel='A',
+                 backend=None):
         """
         Init a new instance of HX711
 
@@ -27,6 +29,7 @@ class HX711:
             pd_sck_pin(int): Raspberry Pi pin number where the Clock pin of HX711 is connected.
             gain_channel_A(int): Optional, by default value 128. Options (128 || 64)
             select_channel(str): Optional, by default 'A'. Options ('A' || 'B')
+            backend(backends.Backend): Optional, pin access. By default RPi.GPIO
 
         Raises:
             TypeError: if pd_sck_pin or dout_pin are not int type
@@ -57,8 +60,9 @@ class HX711:
         self._debug_mode = False
         self._data_filter = outliers_filter  # default it is used outliers_filter
 
-        GPIO.setup(self._pd_sck, GPIO.OUT)  # pin _pd_sck is output only
-        GPIO.setup(self._dout, GPIO.IN)  # pin _dout is input only
+        self._backend = backend if backend is not None else backends.RPiGPIOBackend()
+        # pin _pd_sck is output only, pin _dout is input only
+        self._backend.setup(self._dout, self._pd_sck)
         self.select_channel(select_channel)
         self.set_gain_A(gain_channel_A)
 
@@ -152,6 +156,46 @@ class HX711:
                              'can be in range 1 up to 99. '
                              'Received: {}'.format(readings))
 
+    def zero_settled(self, noise=100, drift=None, window=6, max_readings=99, timeout=None):
+        """
+        zero_settled sets the offset like zero() but reads only until the
+        last window readings are steady (filters.settle) instead of a fixed
+        number of times. A load that is still moving is not used as
+        the offset.
+
+        Args:
+            noise(float): allowed standard deviation of the raw readings.
+            drift(float): Optional, allowed drift of the raw readings
+                across the window, noise by default.
+            window(int): Optional, readings that have to be steady.
+            max_readings(int): Optional, readings before giving up.
+            timeout(float): Optional, seconds before giving up.
+
+        Returns: filters.Settled with the raw offset as value. The offset
+            is set only when settled is True.
+        """
+        result = self._read_settled(noise, drift, window, max_readings, timeout)
+        if result.settled:
+            self.set_offset(int(result.value))
+        elif self._debug_mode:
+            print('From method "zero_settled()".\n'
+                  'readings did not settle: {}\n'.format(result))
+        return result
+
+    def _read_settled(self, noise, drift, window, max_readings, timeout):
+        """
+        _read_settled reads the current channel until filters.settle is
+        satisfied and saves the value as its last raw data.
+
+        Returns: filters.Settled of raw data.
+        """
+        backup_channel = self._current_channel
+        backup_gain = self._gain_channel_A
+        result = filters.settle(self._read, noise, drift, window, max_readings, timeout)
+        if result.value is not None:
+            self._save_last_raw_data(backup_channel, backup_gain, int(result.value))
+        return result
+
     def set_offset(self, offset, channel='', gain_A=0):
         """
         set offset method sets desired offset for specific
@@ -306,7 +350,7 @@ class HX711:
         Returns: bool True if ready else False when not ready        
         """
         # if DOUT pin is low data is ready for reading
-        if GPIO.input(self._dout) == 0:
+        if self._backend.read_data() == 0:
             return True
         else:
             return False
@@ -326,8 +370,7 @@ class HX711:
         """
         for _ in range(num):
             start_counter = time.perf_counter()
-            GPIO.output(self._pd_sck, True)
-            GPIO.output(self._pd_sck, False)
+            self._backend.pulse()
             end_counter = time.perf_counter()
             # check if hx 711 did not turn off...
             if end_counter - start_counter >= 0.00006:
@@ -351,7 +394,7 @@ class HX711:
         Returns: (bool || int) if it returns False then it is false reading.
             if it returns int then the reading was correct
         """
-        GPIO.output(self._pd_sck, False)  # start by setting the pd_sck to 0
+        self._backend.set_clock(False)  # start by setting the pd_sck to 0
         ready_counter = 0
         while (not self._ready() and ready_counter <= 40):
             time.sleep(0.01)  # sleep for 10 ms because data is not ready
@@ -361,39 +404,29 @@ class HX711:
                     print('self._read() not ready after 40 trials\n')
                 return False
 
-        # read first 24 bits of data
-        data_in = 0  # 2's complement data from hx 711
-        for _ in range(24):
-            start_counter = time.perf_counter()
-            # request next bit from hx 711
-            GPIO.output(self._pd_sck, True)
-            GPIO.output(self._pd_sck, False)
-            end_counter = time.perf_counter()
-            if end_counter - start_counter >= 0.00006:  # check if the hx 711 did not turn off...
-                # if pd_sck pin is HIGH for 60 us and more than the HX 711 enters power down mode.
-                if self._debug_mode:
-                    print('Not enough fast while reading data')
-                    print(
-                        'Time elapsed: {}'.format(end_counter - start_counter))
-                return False
-            # Shift the bits as they come to data_in variable.
-            # Left shift by one bit then bitwise OR with the new bit.
-            data_in = (data_in << 1) | GPIO.input(self._dout)
+        # read first 24 bits of data, 2's complement data from hx 711.
+        # If pd_sck pin is HIGH for 60 us and more than the HX 711 enters
+        # power down mode, read_bits gives None after such a pulse.
+        data_in = self._backend.read_bits(24, 0.00006)
+        if data_in is None:
+            if self._debug_mode:
+                print('Not enough fast while reading data')
+            return False
 
         if self._wanted_channel == 'A' and self._gain_channel_A == 128:
-            if not self._set_channel_gain(1):  # send only one bit which is 1
+            if not self._set_channel_gain(backends.GAIN_PULSES[('A', 128)]):  # send only one bit which is 1
                 return False  # return False because channel was not set properly
             else:
                 self._current_channel = 'A'  # else set current channel variable
                 self._gain_channel_A = 128  # and gain
         elif self._wanted_channel == 'A' and self._gain_channel_A == 64:
-            if not self._set_channel_gain(3):  # send three ones
+            if not self._set_channel_gain(backends.GAIN_PULSES[('A', 64)]):  # send three ones
                 return False  # return False because channel was not set properly
             else:
                 self._current_channel = 'A'  # else set current channel variable
                 self._gain_channel_A = 64
         else:
-            if not self._set_channel_gain(2):  # send two ones
+            if not self._set_channel_gain(backends.GAIN_PULSES[('B', 32)]):  # send two ones
                 return False  # return False because channel was not set properly
             else:
                 self._current_channel = 'B'  # else set current channel variable
@@ -411,13 +444,7 @@ class HX711:
             return False  # rturn false because the data is invalid
 
         # calculate int from 2's complement
-        signed_data = 0
-        # 0b1000 0000 0000 0000 0000 0000 check if the sign bit is 1. Negative number.
-        if (data_in & 0x800000):
-            signed_data = -(
-                (data_in ^ 0xffffff) + 1)  # convert from 2's complement to int
-        else:  # else do not do anything the value is positive number
-            signed_data = data_in
+        signed_data = backends.to_signed(data_in)
 
         if self._debug_mode:
             print('Converted 2\'s complement value: {}\n'.format(signed_data))
@@ -447,8 +474,8 @@ class HX711:
             if self._debug_mode:
                 print('data_list: {}'.format(data_list))
                 print('filtered_data list: {}'.format(filtered_data))
-                print('data_mean:', stat.mean(filtered_data))
-            data_mean = stat.mean(filtered_data)
+                print('data_mean:', filters.mean(filtered_data))
+            data_mean = filters.mean(filtered_data)
         else:
             data_mean = stat.mean(data_list)
         self._save_last_raw_data(backup_channel, backup_gain, data_mean)
@@ -501,6 +528,36 @@ class HX711:
         else:
             return False
 
+    def get_weight_settled(self, noise=None, drift=None, window=6, max_readings=99, timeout=None):
+        """
+        get_weight_settled returns the weight once the last window readings
+        are steady (filters.settle), or the best it had when max_readings
+        or timeout ran out.  For a steady load it needs window readings
+        where get_weight_mean always takes 30.
+
+        Args:
+            noise(float): Optional, allowed standard deviation in weight units,
+                by default 100 raw units.
+            drift(float): Optional, allowed drift in weight units across
+                the window, noise by default.
+            window(int): Optional, readings that have to be steady.
+            max_readings(int): Optional, readings before giving up.
+            timeout(float): Optional, seconds before giving up.
+
+        Returns: filters.Settled with value, deviation and drift in weight
+            units; value is False if no reading was ok.
+        """
+        ratio = abs(self.get_current_scale_ratio())
+        raw_noise = 100 if noise is None else noise * ratio
+        raw_drift = None if drift is None else drift * ratio
+        result = self._read_settled(raw_noise, raw_drift, window, max_readings, timeout)
+        if result.value is None:
+            return result._replace(value=False)
+        return result._replace(
+            value=float((result.value - self.get_current_offset()) / self.get_current_scale_ratio()),
+            deviation=result.deviation / ratio,
+            drift=result.drift / self.get_current_scale_ratio())
+
     def get_current_channel(self):
         """
         get current channel returns the value of current channel.
@@ -631,15 +688,15 @@ class HX711:
         """
         power down method turns off the hx711.
         """
-        GPIO.output(self._pd_sck, False)
-        GPIO.output(self._pd_sck, True)
+        self._backend.set_clock(False)
+        self._backend.set_clock(True)
         time.sleep(0.01)
 
     def power_up(self):
         """
         power up function turns on the hx711.
         """
-        GPIO.output(self._pd_sck, False)
+        self._backend.set_clock(False)
         time.sleep(0.01)
 
     def reset(self):
@@ -667,30 +724,7 @@ def outliers_filter(data_list):
     
     Returns: list of filtered data. Excluding outliers.
     """
-    data = []
-    for num in data_list:
-        if num:
-            data.append(num)
     # set 'm' to lower value to remove more outliers
     # set 'm' to higher value to keep more data samples (also some outliers)
-    m = 2.0
-    # It calculates the absolute distance to the median.
-    # Then it scales the distances by their median value (again)
-    # so they are on a relative scale to 'm'.
-    data_median = stat.median(data)
-    abs_distance = []
-    for num in data:
-        abs_distance.append(abs(num - data_median))
-    mdev = stat.median(abs_distance)
-    s = []
-    if mdev:
-        for num in abs_distance:
-            s.append(num / mdev)
-    else:
-        # mdev is 0. Therefore all data samples in the list data have the same value.
-        return data
-    filtered_data = []
-    for i in range(len(data)):
-        if s[i] < m:
-            filtered_data.append(data[i])
-    return filtered_data
+    # filters.py does it with NumPy when it is installed and worth it.
+    return filters.outliers_filter(data_list, m=2.0)
@@ -7,22 +7,28 @@ EMULATE_HX711=False
 
 referenceUnit = -28403
 
+import backends
+from hx711 import HX711
+
 if not EMULATE_HX711:
     import RPi.GPIO as GPIO
-    from hx711 import HX711
-else:
-    from emulated_hx711 import HX711
 
 def cleanAndExit():
     print("Cleaning...")
 
+    hx.stop_sampling()
+
     if not EMULATE_HX711:
         GPIO.cleanup()
         
     print("Bye!")
     sys.exit()
 
-hx = HX711(5, 6)
+if not EMULATE_HX711:
+    hx = HX711(5, 6)
+else:
+    # an HX711 in software, about 2 kg on the cell at this reference unit
+    hx = HX711(5, 6, backend=backends.EmulatedBackend(value=2 * referenceUnit * 1000, noise=50))
 
 # I've found out that, for some reason, the order of the bytes is not always the same between versions of python, numpy and the hx711 itself.
 # Still need to figure out why does it change.
@@ -43,6 +49,13 @@ hx.set_reference_unit(referenceUnit)
 
 hx.reset()
 
+# Sample continuously on a background thread instead of power cycling the
+# chip for every reading; get_weight() then returns the latest filtered
+# value at once and tare() averages fresh conversions from the ring buffer.
+# The estimate is the median of the last 15 conversions, smoothed, with
+# conversions more than 4 standard deviations off rejected as spikes.
+hx.start_sampling(filter_size=15, smoothing=0.3, spike=4.0)
+
 hx.tare()
 
 print("Tare done! Add weight now...")
@@ -62,7 +75,9 @@ while True:
         # print (binary_string + " " + np_arr8_string)
         
         # Prints the weight. Comment if you're debbuging the MSB and LSB issue.
-        val = hx.get_weight(1)
+        # Wait for a few new conversions so every line shows fresh data.
+        hx.wait_samples(8)
+        val = hx.get_weight()
         print(round(val,2))
 
         # To get weight from both channels (if you have load cells hooked up 
@@ -71,9 +86,5 @@ while True:
         #val_B = hx.get_weight_B(5)
         #print "A: %s  B: %s" % ( val_A, val_B )
 
-        hx.power_down()
-        hx.power_up()
-        time.sleep(1)
-
     except (KeyboardInterrupt, SystemExit):
         cleanAndExit()
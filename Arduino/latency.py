@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Round-trip latency histograms for firmware commands.
+
+comm.Arduino stamps every outgoing command with time.monotonic() and the
+matching DONE (or 'Ready to Go' for Y), and records the difference in a
+histogram per opcode (A12, A13, K, P, I14, L5 ...).  The histograms are
+HDR-style: exact below 128 us, then 64 log-linear sub-buckets per power of
+two, so every value is kept to within ~1.5 % in a few hundred counters.
+
+dump(filename) saves the raw counters next to the summary and load()
+merges them back, so the means() the duration estimate uses
+(Protocols/estimate.py) keep learning across sessions.
+'''
+
+import collections
+import json
+import os
+import threading
+import time
+
+SUBBITS = 7
+SUBCOUNT = 1 << SUBBITS          # 128
+HALFCOUNT = SUBCOUNT >> 1        # 64
+
+# commands the firmware answers with DONE, the rest are fire-and-forget
+ACKED = ('A', 'K', 'I', 'P', 'J', 'S', 'G', 'R')
+ACKEDMARKS = ('L1', 'L5')
+
+def opcodeOf(command):
+   command = command.strip()
+   if(command[:1] in ('A', 'I') and command[1:3].isdigit()):
+      return command[:3]
+   if(command[:1] == 'L'):
+      return command[:2]
+   return command[:1]
+
+def acked(opcode):
+   return opcode[:1] in ACKED or opcode in ACKEDMARKS
+
+class LatencyHistogram():
+   def __init__(self):
+     self.counts = collections.Counter()
+     self.count = 0
+     self.total = 0
+     self.min = None
+     self.max = None
+
+   @staticmethod
+   def index(value):
+     if(value < SUBCOUNT):
+        return value
+     exponent = value.bit_length() - SUBBITS
+     return SUBCOUNT + (exponent - 1) * HALFCOUNT + ((value >> exponent) - HALFCOUNT)
+
+   @staticmethod
+   def lowest(index):
+     if(index < SUBCOUNT):
+        return index
+     exponent = (index - SUBCOUNT) // HALFCOUNT + 1
+     sub = (index - SUBCOUNT) % HALFCOUNT + HALFCOUNT
+     return sub << exponent
+
+   def record(self, seconds):
+     value = max(0, int(seconds * 1e6))   # microseconds
+     self.counts[self.index(value)] += 1
+     self.count += 1
+     self.total += value
+     self.min = value if self.min is None else min(self.min, value)
+     self.max = value if self.max is None else max(self.max, value)
+
+   def percentile(self, p):
+     '''Value in microseconds below which p percent of the samples fall.'''
+     if(self.count == 0):
+        return 0
+     rank = max(1, int(round(p / 100.0 * self.count)))
+     seen = 0
+     for index in sorted(self.counts):
+       seen += self.counts[index]
+       if(seen >= rank):
+          if(index < SUBCOUNT):
+             return index
+          return min(self.max, self.lowest(index + 1) - 1)
+     return self.max
+
+   def merge(self, other):
+     self.counts.update(other.counts)
+     self.count += other.count
+     self.total += other.total
+     for value in (other.min, other.max):
+       if(value is not None):
+          self.min = value if self.min is None else min(self.min, value)
+          self.max = value if self.max is None else max(self.max, value)
+
+   def state(self):
+     '''Raw counters for saving, see fromState().'''
+     return {'counts': {str(index): count for index, count in self.counts.items()},
+             'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max}
+
+   @classmethod
+   def fromState(cls, state):
+     histogram = cls()
+     histogram.counts.update({int(index): count for index, count in state['counts'].items()})
+     histogram.count = state['count']
+     histogram.total = state['total']
+     histogram.min = state['min']
+     histogram.max = state['max']
+     return histogram
+
+   def report(self):
+     '''Summary in milliseconds.'''
+     if(self.count == 0):
+        return {'count': 0}
+     ms = lambda us: round(us / 1000.0, 3)
+     return {'count': self.count, 'min': ms(self.min), 'mean': ms(self.total / self.count),
+             'p50': ms(self.percentile(50)), 'p90': ms(self.percentile(90)),
+             'p99': ms(self.percentile(99)), 'max': ms(self.max),
+             'total': ms(self.total)}
+
+class LatencyRecorder():
+   def __init__(self):
+     self.lock = threading.Lock()
+     self.histograms = collections.defaultdict(LatencyHistogram)
+     self.pending = []           # [(seq, opcode, sentAt)] waiting for DONE
+     self.reset = None           # sentAt of the last Y, waiting for Ready to Go
+     self.unmatched = 0
+
+   def sent(self, command, seq=None, now=None):
+     now = time.monotonic() if now is None else now
+     opcode = opcodeOf(command)
+     with self.lock:
+       if(opcode == 'X'):
+          self.pending = []
+       elif(opcode == 'Y'):
+          self.pending = []
+          self.reset = now
+       elif(acked(opcode)):
+          self.pending.append((seq, opcode, now))
+
+   def done(self, seq=None, now=None):
+     now = time.monotonic() if now is None else now
+     with self.lock:
+       match = None
+       for i, entry in enumerate(self.pending):
+         if(seq is None or entry[0] == seq):
+            match = self.pending.pop(i)
+            break
+       if(match is None):
+          self.unmatched += 1
+          return None
+       self.histograms[match[1]].record(now - match[2])
+       return match[1], now - match[2]
+
+   def ready(self, now=None):
+     now = time.monotonic() if now is None else now
+     with self.lock:
+       if(self.reset is None):
+          return None
+       self.histograms['Y'].record(now - self.reset)
+       self.reset = None
+       return 'Y', now
+
+   def report(self):
+     with self.lock:
+       return {opcode: self.histograms[opcode].report() for opcode in sorted(self.histograms)}
+
+   def means(self):
+     '''Mean round trip in seconds per opcode that has samples.'''
+     with self.lock:
+       return {opcode: histogram.total / histogram.count / 1e6
+               for opcode, histogram in self.histograms.items() if histogram.count}
+
+   def load(self, filename):
+     '''Merge the histograms of an earlier dump(filename), False if there is none.'''
+     if(not os.path.exists(filename)):
+        return False
+     with open(filename) as f:
+       saved = json.load(f)
+     with self.lock:
+       for opcode, state in saved.get('histograms', {}).items():
+         self.histograms[opcode].merge(LatencyHistogram.fromState(state))
+     return True
+
+   def dump(self, filename=None):
+     '''Print a table per opcode, sorted by total time, and optionally save JSON.'''
+     report = self.report()
+     lines = ['{:6} {:>6} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10}'.format(
+              'opcode', 'count', 'min ms', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'total s')]
+     for opcode, r in sorted(report.items(), key=lambda item: -item[1].get('total', 0)):
+       lines.append('{:6} {:>6} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10.2f}'.format(
+                    opcode, r['count'], r['min'], r['p50'], r['p90'], r['p99'], r['max'], r['total'] / 1000.0))
+     if(self.unmatched):
+        lines.append('unmatched DONE: {}'.format(self.unmatched))
+     text = '\n'.join(lines)
+     print(text)
+
+     if(filename is not None):
+        with self.lock:
+          histograms = {opcode: histogram.state() for opcode, histogram in self.histograms.items()}
+        with open(filename, 'w') as f:
+          json.dump({'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'opcodes': report,
+                     'unmatched': self.unmatched, 'histograms': histograms}, f, indent=1)
+     return text
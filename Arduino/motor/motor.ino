@@ -46,6 +46,51 @@ int forward = 1;
 bool aRunning = false;
 bool noStatus = false;
 
+// Features listed in the reply to H; the Pi only uses what is listed
+// (Arduino/baud.py)
+#define CAPABILITIES "CAPS|baud|bin|seq|speed|profile"
+
+// Baud negotiation: N{rate} switches Serial1, NT{hex} echoes with a CRC,
+// NC commits; without NC the old rate is back after BAUDREVERT ms
+#define BASEBAUD 115200
+#define BAUDREVERT 1000
+unsigned long serialBaud = BASEBAUD;
+unsigned long previousBaud = 0;   // rate to fall back to, 0 once committed
+unsigned long baudSwitched = 0;
+
+// Sequence ids (Arduino/commands.py): a command sent as {cmd}@{seq}, or as
+// a frame with SEQFLAG, is answered DONE|{seq}; -1 for an untagged one
+int receivedSeq = -1;   // of the command being handled
+int runningSeq = -1;    // of the move in progress, for the DONE at its end
+
+// Speed mode for the Pi's pressure controller (Protocols/controller.py):
+// V{speed} runs A at speed (-3200..3200) and streams PR| every
+// VELOCITYSTATUS ms; A stops when no V came for VELOCITYTIMEOUT ms
+#define VELOCITYTIMEOUT 1500
+#define VELOCITYSTATUS 50
+bool velocityMode = false;
+unsigned long lastVelocity = 0;
+unsigned long lastPressureSent = 0;
+
+// Streamed profiles (Protocols/streaming.py): Q{i}:{cmd}:{ms} queues a
+// segment, QG starts, QZ says no more come.  A segment's command runs as if
+// the Pi sent it, with QS|{i} at its start, QR|{i} instead of its DONE and
+// QE|{i} after the hold; QF|{count} follows the last one
+#define PROFILEWINDOW 16
+#define PROFILESEQ -2     // receivedSeq of a segment's command
+int profileIndex[PROFILEWINDOW];
+String profileMove[PROFILEWINDOW];
+unsigned long profileHold[PROFILEWINDOW];
+int profileHead = 0;      // oldest queued segment
+int profileCount = 0;
+bool profileRunning = false;
+bool profileEnd = false;
+int profileDone = 0;
+int segment = -1;         // index of the running segment, -1 between them
+unsigned long segmentHold = 0;
+bool segmentMoving = false;
+unsigned long holdStart = 0;
+
 #define pressureSpeed 500
 #define BCSpeed 1600/2
 #define CSpeed 800
@@ -123,7 +168,7 @@ void setup() {
 
   delay(1000);
 
-  Serial1.begin(115200);
+  Serial1.begin(serialBaud);
 
 
   // stop limit switch
@@ -242,6 +287,16 @@ void exitSafeStart()
 /***************** setMotorSpeed ***************/
 
 void setMotorSpeed(int16_t speed)
+{
+  if (speed > 0)
+    speed = 3200;
+  if (speed < 0)
+    speed = -3200;
+  driveMotor(speed);
+}
+
+// Proportional speed, -3200..3200
+void driveMotor(int16_t speed)
 {
 
   if (noA && smcDeviceNumber == 12)
@@ -251,10 +306,7 @@ void setMotorSpeed(int16_t speed)
   if (noC && smcDeviceNumber == 14)
     return;
 
-  if (speed > 0)
-    speed = 3200;
-  if (speed < 0)
-    speed = -3200;
+  speed = constrain(speed, -3200, 3200);
   /*
     Serial.print("set motor speed on ");
     Serial.print(smcDeviceNumber);
@@ -339,6 +391,60 @@ uint16_t readSpeed()
   return speed;
 }
 
+/**************** settled weight ****************/
+
+// Weigh until the last SETTLEWINDOW readings are steady (standard deviation
+// and drift between the older and newer half within SETTLENOISE lbs)
+// instead of always averaging 10; gives up after SETTLEMAX readings.
+#define SETTLEWINDOW 4
+#define SETTLEMAX 15
+#define SETTLENOISE 0.05
+
+float settledUnits(float &confidence) {
+  float window[SETTLEWINDOW];
+  float mean = 0.0;
+  float deviation = 0.0;
+  float drift = 0.0;
+  int count = 0;
+
+  while (count < SETTLEMAX) {
+    window[count % SETTLEWINDOW] = scale.get_units(1);
+    count++;
+    if (count < SETTLEWINDOW)
+      continue;
+
+    float older = 0.0;
+    float newer = 0.0;
+    mean = 0.0;
+    for (int i = 0; i < SETTLEWINDOW; i++) {
+      float reading = window[(count + i) % SETTLEWINDOW];   // oldest first
+      mean += reading;
+      if (i < SETTLEWINDOW / 2)
+        older += reading;
+      else
+        newer += reading;
+    }
+    mean /= SETTLEWINDOW;
+    drift = (newer - older) / (SETTLEWINDOW / 2);
+
+    deviation = 0.0;
+    for (int i = 0; i < SETTLEWINDOW; i++)
+      deviation += (window[i] - mean) * (window[i] - mean);
+    deviation = sqrt(deviation / SETTLEWINDOW);
+
+    if (deviation <= SETTLENOISE && fabs(drift) <= SETTLENOISE)
+      break;
+  }
+  if (count < SETTLEWINDOW) {
+    mean = window[0];
+  }
+
+  // near 1 for a steady load, 0.5 when the uncertainty equals SETTLENOISE
+  float noise2 = SETTLENOISE * SETTLENOISE;
+  confidence = noise2 / (noise2 + deviation * deviation / SETTLEWINDOW + drift * drift);
+  return mean;
+}
+
 /**************** find limits ****************/
 
 int moveToLimit(int Direction) {
@@ -384,6 +490,311 @@ String getValue(String data, char separator, int index)
 
 
 
+/****************** crc16 ***********************/
+// CRC16-CCITT, init 0xFFFF (binascii.crc_hqx on the Pi)
+uint16_t crc16(const uint8_t *data, size_t length, uint16_t crc)
+{
+  for (size_t i = 0; i < length; i++)
+  {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int bit = 0; bit < 8; bit++)
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+  }
+  return crc;
+}
+
+/****************** binary framing ***********************/
+// Z1 switches Serial1 to the frames of Arduino/framing.py until reset:
+//   SYNC LEN TYPE PAYLOAD[LEN] CRC16 (little-endian, CRC over LEN TYPE PAYLOAD)
+#define SYNC 0xA5
+#define SEQFLAG 0x40
+#define MAXPAYLOAD 255
+
+// Pi -> Arduino
+#define CMD_TEXT 0x01
+#define CMD_MOVE_A 0x10    // actuator uint8, inches float
+#define CMD_MOVE_K 0x11    // position int32
+#define CMD_MOVE_I 0x12    // actuator uint8, position int32
+#define CMD_PRESSURE 0x13  // lbs float
+#define CMD_STOP 0x14
+#define CMD_STATUS 0x15
+#define CMD_RESET 0x16
+
+// Arduino -> Pi
+#define MSG_TEXT 0x81
+#define MSG_DONE 0x82
+#define MSG_STATUS 0x84    // positionA, positionB, steps int32, pressure float
+#define MSG_ASTATUS 0x85
+#define MSG_PRESSURE 0x87  // lbs float
+#define MSG_WEIGHT 0x88    // lbs, confidence float
+
+bool framing = false;
+uint8_t rxFrame[3 + MAXPAYLOAD + 2];
+int rxLength = 0;
+
+void pack32(uint8_t *p, uint32_t value)
+{
+  p[0] = value;
+  p[1] = value >> 8;
+  p[2] = value >> 16;
+  p[3] = value >> 24;
+}
+
+void packFloat(uint8_t *p, float value)
+{
+  uint32_t bits;
+  memcpy(&bits, &value, 4);
+  pack32(p, bits);
+}
+
+uint32_t unpack32(const uint8_t *p)
+{
+  return (uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+float unpackFloat(const uint8_t *p)
+{
+  uint32_t bits = unpack32(p);
+  float value;
+  memcpy(&value, &bits, 4);
+  return value;
+}
+
+void sendFrame(uint8_t type, const uint8_t *payload, uint8_t length)
+{
+  uint8_t header[3] = {SYNC, length, type};
+  uint16_t crc = crc16(header + 1, 2, 0xFFFF);
+  crc = crc16(payload, length, crc);
+  Serial1.write(header, 3);
+  if (length > 0)
+    Serial1.write(payload, length);
+  Serial1.write((uint8_t)(crc & 0xFF));
+  Serial1.write((uint8_t)(crc >> 8));
+}
+
+/****************** Serial1 output ***********************/
+// One message per call, a text line or with framing on a frame
+
+void sendLine(const String &line)
+{
+  if (!framing)
+  {
+    Serial1.println(line);
+    return;
+  }
+  sendFrame(MSG_TEXT, (const uint8_t *)line.c_str(), min(line.length(), (unsigned int)MAXPAYLOAD));
+}
+
+void sendDone(int seq)
+{
+  if (seq == PROFILESEQ)
+  {
+    segmentReached();
+    return;
+  }
+  if (!framing)
+  {
+    if (seq < 0)
+      Serial1.println("DONE");
+    else
+      Serial1.println("DONE|" + String(seq));
+    return;
+  }
+  if (seq < 0)
+  {
+    sendFrame(MSG_DONE, NULL, 0);
+    return;
+  }
+  uint8_t payload[1] = {(uint8_t)seq};
+  sendFrame(MSG_DONE | SEQFLAG, payload, 1);
+}
+
+// S| or A| status
+void sendPositions(char tag, long positionA, long positionB, long positionC, float pressure)
+{
+  if (!framing)
+  {
+    sendLine(String(tag) + "|" + String(positionA) + "|" + String(positionB) + "|" + String(positionC) + "|" + String(pressure));
+    return;
+  }
+  uint8_t payload[16];
+  pack32(payload, positionA);
+  pack32(payload + 4, positionB);
+  pack32(payload + 8, positionC);
+  packFloat(payload + 12, pressure);
+  sendFrame(tag == 'S' ? MSG_STATUS : MSG_ASTATUS, payload, sizeof(payload));
+}
+
+void sendPressure(float lbs)
+{
+  if (!framing)
+  {
+    sendLine("PR|" + String(lbs));
+    return;
+  }
+  uint8_t payload[4];
+  packFloat(payload, lbs);
+  sendFrame(MSG_PRESSURE, payload, sizeof(payload));
+}
+
+void sendWeight(float lbs, float confidence)
+{
+  if (!framing)
+  {
+    sendLine("weight|" + String(lbs) + "|" + String(confidence));
+    return;
+  }
+  uint8_t payload[8];
+  packFloat(payload, lbs);
+  packFloat(payload + 4, confidence);
+  sendFrame(MSG_WEIGHT, payload, sizeof(payload));
+}
+
+/****************** streamed profiles ***********************/
+
+void clearProfile()
+{
+  profileHead = 0;
+  profileCount = 0;
+  profileRunning = false;
+  profileEnd = false;
+  profileDone = 0;
+  segment = -1;
+  segmentMoving = false;
+}
+
+// Q{i}:{cmd}:{ms}, QG or QZ
+void profileCommand(const String &command)
+{
+  if (command == "QG")
+    profileRunning = true;
+  else if (command == "QZ")
+    profileEnd = true;
+  else if (profileCount < PROFILEWINDOW)
+  {
+    int first = command.indexOf(':');
+    int second = command.indexOf(':', first + 1);
+    int slot = (profileHead + profileCount) % PROFILEWINDOW;
+    profileIndex[slot] = command.substring(1, first).toInt();
+    profileMove[slot] = command.substring(first + 1, second);
+    profileHold[slot] = command.substring(second + 1).toInt();
+    profileCount++;
+  }
+}
+
+// The running segment's move arrived, its hold starts
+void segmentReached()
+{
+  segmentMoving = false;
+  holdStart = millis();
+  sendLine("QR|" + String(segment));
+}
+
+// The command of the next segment once the running one is over, "" while
+// it moves or holds and for a hold-only segment
+String nextSegment()
+{
+  if (segment >= 0)
+  {
+    if (segmentMoving || (millis() - holdStart) < segmentHold)
+      return "";
+    sendLine("QE|" + String(segment));
+    segment = -1;
+    profileDone++;
+  }
+  if (profileCount == 0)
+  {
+    if (profileEnd)
+    {
+      sendLine("QF|" + String(profileDone));
+      clearProfile();
+    }
+    return "";
+  }
+  segment = profileIndex[profileHead];
+  segmentHold = profileHold[profileHead];
+  String move = profileMove[profileHead];
+  profileHead = (profileHead + 1) % PROFILEWINDOW;
+  profileCount--;
+  segmentMoving = true;
+  sendLine("QS|" + String(segment));
+  if (move.length() == 0)
+    segmentReached();
+  return move;
+}
+
+/****************** Serial1 input ***********************/
+
+// The text command a frame stands for (decodeCommand in framing.py), a
+// sequence id comes along as the {cmd}@{seq} of a text command
+String decodeCommand(uint8_t type, const uint8_t *payload, uint8_t length)
+{
+  String seq = "";
+  if ((type & SEQFLAG) && length > 0)
+  {
+    seq = "@" + String(payload[0]);
+    type &= ~SEQFLAG;
+    payload++;
+    length--;
+  }
+  switch (type)
+  {
+    case CMD_STOP:
+      return "X" + seq;
+    case CMD_STATUS:
+      return "S" + seq;
+    case CMD_RESET:
+      return "Y" + seq;
+    case CMD_MOVE_A:
+      return "A" + String(payload[0]) + String(unpackFloat(payload + 1), 3) + seq;
+    case CMD_MOVE_I:
+      return "I" + String(payload[0]) + String((long)unpack32(payload + 1)) + seq;
+    case CMD_MOVE_K:
+      return "K" + String((long)unpack32(payload)) + seq;
+    case CMD_PRESSURE:
+      return "P" + String(unpackFloat(payload), 2) + seq;
+  }
+  String text = "";
+  for (int i = 0; i < length; i++)
+    text += (char)payload[i];
+  return text + seq;
+}
+
+// Next framed command into c; false until a whole frame with a good CRC is in.
+// A bad frame is dropped up to the next SYNC in it.
+bool readFrame(String &c)
+{
+  while (true)
+  {
+    if (rxLength >= 3 && rxLength >= rxFrame[1] + 5)
+    {
+      int total = rxFrame[1] + 5;
+      uint16_t crc = rxFrame[total - 2] | (rxFrame[total - 1] << 8);
+      int next = total;
+      bool ok = crc == crc16(rxFrame + 1, total - 3, 0xFFFF);
+      if (ok)
+        c = decodeCommand(rxFrame[2], rxFrame + 3, rxFrame[1]);
+      else
+      {
+        next = 1;
+        while (next < total && rxFrame[next] != SYNC)
+          next++;
+      }
+      rxLength -= next;
+      memmove(rxFrame, rxFrame + next, rxLength);
+      if (ok)
+        return true;
+      continue;
+    }
+    if (!Serial1.available())
+      return false;
+    uint8_t b = Serial1.read();
+    if (rxLength == 0 && b != SYNC)
+      continue;
+    rxFrame[rxLength++] = b;
+  }
+}
+
 /************************* sendStatus() ************/
 void sendStatus()
 {
@@ -420,17 +831,7 @@ void sendStatus()
   Serial.print(F(" pressure: "));
   Serial.println(pressure);
 
-  Serial1.print("S|");
-  Serial1.print(positionA);
-
-  Serial1.print("|");
-  Serial1.print(positionB);
-
-  Serial1.print("|");
-  Serial1.print(positionC);
-
-  Serial1.print("|");
-  Serial1.println(pressure);
+  sendPositions('S', positionA, positionB, positionC, pressure);
 
   smcDeviceNumber = lastSmcDeviceNumber;
 
@@ -452,6 +853,7 @@ void loop() {
 
   static float lastStep = -1;
   String c;
+  bool fromProfile = false;
   int lastStatus = -1;
   bool ok;
   static unsigned long loopPosition = millis() - LOOPPOSITION_DELAY;  //initial start time
@@ -488,6 +890,31 @@ void loop() {
 
   STOP = digitalRead(stopPin);   // read the limit pin
 
+  if (previousBaud != 0 && (millis() - baudSwitched) > BAUDREVERT)
+  {
+    // switched but never committed, the Pi went back to the old rate
+    serialBaud = previousBaud;
+    previousBaud = 0;
+    Serial1.begin(serialBaud);
+  }
+
+  if (velocityMode)
+  {
+    if ((millis() - lastVelocity) > VELOCITYTIMEOUT)
+    {
+      // the Pi stopped regulating
+      smcDeviceNumber = 12;
+      driveMotor(0);
+      velocityMode = false;
+    }
+    else if ((millis() - lastPressureSent) >= VELOCITYSTATUS)
+    {
+      lastPressureSent = millis();
+      pressure = abs(scale.get_units(1));
+      sendPressure(pressure);
+    }
+  }
+
   if ((millis() - loopPosition) > LOOPPOSITION_DELAY)
   {
     ////    Serial.print(F("Loop Status: "));
@@ -508,7 +935,7 @@ void loop() {
       jerksCompleted = 0;
       setMotorSpeed(0);  // full-speed stop
       //      Serial.println("jerking done");
-      Serial1.println("DONE");
+      sendDone(runningSeq);
       noStatus = false;
       sendStatus();
     }
@@ -537,7 +964,7 @@ void loop() {
         {
           jerking = false;
           Serial.println("jerking done");
-          Serial1.println("DONE");
+          sendDone(runningSeq);
         }
       }
     }
@@ -665,7 +1092,7 @@ void loop() {
       position = readPosition();
       sendStatus();
       Serial.println(position);
-      Serial1.println("DONE");
+      sendDone(runningSeq);
 
       if (smcDeviceNumber == 12)
       {
@@ -683,17 +1110,7 @@ void loop() {
 
         pressure = abs(scale.get_units(10));
 
-        Serial1.print("A|");
-        Serial1.print(positionA);
-
-        Serial1.print("|");
-        Serial1.print(positionB);
-
-        Serial1.print("|");
-        Serial1.print(positionC);
-
-        Serial1.print("|");
-        Serial1.println(pressure);
+        sendPositions('A', positionA, positionB, positionC, pressure);
       }
     }
   }
@@ -744,7 +1161,7 @@ void loop() {
     {
       pressure = abs(scale.get_units(5));
       sendStatus();
-      Serial1.println("DONE");
+      sendDone(runningSeq);
       noStatus = false;
 
       if (smcDeviceNumber == 120)
@@ -763,24 +1180,22 @@ void loop() {
 
         pressure = abs(scale.get_units(10));
 
-        Serial1.print("A|");
-        Serial1.print(positionA);
-
-        Serial1.print("|");
-        Serial1.print(positionB);
-
-        Serial1.print("|");
-        Serial1.print(positionC);
-
-        Serial1.print("|");
-        Serial1.println(pressure);
+        sendPositions('A', positionA, positionB, positionC, pressure);
       }
       //      measurePressure = true;
     }
   }
 
 
-  if (Serial1.available())
+  if (framing)
+  {
+    if (readFrame(c))
+    {
+      Serial.print("c ");
+      Serial.println(c);
+    }
+  }
+  else if (Serial1.available())
   {
     c = Serial1.readStringUntil('\n');
     Serial1.flush();
@@ -788,6 +1203,12 @@ void loop() {
     Serial.println(c);
   }
 
+  if (c.length() == 0 && index == 0 && profileRunning && !bRunning && !measurePressure)
+  {
+    c = nextSegment();
+    fromProfile = c.length() > 0;
+  }
+
 
   if (index == (int)'S') {
     //      int16_t speed = readSpeed();
@@ -796,7 +1217,7 @@ void loop() {
 
       sendStatus();
 
-      Serial1.println("DONE");
+      sendDone(receivedSeq);
 
       lastStatus = status;
       status = 1;   // shows waiting (done)
@@ -808,7 +1229,16 @@ void loop() {
   else
   {
     command = c;
-    index = (int)c[0];
+    receivedSeq = -1;
+    int at = command.lastIndexOf('@');
+    if (at > 0)
+    {
+      receivedSeq = command.substring(at + 1).toInt();
+      command = command.substring(0, at);
+    }
+    if (fromProfile)
+      receivedSeq = PROFILESEQ;
+    index = (int)command[0];
   }
 
 
@@ -857,6 +1287,7 @@ void loop() {
         forward = -1;
       }
       bRunning = true;
+      runningSeq = receivedSeq;
 
 
     }
@@ -941,6 +1372,8 @@ void loop() {
     Serial.println(position);
 
     bRunning = true;
+
+    runningSeq = receivedSeq;
     status = 1;   // shows moving
     command = "i";
     index = 0;
@@ -982,6 +1415,8 @@ void loop() {
     //    delay(500);
 
     measurePressure = true;
+
+    runningSeq = receivedSeq;
   }
 
   if (index == (int)'Y') {
@@ -992,10 +1427,10 @@ void loop() {
     index = 0;
     status = 0;
 
-    Serial1.println("Reset|");
+    sendLine("Reset|");
 
     resetFunc();
-    Serial1.println("DONE");
+    sendDone(receivedSeq);
 
   }
 
@@ -1020,6 +1455,8 @@ void loop() {
     measurePressure = false;
     bRunning = false;
     jerking = false;
+    velocityMode = false;
+    clearProfile();
 
     //    STOP = true;
 
@@ -1028,6 +1465,25 @@ void loop() {
 
   }
 
+  if (index == (int)'Q') {
+    profileCommand(command);
+
+    command = "q";
+    index = 0;
+  }
+
+  if (index == (int)'V') {
+    int16_t speed = command.substring(1).toInt();
+
+    command = "v";
+    index = 0;
+
+    smcDeviceNumber = 12;
+    driveMotor(speed);
+    velocityMode = true;
+    lastVelocity = millis();
+  }
+
   if (index == (int)'G') {
     String parameter = command.substring(1, 3);
     smcDeviceNumber = parameter.toInt();
@@ -1041,9 +1497,8 @@ void loop() {
 
     Serial.print(F("Get Position: "));
     Serial.print(position);
-    Serial1.print("P|");
-    Serial1.println(position);
-    Serial1.println("DONE");
+    sendLine("P|" + String(position));
+    sendDone(receivedSeq);
 
   }
 
@@ -1166,7 +1621,7 @@ void loop() {
       delay(1000);
     }
 
-    Serial1.println("DONE");
+    sendDone(receivedSeq);
 
   }
 
@@ -1206,6 +1661,8 @@ void loop() {
       desiredPosition = limit;
 
       bRunning = true;
+
+      runningSeq = receivedSeq;
       return;
 
       while (position < limit)
@@ -1232,6 +1689,8 @@ void loop() {
       desiredPosition = limit;
 
       bRunning = true;
+
+      runningSeq = receivedSeq;
       return;
 
       while (limit < position)
@@ -1251,12 +1710,7 @@ void loop() {
     position = readPosition();
     Serial.print("Position: ");
     Serial.print(position);
-    Serial1.print("E|");
-    Serial1.print(position);
-    Serial1.print("|");
-    Serial1.print(String(pressure, 1));
-    Serial1.print("|");
-    Serial1.println(smcDeviceNumber);
+    sendLine("E|" + String(position) + "|" + String(pressure, 1) + "|" + String(smcDeviceNumber));
 
 
   }
@@ -1308,7 +1762,7 @@ void loop() {
       digitalWrite(dirFitReverse, LOW);
     }
     timeInFIT = 0;
-    Serial1.println(F("DONE"));
+    sendDone(receivedSeq);
 
   }
 
@@ -1406,6 +1860,7 @@ void loop() {
     index = -1;
     status = 0;   // shows waiting (done)
     bRunning = true;
+    runningSeq = receivedSeq;
     lastPosition = -1;
   }
 
@@ -1447,6 +1902,8 @@ void loop() {
         desiredPosition = limit;
 
         bRunning = true;
+
+        runningSeq = receivedSeq;
         return;
 
         while (position < limit)
@@ -1473,6 +1930,8 @@ void loop() {
         desiredPosition = limit;
 
         bRunning = true;
+
+        runningSeq = receivedSeq;
         return;
 
         while (limit < position)
@@ -1497,12 +1956,7 @@ void loop() {
     position = readPosition();
     Serial.print("Position: ");
     Serial.print(position);
-    Serial1.print("E|");
-    Serial1.print(position);
-    Serial1.print("|");
-    Serial1.print(String(pressure, 1));
-    Serial1.print("|");
-    Serial1.println(smcDeviceNumber);
+    sendLine("E|" + String(position) + "|" + String(pressure, 1) + "|" + String(smcDeviceNumber));
 
 
   }
@@ -1546,6 +2000,8 @@ void loop() {
     Serial.println(position);
 
     bRunning = true;
+
+    runningSeq = receivedSeq;
     status = 1;   // shows moving
     command = "k";
     index = 0;
@@ -1627,6 +2083,7 @@ void loop() {
         forward = -1;
       }
       bRunning = true;
+      runningSeq = receivedSeq;
     }
     command = "a";
     index = -1;
@@ -1655,7 +2112,7 @@ void loop() {
 
         basePressure = scale.get_units();
         Serial.print(basePressure);
-        Serial1.println("step 0");
+        sendLine("step 0");
         position = 0;
         break;
       case 1:
@@ -1666,7 +2123,7 @@ void loop() {
         Serial.print("UNITS: ");
         Serial.println(scale.get_units(10));
 
-        Serial1.println("DONE");
+        sendDone(receivedSeq);
 
         delay(2000);
 
@@ -1680,7 +2137,7 @@ void loop() {
         Serial.print("UNITS: ");
         Serial.println(scale.get_units(10));
 
-        Serial1.println("step 2");
+        sendLine("step 2");
         break;
       case 3:
         calibration = scale.get_scale();
@@ -1689,17 +2146,20 @@ void loop() {
         scale.set_scale(calibration);
         Serial.println(scale.get_scale());
 
-        Serial1.print("step 3|");
-        Serial1.println(calibration);
+        sendLine("step 3|" + String(calibration));
 
         break;
       case 4:
-        pressure = abs(scale.get_units(10));
+        {
+          float confidence = 0.0;
+          pressure = abs(settledUnits(confidence));
 
-        Serial.println(pressure);
+          Serial.print(pressure);
+          Serial.print(" confidence ");
+          Serial.println(confidence);
 
-        Serial1.print("weight|");
-        Serial1.println(pressure);
+          sendWeight(pressure, confidence);
+        }
         break;
 
       case 5:
@@ -1713,7 +2173,7 @@ void loop() {
           Serial.print(AZERO);
           Serial.print("BZERO: ");
           Serial.println(BZERO);
-          Serial1.println("DONE");
+          sendDone(receivedSeq);
         }
         break;
 
@@ -1733,17 +2193,7 @@ void loop() {
 
           pressure = abs(scale.get_units(10));
 
-          Serial1.print("A|");
-          Serial1.print(positionA);
-
-          Serial1.print("|");
-          Serial1.print(positionB);
-
-          Serial1.print("|");
-          Serial1.print(positionC);
-
-          Serial1.print("|");
-          Serial1.println(pressure);
+          sendPositions('A', positionA, positionB, positionC, pressure);
         }
       default:
         Serial.println(stage);
@@ -1767,6 +2217,7 @@ void loop() {
       Serial.println("jerking");
       //      jerkDirection = -1;
       jerking = true;
+      runningSeq = receivedSeq;
       sendStatus();
       noStatus = true;
       inJerk = 0;
@@ -1785,7 +2236,7 @@ void loop() {
       noStatus = false;
       setMotorSpeed(0);  // stop the jerk
       inJerk = 0;
-      Serial1.println("DONE");
+      sendDone(receivedSeq);
     }
 
 
@@ -1795,4 +2246,64 @@ void loop() {
 
   }
 
+  /*************** binary framing (Arduino/framing.py) ********/
+  if (index == (int)'Z') {
+    if (command.startsWith("Z1"))
+    {
+      sendLine("BIN|1");
+      framing = true;   // until reset
+    }
+
+    command = "z";
+    index = 0;
+  }
+
+  /*************** capabilities and baud rate (Arduino/baud.py) ********/
+  if (index == (int)'H') {
+    sendLine(CAPABILITIES);
+
+    command = "h";
+    index = 0;
+  }
+
+  if (index == (int)'N') {
+    String parameter = command.substring(1);
+    parameter.trim();
+
+    if (parameter.startsWith("T"))
+    {
+      String payload = parameter.substring(1);
+      char crc[5];
+      sprintf(crc, "%04X", crc16((const uint8_t *)payload.c_str(), payload.length(), 0xFFFF));
+      sendLine("T|" + payload + "|" + crc);
+    }
+    else if (parameter == "C")
+    {
+      if (previousBaud != 0)
+      {
+        previousBaud = 0;
+        sendLine("BAUD|OK");
+      }
+    }
+    else
+    {
+      unsigned long rate = parameter.toInt();
+      if (rate == BASEBAUD || rate == 230400 || rate == 500000 || rate == 1000000)
+      {
+        sendLine("BAUD|" + String(rate));
+        Serial1.flush();   // the reply still goes out at the old rate
+        if (previousBaud == 0)
+          previousBaud = serialBaud;
+        serialBaud = rate;
+        Serial1.begin(serialBaud);
+        baudSwitched = millis();
+      }
+      else
+        sendLine("BAUD|NO");
+    }
+
+    command = "n";
+    index = 0;
+  }
+
 }
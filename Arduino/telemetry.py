@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding: utf-8
+'''
+Ring buffer of decoded status samples.
+
+comm.Arduino writes every S|, A| and PR| frame here from the reader thread
+with its time.monotonic() stamp.  The GUI and the protocol engines read
+the latest sample, the last n samples or a time window at their own rate
+instead of receiving one queued Qt signal per frame.
+
+Rows are preallocated float64: time, kind, positionA, positionB, steps,
+pressure.  A PR| frame only carries pressure, the positions are copied
+from the previous sample.
+'''
+
+import threading
+import time
+
+import numpy as np
+
+TIME = 0
+KIND = 1
+POSITIONA = 2
+POSITIONB = 3
+STEPS = 4
+PRESSURE = 5
+FIELDS = ('time', 'kind', 'positionA', 'positionB', 'steps', 'pressure')
+
+STATUS = 0      # S|
+ASTATUS = 1     # A|
+PRESSUREONLY = 2  # PR|
+
+class TelemetryRing():
+   def __init__(self, capacity=4096):
+     self.capacity = capacity
+     self.data = np.zeros((capacity, len(FIELDS)), dtype=np.float64)
+     self.count = 0          # samples written since start, never wraps
+     self.lock = threading.Lock()
+
+   def write(self, kind, positionA, positionB, steps, pressure, now=None):
+     now = time.monotonic() if now is None else now
+     with self.lock:
+       row = self.data[self.count % self.capacity]
+       row[TIME] = now
+       row[KIND] = kind
+       row[POSITIONA] = positionA
+       row[POSITIONB] = positionB
+       row[STEPS] = steps
+       row[PRESSURE] = pressure
+       self.count += 1
+
+   def writePressure(self, pressure, now=None):
+     with self.lock:
+       if(self.count > 0):
+          previous = self.data[(self.count - 1) % self.capacity]
+          positionA, positionB, steps = previous[POSITIONA], previous[POSITIONB], previous[STEPS]
+       else:
+          positionA = positionB = steps = 0
+     self.write(PRESSUREONLY, positionA, positionB, steps, pressure, now)
+
+   def latest(self):
+     '''Newest sample as a dict, None before the first frame.'''
+     with self.lock:
+       if(self.count == 0):
+          return None
+       row = self.data[(self.count - 1) % self.capacity].copy()
+       count = self.count
+     sample = dict(zip(FIELDS, row.tolist()))
+     sample['kind'] = int(sample['kind'])
+     sample['count'] = count
+     return sample
+
+   def latestStatus(self, since=0):
+     '''
+     Newest S| or A| sample written after sample number since, None if
+     there is none; PR| samples only carry over the older positions.
+     '''
+     with self.lock:
+       for count in range(self.count, max(since, self.count - self.capacity), -1):
+         row = self.data[(count - 1) % self.capacity]
+         if(row[KIND] != PRESSUREONLY):
+            sample = dict(zip(FIELDS, row.tolist()))
+            sample['kind'] = int(sample['kind'])
+            sample['count'] = count
+            return sample
+     return None
+
+   def _newest(self, n):
+     # caller holds the lock
+     n = max(0, min(n, self.count, self.capacity))
+     start = (self.count - n) % self.capacity
+     if(start + n <= self.capacity):
+        return self.data[start:start + n].copy()
+     return np.concatenate((self.data[start:], self.data[:(start + n) - self.capacity]))
+
+   def last(self, n):
+     '''Copy of the newest n samples, oldest first.'''
+     with self.lock:
+       return self._newest(n)
+
+   def since(self, count):
+     '''
+     Samples written after sample number count, oldest first, plus the new
+     count and how many were overwritten before they could be read.
+     '''
+     with self.lock:
+       total = self.count
+       lost = max(0, (total - count) - self.capacity)
+       rows = self._newest(total - count - lost)
+     return rows, total, lost
+
+   def window(self, seconds, now=None):
+     '''Samples from the last seconds, oldest first.'''
+     now = time.monotonic() if now is None else now
+     rows = self.last(self.capacity)
+     return rows[rows[:, TIME] >= now - seconds]
@@ -7,6 +7,11 @@ from datetime import datetime
 import time
 import threading
 
+from Protocols.clock import RealClock
+from Protocols.completion import Completion
+from Protocols.definitions import compileProtocol
+from Protocols.interpreter import runSteps, wake
+
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import QObject, QThread, pyqtSignal, QTimer
@@ -99,7 +104,8 @@ class Protocols(QtCore.QRunnable):
    cycles = 0
 
    protocolList = ['S', 'AB1', 'AB2', 'AB3', 'AB4', 'AB0']
-   def __init__(self, _BFactor, protocol, pressure, minusDegrees, plusDegrees, cycles, ser, parent=None):
+   def __init__(self, _BFactor, protocol, pressure, minusDegrees, plusDegrees, cycles, ser, parent=None, clock=None,
+                pressureControl=None, streaming=False):
 #     QThread.__init__(self, parent)
      super(Protocols, self).__init__()
 
@@ -114,6 +120,13 @@ class Protocols(QtCore.QRunnable):
      self.degreeList = {0:5, 5:4, 10:3, 15:2, 20:1, 25:0, 30:0}
 
      self.I2Cstatus = 0
+     self.completion = Completion()
+     self.clock = RealClock() if clock is None else clock   # SimulatedClock to fast-forward
+     self.streaming = streaming     # moves and holds run from a firmware profile, see streaming.py
+     self.pressureControl = pressureControl   # controller.PressureController runs the P steps
+     self.steps = []          # compiled schedule, see Protocols/definitions.py
+     self.stepIndex = 0
+     self.measuredPressure = None   # last status() reading, self.pressure stays the target
 
      self.protocol = protocol
      self.pressure = pressure
@@ -135,70 +148,57 @@ class Protocols(QtCore.QRunnable):
      print("Thread start")
 
      self.isRunning = True
+     self.arduino.doneEmit.connect(self.completion.set, QtCore.Qt.DirectConnection)
 
-     if(self.protocol[0] == 'S'):
-       print('setup')
-       self.setup()
+     try:
+       if(self.protocol[0] == 'S'):
+         print('setup')
+         self.setup()
 
-     if(self.protocol[0:2] == 'AB'):
-       self.ABProtocol(self.protocol, self.pressure, self.minusDegrees, self.plusDegrees, self.cycles)
-     print('thread END')
+       if(self.protocol[0:2] == 'AB'):
+         self.ABProtocol(self.protocol, self.pressure, self.minusDegrees, self.plusDegrees, self.cycles)
+       print('thread END')
 #     self.completed.emit()
 #     self.signals.finished.emit(True)  # Done
+     finally:
+       self.arduino.doneEmit.disconnect(self.completion.set)
 
    def stop(self):
      print('stop')
      self.isRunning = False
-     self.exitFlag.set()
 
      try:
-       self.arduino.send('X')                #transmit data serially 
+       self.arduino.emergencyStop()          #X ahead of anything queued
      except Exception as e:
        print(str(e))
+     wake(self)
 
    def status(self, positionA, positionB, steps, pressure):
 #     print('>> A {} B {} C {} Pressure {}'.format(positionA, positionB, steps, pressure))
      self.startPosition = positionA
-     self.pressure = pressure
+     self.measuredPressure = pressure
 
    def ABProtocol(self, protocol, pressure, minusDegrees, plusDegrees, cycles):
      print('*** {} {}lbs minusDegrees {} plusDegrees {} cycles {}'.format(protocol, pressure, minusDegrees, plusDegrees, cycles))
 
-     print('sendCalibration')
-     self.arduino.send('L1')
-     self.I2Cstatus = 0
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-
-     if(self.setAToDistance(STARTPOSITION) == False):
-        self.signals.finished.emit(False)
-        return
-     self.signals.progress.emit('Moved to start {}'.format(STARTPOSITION))
+     try:
+       self.steps = compileProtocol(protocol, pressure=pressure, minus=minusDegrees, plus=plusDegrees, cycles=cycles)
+     except ValueError as e:
+       print(str(e))
+       self.signals.progress.emit(str(e))
+       self.signals.finished.emit(False)
+       return False
 
-     if(protocol == 'AB1'):
-        self.protocol1(pressure, minusDegrees, plusDegrees, cycles)
-     if(protocol == 'AB2'):
-        self.protocol2(pressure, minusDegrees, plusDegrees, cycles)
-     if(protocol == 'AB3'):
-        self.protocol3(pressure, minusDegrees, plusDegrees, cycles)
-     if(protocol == 'AB4'):
-        self.protocol4(pressure, minusDegrees, plusDegrees, cycles)
+     return runSteps(self, self.steps)
 
    def killProtocol(self):
      self.isRunning = False
+     self.completion.cancel()
 
    def setup(self):
      inches = self.degreeList[DEGREES10] #set as initial angle
      position = int(inches * self.BFactor / 6.0)
 
-
    def pressureDone(self):
      self.stopPressure = True
      print('self.stopPressure = True')
@@ -206,387 +206,12 @@ class Protocols(QtCore.QRunnable):
    def I2CStatus(self):
      self.I2Cstatus = True
 
-   def setToPressure(self, desiredPressure):
-     command = 'P{}'.format(desiredPressure)
-     self.arduino.send(command)                #transmit data serially 
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setAToDistance(self, inches):
-     print(' positioned to deg {} in.'.format(inches))
-
-     command = 'A12{}'.format(inches)
-     self.arduino.send(command)
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setToDistance(self, degrees):
-     inches = self.degreeList[degrees] #set as initial angle
-     position = int(inches * self.BFactor / 6.0)
-     print(' positioned to {} deg {} in. {} pos'.format(degrees, inches, position))
-
-     command = 'A13{}'.format(inches)
-     self.arduino.send(command)
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-
    def status(self, positionA, positionB, steps, pressure):
 #     print('>> A {} B {} C {} Pressure {}'.format(positionA, positionB, steps, pressure))
      self.startPosition = positionA
-     self.pressure = pressure
-     self.signals.APressure.emit('Pressure at {} lbs'.format(self.pressure))
-
-   def resetA(self):
-     self.signals.progress.emit('>>Degrees {}'.format(DEGREES15))
-     if(self.setToDistance(DEGREES15) == False):
-       self.signals.finished.emit(False)
-       return False
-     self.signals.progress.emit('Degrees {}'.format(DEGREES15))
-
-     self.signals.progress.emit('>>Moved to start {}'.format(NOWEIGHT))
-     if(self.setAToDistance(NOWEIGHT) == False):
-        self.signals.finished.emit(False)
-        return False
-     self.signals.progress.emit('Moved to start {}'.format(NOWEIGHT))
-     return True
-
-
-   def protocol0(self, pressure):
-     return
-
-     inches = (self.startPosition  * 6.0)/ self.BFactor
-     print('A Position {} Pressure {} lbs {:.2f} inches'.format(self.startPosition, self.pressure, inches))
-
-     self.signals.progress.emit('A Positioned at {:.1f} in. for start.'.format(inches))
-     self.signals.finished.emit(True)
-
-
-   def protocol1(self, pressure, minusDegrees, plusDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES15))
-     if(self.setToDistance(DEGREES15) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to {} Degrees'.format(DEGREES15))
-
-     currentPressure = 3
-     for cycle in range(1, cycles+1):
-
-       currentPressure = POUNDS10
-       currentDegrees = plusDegrees
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees'.format(cycle, plusDegrees))
-       if(self.setToDistance(plusDegrees) == False):
-          self.signals.finished.emit(False)
-          return
-       self.signals.progress.emit('Cycle {} {} Degrees'.format(cycle, plusDegrees))
-
-       self.signals.progress.emit('>>Cycle {} Pressure to {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       if(self.setToPressure(POUNDS10) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure to {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       self.exitFlag.wait(timeout=5)
-
-       currentPressure += 3
-       for push in range(currentPressure, pressure+1, 3):
-         self.signals.progress.emit('>>Cycle {} Pressure to {} lbs hold 5 secs'.format(cycle, push))
-         if(self.setToPressure(push) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure to {} lbs hold 5 secs'.format(cycle, push))
-         self.exitFlag.wait(timeout=5)
-
-       self.signals.progress.emit('>>Cycle {} Pressure to {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       if(self.setToPressure(POUNDS10) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10))
-
-       currentDegrees += 5
-       for push in range(currentDegrees, minusDegrees+1, 5):
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, push))
-         if(self.setToDistance(push) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, push))
-         self.exitFlag.wait(timeout=3)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-   def protocol2(self, pressure, minusDegrees, plusDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES15))
-     if(self.setToDistance(DEGREES15) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to {} Degrees'.format(DEGREES15))
-
-     for cycle in range(1, cycles+1):
-       currentDegrees = plusDegrees
-       l = 1
-       currentPressure = POUNDS10
-       PMet = False
-       DMet = False
-       while True:
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees'.format(cycle, plusDegrees))
-         if(self.setToDistance(plusDegrees) == False):
-            self.signals.finished.emit(False)
-            return
-         self.signals.progress.emit('Cycle {} {} Degrees'.format(cycle, plusDegrees))
-  
-         self.signals.progress.emit('>>Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10))
-         if(self.setToPressure(POUNDS10) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10))
-         self.exitFlag.wait(timeout=5)
-  
-         if(currentPressure + 3 > pressure):
-           PMet = True
-         if(not PMet):
-           currentPressure += 3
-         if(PMet and DMet):
-           break
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-  
-         currentPressure -= 1
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-  
-         if(currentPressure + 3 > pressure):
-           PMet = True
-         if(not PMet):
-           currentPressure += 3
-         if(PMet and DMet):
-           break
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-  
-         currentPressure -= 1
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs'.format(cycle, currentPressure))
-
-         if(currentDegrees + (5 * l) > minusDegrees):
-           DMet = True
-         if(not DMet):
-           currentDegrees += (5 * l)
-         if(PMet and DMet):
-           break
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         if(self.setToDistance(currentDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         self.exitFlag.wait(timeout=3)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-
-   def protocol3(self, pressure, minusDegrees, plusDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES15))
-     if(self.setToDistance(DEGREES15) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to {} Degrees'.format(DEGREES15))
-
-     for cycle in range(1, cycles+1):
-
-       currentPressure = POUNDS10
-       currentDegrees = plusDegrees
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees'.format(cycle, plusDegrees))
-       if(self.setToDistance(plusDegrees) == False):
-          self.signals.finished.emit(False)
-          return
-       self.signals.progress.emit('Cycle {} {} Degrees'.format(cycle, plusDegrees))
-
-       self.signals.progress.emit('>>Cycle {} Pressure to {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       if(self.setToPressure(POUNDS10) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure to {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       self.exitFlag.wait(timeout=5)
-
-       print(currentPressure)
-       currentPressure += 5
-       print(currentPressure)
-
-       for push in range(currentPressure, pressure+1, 5):
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, push))
-         if(self.setToPressure(push) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, push))
-         self.exitFlag.wait(timeout=5)
-
-       self.signals.progress.emit('>>Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10))
-       if(self.setToPressure(POUNDS5) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10))
-
-       currentDegrees += 5
-       for push in range(currentDegrees, minusDegrees+1, 5):
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, push))
-         if(self.setToDistance(push) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, push))
-         self.exitFlag.wait(timeout=3)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-   def protocol4(self, pressure, minusDegrees, plusDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES15))
-     if(self.setToDistance(DEGREES15) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to {} Degrees'.format(DEGREES15))
-
-     for cycle in range(1, cycles+1):
-       currentDegrees = plusDegrees
-       l = 1
-       currentPressure = POUNDS10
-       PMet = False
-       DMet = False
-       while True:
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees'.format(cycle, plusDegrees))
-         if(self.setToDistance(plusDegrees) == False):
-            self.signals.finished.emit(False)
-            return
-         self.signals.progress.emit('Cycle {} {} Degrees'.format(cycle, plusDegrees))
-  
-         self.signals.progress.emit('>>Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10))
-         if(self.setToPressure(POUNDS10) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10))
-         self.exitFlag.wait(timeout=5)
-  
-         if(currentPressure + 5 > pressure):
-           PMet = True
-         if(not PMet):
-           currentPressure += 5
-         if(PMet and DMet):
-           break
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-  
-         currentPressure -= 1
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-  
-         if(currentPressure + 5 > pressure):
-           PMet = True
-         if(not PMet):
-           currentPressure += 5
-         if(PMet and DMet):
-           break
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-  
-         currentPressure -= 1
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs'.format(cycle, currentPressure))
-
-         if(currentDegrees + (5 * l) > minusDegrees):
-           DMet = True
-         if(not DMet):
-           currentDegrees += (5 * l)
-         if(PMet and DMet):
-           break
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         if(self.setToDistance(currentDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         self.exitFlag.wait(timeout=3)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
+     self.measuredPressure = pressure
+     self.signals.APressure.emit('Pressure at {} lbs'.format(self.measuredPressure))
 
    def setI2CStatus(self, channel):
       self.I2Cstatus = 1
       print('self.I2Cstatus = 1')
-
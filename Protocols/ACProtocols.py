@@ -7,6 +7,11 @@ from datetime import datetime
 import time
 import threading
 
+from Protocols.clock import RealClock
+from Protocols.completion import Completion
+from Protocols.definitions import compileProtocol
+from Protocols.interpreter import runSteps, wake
+
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import QObject, QThread, pyqtSignal, QTimer
@@ -67,7 +72,8 @@ class Protocols(QtCore.QRunnable):
    cycles = 0
 
    protocolList = ['S', 'AC1', 'AC2', 'AC3', 'AC4', 'AC5', 'AC6', 'AC7', 'AC8', 'AC9', 'AC0']
-   def __init__(self, _CFactor, protocol, pressure, leftLatAngle, rightLatAngle, startDegrees, cycles, ser, config, parent=None):
+   def __init__(self, _CFactor, protocol, pressure, leftLatAngle, rightLatAngle, startDegrees, cycles, ser, config, parent=None, clock=None,
+                concurrent=False, synchronized=False, pressureControl=None, streaming=False):
      super(Protocols, self).__init__()
 
      self.CDegrees = 0.1	#convert degrees to inches
@@ -84,6 +90,15 @@ class Protocols(QtCore.QRunnable):
      self.degreeList = {1:.025, 5:.625, 10:.75, 15:.875, 20:1, 0:.5, -5:.375, -10:.25, -15:.125, -20:0}
 
      self.I2Cstatus = 0
+     self.completion = Completion()
+     self.clock = RealClock() if clock is None else clock   # SimulatedClock to fast-forward
+     self.streaming = streaming     # moves and holds run from a firmware profile, see streaming.py
+     self.pressureControl = pressureControl   # controller.PressureController runs the P steps
+     self.concurrent = concurrent        # move pressure and angle together, see definitions.pressureAndAngle
+     self.synchronized = synchronized    # and line up their arrival
+     self.steps = []          # compiled schedule, see Protocols/definitions.py
+     self.stepIndex = 0
+     self.measuredPressure = None   # last status() reading, self.pressure stays the target
 
      self.protocol = protocol
      self.pressure = pressure
@@ -105,76 +120,54 @@ class Protocols(QtCore.QRunnable):
 #     print("Thread start")
 
      self.isRunning = True
+     self.arduino.doneEmit.connect(self.completion.set, QtCore.Qt.DirectConnection)
 
-     if(self.protocol[0] == 'S'):
-       print('setup')
-       self.setup()
+     try:
+       if(self.protocol[0] == 'S'):
+         print('setup')
+         self.setup()
 
-     if(self.protocol[0:2] == 'AC'):
-       self.ACProtocol(self.protocol, self.pressure, self.leftLatAngle, self.rightLatAngle, self.startDegrees, self.cycles)
+       if(self.protocol[0:2] == 'AC'):
+         self.ACProtocol(self.protocol, self.pressure, self.leftLatAngle, self.rightLatAngle, self.startDegrees, self.cycles)
 #     print('thread END')
 #     self.completed.emit()
 #     self.signals.finished.emit(True)  # Done
+     finally:
+       self.arduino.doneEmit.disconnect(self.completion.set)
 
    def stop(self):
      print('stop')
      self.isRunning = False
-     self.exitFlag.set()
 
      try:
-       self.arduino.send('X')                #transmit data serially 
+       self.arduino.emergencyStop()          #X ahead of anything queued
      except Exception as e:
        print(str(e))
+     wake(self)
 
    def ACProtocol(self, protocol, pressure, leftLatAngle, rightLatAngle, startDegrees, cycles):
-     leftLatAngle = -leftLatAngle
      print('*** {} {}lbs degrees {}/{} start {} cycles {}'.format(protocol, pressure, leftLatAngle, rightLatAngle, startDegrees, cycles))
 
-     print('sendCalibration')
-     self.arduino.send('L1')
-     self.I2Cstatus = 0
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
+     try:
+       self.steps = compileProtocol(protocol, pressure=pressure, left=leftLatAngle, right=rightLatAngle,
+                                  cycles=cycles, marks=self.config.CMarks,
+                                  concurrent=self.concurrent, synchronized=self.synchronized)
+     except ValueError as e:
+       print(str(e))
+       self.signals.progress.emit(str(e))
+       self.signals.finished.emit(False)
+       return False
 
-     if(self.setAToDistance(STARTPOSITION) == False):
-        self.signals.finished.emit(False)
-        return
-     self.signals.progress.emit('Moved to start {}'.format(STARTPOSITION))
-
-     if(protocol == 'AC1'):
-        self.protocol1(pressure, leftLatAngle, startDegrees, cycles)
-     if(protocol == 'AC2'):
-        self.protocol2(pressure, rightLatAngle, startDegrees, cycles)
-     if(protocol == 'AC3'):
-        self.protocol3(pressure, leftLatAngle, startDegrees, cycles)
-     if(protocol == 'AC4'):
-        self.protocol4(pressure, rightLatAngle, startDegrees, cycles)
-     if(protocol == 'AC5'):
-        self.protocol5(pressure, leftLatAngle, startDegrees, cycles)
-     if(protocol == 'AC6'):
-        self.protocol6(pressure, rightLatAngle, startDegrees, cycles)
-     if(protocol == 'AC7'):
-        self.protocol7(pressure, leftLatAngle, startDegrees, cycles)
-     if(protocol == 'AC8'):
-        self.protocol8(pressure, rightLatAngle, startDegrees, cycles)
-     if(protocol == 'AC9'):
-        self.protocol9(pressure, leftLatAngle, rightLatAngle, startDegrees, cycles)
+     return runSteps(self, self.steps)
 
    def killProtocol(self):
      self.isRunning = False
+     self.completion.cancel()
 
    def setup(self):
      inches = self.degreeList[DEGREES10] #set as initial angle
      position = int(inches * self.CFactor / 6.0)
 
-
    def pressureDone(self):
      self.stopPressure = True
      print('self.stopPressure = True')
@@ -182,791 +175,12 @@ class Protocols(QtCore.QRunnable):
    def I2CStatus(self):
      self.I2Cstatus = True
 
-   def setToPressure(self, desiredPressure):
-     command = 'P{}'.format(desiredPressure)
-     self.arduino.send(command)                #transmit data serially 
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setAToDistance(self, inches):
-     print(' positioned to deg {} in.'.format(inches))
-
-     command = 'A12{}'.format(inches)
-     self.arduino.send(command)
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setToDistance(self, degrees):
-     position = self.config.CMarks['{:.1f}'.format(degrees)]
-     print(' positioned to {} degrees pos {}'.format(degrees, position))
-     command = 'K{}'.format(position)
-     self.arduino.send(command)
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-
    def status(self, positionA, positionB, steps, pressure):
 #     print('>> A {} B {} C {} Pressure {}'.format(positionA, positionB, steps, pressure))
      self.startPosition = positionA
-     self.pressure = pressure
-     self.signals.APressure.emit('Pressure at {} lbs'.format(self.pressure))
-
-   def resetA(self):
-     self.signals.progress.emit('>>Moved to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return False
-     self.signals.progress.emit('Moved to start Degrees'.format(DEGREES0))
-
-     self.signals.progress.emit('>>Moved to start {}'.format(NOWEIGHT))
-     if(self.setAToDistance(NOWEIGHT) == False):
-        self.signals.finished.emit(False)
-        return False
-     self.signals.progress.emit('Moved to start {}'.format(NOWEIGHT))
-     return True
-
-
-   def protocol0(self, pressure):
-     return
-
-     inches = (self.startPosition  * 6.0)/ self.CFactor
-     print('A Position {} Pressure {} lbs {:.2f} inches'.format(self.startPosition, self.pressure, inches))
-
-     self.signals.progress.emit('A Positioned at {:.1f} in. for start.'.format(inches))
-     self.signals.finished.emit(True)
-
-
-   def protocol1(self, pressure, leftLatAngle, startDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to start Degrees'.format(DEGREES0))
-
-     for cycle in range(1, cycles+1):
-
-       currentPressure = POUNDS10
-       currentDegrees = DEGREES0
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       if(self.setToPressure(currentPressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=5)
-
-       inLoop = True
-       outLoopA = False
-       outLoopB = False
-       
-       while(inLoop):
-         if(currentPressure + 4 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 4
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=3)
-
-         if(currentDegrees - 2.5 <= leftLatAngle):
-           currentDegrees = leftLatAngle
-           outLoopB = True
-         else:
-           currentDegrees -= 2.5
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         if(self.setToDistance(currentDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         self.exitFlag.wait(timeout=3)
-
-         inLoop = not (outLoopA and outLoopB)
-         print(inLoop, outLoopA, outLoopB)
-
-       self.signals.progress.emit('Cycle {} hold 5 secs'.format(cycle))
-       self.exitFlag.wait(timeout=5)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-   def protocol2(self, pressure, rightLatAngle, startDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to start {} Degrees'.format(DEGREES0))
-
-     for cycle in range(1, cycles+1):
-
-       currentPressure = POUNDS10
-       currentDegrees = DEGREES0
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       if(self.setToPressure(currentPressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=5)
-
-       inLoop = True
-       outLoopA = False
-       outLoopB = False
-
-       while(inLoop):
-         if(currentPressure + 4 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 4
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         if(currentDegrees + 2.5 > rightLatAngle):
-           currentDegrees = rightLatAngle
-           outLoopB = True
-         else:
-           currentDegrees += 2.5
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         if(self.setToDistance(currentDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         self.exitFlag.wait(timeout=3)
-
-         inLoop = not (outLoopA and outLoopB)
-         print(inLoop, outLoopA, outLoopB)
-
-       self.signals.progress.emit('Cycle {} hold 5 secs'.format(cycle))
-       self.exitFlag.wait(timeout=5)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-
-   def protocol3(self, pressure, leftLatAngle, startDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to start Degrees'.format(DEGREES0))
-
-     for cycle in range(1, cycles+1):
-       currentPressure = POUNDS10
-       currentDegrees = DEGREES0
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       if(self.setToPressure(currentPressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=5)
-
-       inLoop = True
-       outLoopA = False
-       outLoopB = False
-
-       while(inLoop):
-         if(currentPressure + 6 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 6
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=3)
-
-         if(currentDegrees - 2.5 <= leftLatAngle):
-           currentDegrees = leftLatAngle
-           outLoopB = True
-         else:
-           currentDegrees -= 2.5
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         if(self.setToDistance(currentDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         self.exitFlag.wait(timeout=3)
-
-         inLoop = not (outLoopA and outLoopB)
-         print(inLoop, outLoopA, outLoopB)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-
-   def protocol4(self, pressure, rightLatAngle, startDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to start {} Degrees'.format(DEGREES0))
-
-     for cycle in range(1, cycles+1):
-       currentPressure = POUNDS10
-       currentDegrees = DEGREES0
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       if(self.setToPressure(currentPressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=5)
-
-       inLoop = True
-       outLoopA = False
-       outLoopB = False
-
-       while(inLoop):
-         if(currentPressure + 6 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 6
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         if(currentDegrees + 2.5 > rightLatAngle):
-           currentDegrees = rightLatAngle
-           outLoopB = True
-         else:
-           currentDegrees += 2.5
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         if(self.setToDistance(currentDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         self.exitFlag.wait(timeout=3)
-
-         inLoop = not (outLoopA and outLoopB)
-         print(inLoop, outLoopA, outLoopB)
-
-       self.signals.progress.emit('Cycle {} hold 5 secs'.format(cycle))
-       self.exitFlag.wait(timeout=5)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-
-   def protocol5(self, pressure, leftLatAngle, startDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to start {} Degrees'.format(DEGREES0))
-
-     for cycle in range(1, cycles+1):
-       currentPressure = POUNDS10
-       currentDegrees = DEGREES0
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       if(self.setToPressure(POUNDS10) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       self.exitFlag.wait(timeout=5)
-
-       inLoop = True
-       outLoopA = False
-       outLoopB = False
-
-       while(inLoop):
-         currentPressure -= 1
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=3)
-
-         if(currentPressure + 4 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 4
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, leftLatAngle))
-         if(self.setToDistance(leftLatAngle) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, leftLatAngle))
-         self.exitFlag.wait(timeout=3)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         if(self.setToDistance(DEGREES0) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         self.exitFlag.wait(timeout=3)
-
-         inLoop = not (outLoopA)
-         print(inLoop, outLoopA)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-   def protocol6(self, pressure, rightLatAngle, startDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to start {} Degrees'.format(DEGREES0))
-
-     for cycle in range(1, cycles+1):
-       currentPressure = POUNDS10
-       currentDegrees = DEGREES0
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       if(self.setToPressure(POUNDS10) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       self.exitFlag.wait(timeout=5)
-
-       inLoop = True
-       outLoopA = False
-       outLoopB = False
-
-       while(inLoop):
-         currentPressure -= 1
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=3)
-
-         if(currentPressure + 4 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 4
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-         if(self.setToDistance(rightLatAngle) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-         self.exitFlag.wait(timeout=3)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         if(self.setToDistance(DEGREES0) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         self.exitFlag.wait(timeout=3)
-
-         inLoop = not (outLoopA)
-         print(inLoop, outLoopA)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-   def protocol7(self, pressure, leftLatAngle, startDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to start {} Degrees'.format(DEGREES0))
-
-     currentPressure = 3
-     for cycle in range(1, cycles+1):
-       currentPressure = POUNDS10
-       currentDegrees = DEGREES0
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       if(self.setToPressure(POUNDS10) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       self.exitFlag.wait(timeout=5)
-
-       inLoop = True
-       outLoopA = False
-       outLoopB = False
-
-
-       while(inLoop):
-         currentPressure -= 1
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=3)
-
-         if(currentPressure + 6 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 6
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, -leftLatAngle))
-         if(self.setToDistance(leftLatAngle) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, -leftLatAngle))
-         self.exitFlag.wait(timeout=3)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         if(self.setToDistance(DEGREES0) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         self.exitFlag.wait(timeout=3)
-
-         inLoop = not (outLoopA)
-         print(inLoop, outLoopA)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-
-
-   def protocol8(self, pressure, rightLatAngle, startDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to start {} Degrees'.format(DEGREES0))
-
-     currentPressure = 3
-     for cycle in range(1, cycles+1):
-       currentPressure = POUNDS10
-       currentDegrees = DEGREES0
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       if(self.setToPressure(POUNDS10) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, POUNDS10))
-       self.exitFlag.wait(timeout=5)
-
-       inLoop = True
-       outLoopA = False
-       outLoopB = False
-
-       while(inLoop):
-         currentPressure -= 1
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=3)
-
-         if(currentPressure + 6 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 6
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-         if(self.setToDistance(rightLatAngle) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-         self.exitFlag.wait(timeout=3)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         if(self.setToDistance(DEGREES0) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         self.exitFlag.wait(timeout=3)
-
-         inLoop = not (outLoopA)
-         print(inLoop, outLoopA)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-   def protocol9(self, pressure, leftLatAngle, rightLatAngle, startDegrees, cycles):
-
-     self.signals.progress.emit('>>Set to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Set to start Degrees'.format(DEGREES0))
-
-     currentPressure = POUNDS10
-     for cycle in range(1, cycles+1):
-       currentPressure = POUNDS10
-       currentDegrees = DEGREES0
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       if(self.setToPressure(currentPressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=5)
-
-       inLoop = True
-       outLoopA = False
-
-       while(inLoop):
-         currentPressure -= 1
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=3)
-
-         if(currentPressure + 6 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 6
-
-         if(outLoopA):
-           break
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 5 secs'.format(cycle, -leftLatAngle))
-         if(self.setToDistance(leftLatAngle) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 5 secs'.format(cycle, -leftLatAngle))
-         self.exitFlag.wait(timeout=5)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         if(self.setToDistance(DEGREES0) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         self.exitFlag.wait(timeout=3)
-
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-         if(self.setToDistance(rightLatAngle) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-         self.exitFlag.wait(timeout=3)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         if(self.setToDistance(DEGREES0) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         self.exitFlag.wait(timeout=3)
-
-
-         if(currentPressure + 6 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 6
-
-         if(outLoopA):
-           break
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         currentPressure -= 1
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 3 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=3)
-
-         if(currentPressure + 6 > pressure):
-            currentPressure = pressure
-            outLoopA = True
-         else:
-            currentPressure += 6
-
-         if(outLoopA):
-           break
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, -leftLatAngle))
-         if(self.setToDistance(leftLatAngle) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, -leftLatAngle))
-         self.exitFlag.wait(timeout=3)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         if(self.setToDistance(DEGREES0) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         self.exitFlag.wait(timeout=3)
-
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-         if(self.setToDistance(rightLatAngle) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-         self.exitFlag.wait(timeout=3)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         if(self.setToDistance(DEGREES0) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-         self.exitFlag.wait(timeout=3)
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, -leftLatAngle))
-       if(self.setToDistance(leftLatAngle) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, -leftLatAngle))
-       self.exitFlag.wait(timeout=3)
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-       if(self.setToDistance(DEGREES0) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-       self.exitFlag.wait(timeout=3)
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-       if(self.setToDistance(rightLatAngle) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, rightLatAngle))
-       self.exitFlag.wait(timeout=3)
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-       if(self.setToDistance(DEGREES0) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, DEGREES0))
-       self.exitFlag.wait(timeout=3)
-
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
+     self.measuredPressure = pressure
+     self.signals.APressure.emit('Pressure at {} lbs'.format(self.measuredPressure))
 
    def setI2CStatus(self, channel):
       self.I2Cstatus = 1
       print('self.I2Cstatus = 1')
-
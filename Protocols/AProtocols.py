@@ -7,6 +7,11 @@ from datetime import datetime
 import time
 import threading
 
+from Protocols.clock import RealClock
+from Protocols.completion import Completion
+from Protocols.definitions import compileProtocol
+from Protocols.interpreter import runSteps, wake
+
 import atexit
 
 from PyQt5 import QtCore
@@ -97,7 +102,8 @@ class Protocols(QtCore.QRunnable):
    cycles = 0
 
    protocolList = ['S', 'A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'A7', 'A8', 'A0']
-   def __init__(self, _AFactor, protocol, pressure, cycles, ser, parent=None):
+   def __init__(self, _AFactor, protocol, pressure, cycles, ser, parent=None, clock=None,
+                pressureControl=None, streaming=False):
 #     QThread.__init__(self, parent)
      super(Protocols, self).__init__()
 
@@ -110,6 +116,13 @@ class Protocols(QtCore.QRunnable):
      self.isRunning = False
 
      self.I2Cstatus = 0
+     self.completion = Completion()
+     self.clock = RealClock() if clock is None else clock   # SimulatedClock to fast-forward
+     self.streaming = streaming     # moves and holds run from a firmware profile, see streaming.py
+     self.pressureControl = pressureControl   # controller.PressureController runs the P steps
+     self.steps = []          # compiled schedule, see Protocols/definitions.py
+     self.stepIndex = 0
+     self.measuredPressure = None   # last status() reading, self.pressure stays the target
 
      self.protocol = protocol
      self.pressure = pressure
@@ -130,78 +143,52 @@ class Protocols(QtCore.QRunnable):
 #     print("Thread start")
 
      self.isRunning = True
+     self.arduino.doneEmit.connect(self.completion.set, QtCore.Qt.DirectConnection)
 
-     if(self.protocol[0] == 'S'):
-       print('setup')
-       self.setup()
+     try:
+       if(self.protocol[0] == 'S'):
+         print('setup')
+         self.setup()
 
-     if(self.protocol[0] == 'A'):
-       self.AProtocol(self.protocol, self.pressure, self.cycles)
+       if(self.protocol[0] == 'A'):
+         self.AProtocol(self.protocol, self.pressure, self.cycles)
 #     print('thread END')
 #     self.completed.emit()
 #     self.signals.finished.emit(True)  # Done
+     finally:
+       self.arduino.doneEmit.disconnect(self.completion.set)
 
    def stop(self):
      print('stop')
      self.isRunning = False
-     self.exitFlag.set()
 
      try:
-       self.arduino.send('X')                #transmit data serially 
+       self.arduino.emergencyStop()          #X ahead of anything queued
      except Exception as e:
        print(str(e))
+     wake(self)
 
    def AProtocol(self, protocol, pressure, cycles):
      print('*** {} pressure {} cycles {}'.format(protocol, pressure, cycles))
 
-     print('sendCalibration')
-     self.arduino.send('L1')
-#     time.sleep(0.5)
-     self.I2Cstatus = 0
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-
-     if(self.setAToDistance(STARTPOSITION) == False):
-        self.signals.finished.emit(False)
-        return
-     self.signals.progress.emit('Moved to start {}'.format(STARTPOSITION))
-     time.sleep(0.5)
-
-     if(protocol == 'A0'):
-        self.protocol0(pressure)
-     if(protocol == 'A1'):
-        self.protocol1(pressure, cycles)
-     if(protocol == 'A2'):
-        self.protocol2(pressure, cycles)
-     if(protocol == 'A3'):
-        self.protocol3(pressure, cycles)
-     if(protocol == 'A4'):
-        self.protocol4(pressure, cycles)
-     if(protocol == 'A5'):
-        self.protocol5(pressure, cycles)
-     if(protocol == 'A6'):
-        self.protocol6(pressure, cycles)
-     if(protocol == 'A7'):
-        self.protocol7(pressure, cycles)
-     if(protocol == 'A8'):
-        self.protocol8(pressure, cycles)
+     try:
+       self.steps = compileProtocol(protocol, pressure=pressure, cycles=cycles)
+     except ValueError as e:
+       print(str(e))
+       self.signals.progress.emit(str(e))
+       self.signals.finished.emit(False)
+       return False
 
+     return runSteps(self, self.steps)
 
    def killProtocol(self):
      self.isRunning = False
+     self.completion.cancel()
 
    def setup(self):
      inches = self.degreeList[DEGREES10] #set as initial angle
      position = int(inches * self.AFactor / 6.0)
 
-
    def pressureDone(self):
      self.stopPressure = True
      print('self.stopPressure = True')
@@ -209,359 +196,12 @@ class Protocols(QtCore.QRunnable):
    def I2CStatus(self):
      self.I2Cstatus = True
 
-   def setToPressure(self, desiredPressure):
-     command = 'P{}'.format(desiredPressure)
-     self.arduino.send(command)                #transmit data serially 
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setAToDistance(self, inches):
-     print(' positioned to deg {} in.'.format(inches))
-
-     command = 'A12{}'.format(inches)
-     self.arduino.send(command)
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setToDistance(self, position):
-     inches = (position  * 8.0)/ self.AFactor
-     print(' positioned to {}  {} in.'.format(position, inches))
-
-     command = 'A12{}'.format(position)
-     self.arduino.send(command)
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def jerk(self, option):
-     print(' jerking.')
-
-     command = 'J{}'.format(option)
-     self.arduino.send(command)
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def resetA(self):
-     self.signals.progress.emit('>>Moved to start {}'.format(NOWEIGHT))
-     if(self.setAToDistance(NOWEIGHT) == False):
-        self.signals.finished.emit(False)
-        return False
-     self.signals.progress.emit('Moved to start {}'.format(NOWEIGHT))
-     return True
-
-
    def status(self, positionA, positionB, steps, pressure):
  #    print('>> A {} B {} C {} Pressure {}'.format(positionA, positionB, steps, pressure))
 #     self.startPosition = positionA
-     self.pressure = pressure
-     self.signals.APressure.emit('Pressure at {} lbs'.format(self.pressure))
-
-   def getPosition(self):
-     self.I2Cstatus = 0
-#     command = 'G{}'.format(ACTUATOR)
-     command = 'S'
-     self.arduino.send(command)                #transmit data serially 
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def resetA(self):
-     self.signals.progress.emit('>>Moved to start {}'.format(NOWEIGHT))
-     if(self.setAToDistance(NOWEIGHT) == False):
-        self.signals.finished.emit(False)
-        return False
-     self.signals.progress.emit('Moved to start {}'.format(NOWEIGHT))
-     return True
-
-   def protocol0(self, pressure):
-     self.getPosition()
-     inches = (self.startPosition  * 6.0)/ self.AFactor
-     print('A Position {} Pressure {} lbs {:.2f} inches'.format(self.startPosition, self.pressure, inches))
-
-     self.signals.progress.emit('A Positioned at {:.1f} in. for start.'.format(inches))
-     self.signals.finished.emit(True)
-
-
-   def protocol1(self, pressure, cycles):
-
-     currentPressure = TENLBS
-     for cycle in range(1, cycles+1):
-
-       for push in range(currentPressure, pressure+1, 3):
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, push))
-         if(self.setToPressure(push) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, push))
-         self.exitFlag.wait(timeout=5)
-
-       self.signals.progress.emit('>>Moved to start.')
-       if(self.setToDistance(self.startPosition) == False):
-          self.signals.finished.emit(False)
-          return
-       self.signals.progress.emit('Moved to start.')
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-
-   def protocol2(self, pressure, cycles):
-
-     for cycle in range(1, cycles+1):
-
-       self.signals.progress.emit('>>Moved to start.')
-       if(self.setToDistance(self.startPosition) == False):
-          self.signals.finished.emit(False)
-          return
-       self.signals.progress.emit('Moved to start.')
-
-       currentPressure = TENLBS
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       if(self.setToPressure(currentPressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=5)
-
-       while(currentPressure <= pressure):
-         currentPressure -= 1
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         last = False
-         if(currentPressure + 3 > pressure):
-            currentPressure = pressure
-            last = True
-         else:
-            currentPressure += 3
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         if(last):
-           break
-
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 10 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=10)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-   def protocol3(self, pressure, cycles):
-
-     for cycle in range(1, cycles+1):
-
-       currentPressure = TENLBS
-       for push in range(currentPressure, pressure+1, 5):
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, push))
-         if(self.setToPressure(push) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, push))
-         self.exitFlag.wait(timeout=5)
-
-       self.exitFlag.wait(timeout=5)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-   def protocol4(self, pressure, cycles):
-
-     for cycle in range(1, cycles+1):
-
-       self.signals.progress.emit('>>Moved to start.')
-       if(self.setToDistance(self.startPosition) == False):
-          self.signals.finished.emit(False)
-          return
-       self.signals.progress.emit('Moved to start.')
-
-       currentPressure = TENLBS
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       if(self.setToPressure(currentPressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=5)
-
-       while(currentPressure < pressure):
-         currentPressure -= 1
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         last = False
-         if(currentPressure + 5 > pressure):
-            currentPressure = pressure
-            last = True
-         else:
-            currentPressure += 5
-
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         if(self.setToPressure(currentPressure) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, currentPressure))
-         self.exitFlag.wait(timeout=5)
-
-         if(last):
-           break
-
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 10 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=10)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-
-   def protocol5(self, pressure, cycles):
-
-     currentPressure = pressure
-     for cycle in range(1, cycles+1):
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 60 secs'.format(cycle, currentPressure))
-       if(self.setToPressure(currentPressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 60 secs'.format(cycle, currentPressure))
-       self.exitFlag.wait(timeout=60)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-   def protocol6(self, pressure, cycles):
-
-     self.signals.progress.emit('>>Moved to start.')
-     if(self.setToDistance(self.startPosition) == False):
-        self.signals.finished.emit(False)
-        return
-     self.signals.progress.emit('Moved to start.')
-
-     self.signals.progress.emit('>>Pressure {} lbs hold 5 secs'.format(TENLBS))
-     if(self.setToPressure(TENLBS) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Pressure {} lbs hold 5 secs'.format(TENLBS))
-     self.exitFlag.wait(timeout=5)
-
-     for cycle in range(1, cycles+1):
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 60 secs'.format(cycle, pressure))
-       if(self.setToPressure(pressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 60 secs'.format(cycle, pressure))
-       self.exitFlag.wait(timeout=60)
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, TENLBS))
-       if(self.setToPressure(TENLBS) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs hold 5 secs'.format(cycle, TENLBS))
-       self.exitFlag.wait(timeout=5)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-   def protocol7(self, pressure, cycles):
-
-     currentPressure = TENLBS
-     for cycle in range(1, cycles+1):
-
-       for push in range(currentPressure, pressure+1, 5):
-         self.signals.progress.emit('>>Cycle {} Pressure {} lbs'.format(cycle, push))
-         if(self.setToPressure(push) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} Pressure {} lbs'.format(cycle, push))
-
-         self.jerk('')
-         self.exitFlag.wait(timeout=6)
-
-#       self.jerk('S')
-
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-   def protocol8(self, pressure, cycles):
-
-     currentPressure = pressure
-     for cycle in range(1, cycles+1):
-
-       self.signals.progress.emit('>>Cycle {} Pressure {} lbs'.format(cycle, currentPressure))
-       if(self.setToPressure(currentPressure) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} Pressure {} lbs'.format(cycle, currentPressure))
-
-       for i in range(10):
-         self.jerk('')
-         self.exitFlag.wait(timeout=3)
-
-#       self.jerk('S')
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
+     self.measuredPressure = pressure
+     self.signals.APressure.emit('Pressure at {} lbs'.format(self.measuredPressure))
 
    def setI2CStatus(self, channel):
       self.I2Cstatus = 1
       print('self.I2Cstatus = 1')
-
@@ -7,6 +7,11 @@ from datetime import datetime
 import time
 import threading
 
+from Protocols.clock import RealClock
+from Protocols.completion import Completion
+from Protocols.definitions import compileProtocol
+from Protocols.interpreter import runSteps, wake
+
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import QObject, QThread, pyqtSignal, QTimer
@@ -154,7 +159,8 @@ class Protocols(QtCore.QRunnable):
    cycles = 0
 
    protocolList = ['S', 'B1', 'B2', 'B3', 'B0']
-   def __init__(self, _BFactor, protocol, degrees, startDegrees, cycles, ser, parent=None):
+   def __init__(self, _BFactor, protocol, degrees, startDegrees, cycles, ser, parent=None, clock=None,
+                streaming=False):
 #     QThread.__init__(self, parent)
      super(Protocols, self).__init__()
 
@@ -169,6 +175,12 @@ class Protocols(QtCore.QRunnable):
      self.degreeList = {0:5, 5:4, 10:3, 15:2, 20:1, 25:0, 30:0}
 
      self.I2Cstatus = 0
+     self.completion = Completion()
+     self.clock = RealClock() if clock is None else clock   # SimulatedClock to fast-forward
+     self.streaming = streaming     # moves and holds run from a firmware profile, see streaming.py
+     self.steps = []          # compiled schedule, see Protocols/definitions.py
+     self.stepIndex = 0
+     self.measuredPressure = None   # last status() reading, self.pressure stays the target
 
      self.protocol = protocol
      self.degrees = degrees
@@ -206,68 +218,53 @@ class Protocols(QtCore.QRunnable):
      print("Thread start")
 
      self.isRunning = True
+     self.arduino.doneEmit.connect(self.completion.set, QtCore.Qt.DirectConnection)
 
-     if(self.protocol[0] == 'S'):
-       print('setup')
-       self.setup()
+     try:
+       if(self.protocol[0] == 'S'):
+         print('setup')
+         self.setup()
 
-     if(self.protocol[0] == 'B'):
-       self.BProtocol(self.protocol, self.degrees, self.startDegrees, self.cycles)
-     print('thread END')
+       if(self.protocol[0] == 'B'):
+         self.BProtocol(self.protocol, self.degrees, self.startDegrees, self.cycles)
+       print('thread END')
 #     self.completed.emit()
 #     self.signals.finished.emit(True)  # Done
+     finally:
+       self.arduino.doneEmit.disconnect(self.completion.set)
 
    def stop(self):
      print('stop')
      self.isRunning = False
-     self.exitFlag.set()
 
      try:
-       self.arduino.send('X')                #transmit data serially 
-       pass
+       self.arduino.emergencyStop()          #X ahead of anything queued
      except Exception as e:
        print(str(e))
+     wake(self)
 
    def status(self, positionA, positionB, steps, pressure):
 #     print('>> A {} B {} C {} Pressure {}'.format(positionA, positionB, steps, pressure))
 #     self.startPosition = positionA
-     self.pressure = pressure
-     self.signals.APressure.emit('Pressure at {} lbs'.format(self.pressure))
+     self.measuredPressure = pressure
+     self.signals.APressure.emit('Pressure at {} lbs'.format(self.measuredPressure))
 
    def BProtocol(self, protocol, minusDegrees, plusDegrees, cycles):
      print('**** {} degrees -{} +{} cycles {}'.format(protocol, minusDegrees, plusDegrees, cycles))
 
-     print('sendCalibration')
-     self.arduino.send('L1')
-#     time.sleep(1)
-     self.I2Cstatus = 0
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-
-     if(self.setAToDistance(STARTPOSITION) == False):
-        self.signals.finished.emit(False)
-        return
-     self.signals.progress.emit('Moved to start {}'.format(STARTPOSITION))
-
-     if(protocol == 'B1'):
-        self.protocol1(minusDegrees, plusDegrees, cycles)
-     if(protocol == 'B2'):
-        self.protocol2(minusDegrees, plusDegrees, cycles)
-     if(protocol == 'B3'):
-        self.protocol3(minusDegrees, plusDegrees, cycles)
-     if(protocol == 'B0'):
-        self.protocol0(minusDegrees, plusDegrees)
+     try:
+       self.steps = compileProtocol(protocol, minus=minusDegrees, plus=plusDegrees, cycles=cycles)
+     except ValueError as e:
+       print(str(e))
+       self.signals.progress.emit(str(e))
+       self.signals.finished.emit(False)
+       return False
 
+     return runSteps(self, self.steps)
 
    def killProtocol(self):
      self.isRunning = False
+     self.completion.cancel()
 
    def setup(self):
      inches = self.degreeList[DEGREES10] #set as initial angle
@@ -280,181 +277,3 @@ class Protocols(QtCore.QRunnable):
 
    def setToPosition(self, speed, position):
      pass
-
-   def setToDistance(self, degrees):
-     inches = self.degreeList[degrees] #set as initial angle
-     position = int(inches * self.BFactor / 6.0)
-     print(' positioned to {} deg {} in. {} pos'.format(degrees, inches, position))
-
-     command = 'A13{}'.format(inches)
-     self.arduino.send(command)
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setAToDistance(self, inches):
-     print(' positioned to deg {} in.'.format(inches))
-
-     command = 'A12{}'.format(inches)
-     self.arduino.send(command)
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setToPressure(self, desiredPressure):
-     command = 'P{}'.format(desiredPressure)
-     self.arduino.send(command)                #transmit data serially 
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def resetA(self):
-     self.signals.progress.emit('>>Moved to start {} Degrees'.format(DEGREES15))
-     if(self.setToDistance(DEGREES15) == False):
-        self.signals.finished.emit(False)
-        return False
-     self.signals.progress.emit('Set to start {} Degrees'.format(DEGREES15))
-
-     self.signals.progress.emit('>>Moved to start {}'.format(NOWEIGHT))
-     if(self.setAToDistance(NOWEIGHT) == False):
-        self.signals.finished.emit(False)
-        return False
-     self.signals.progress.emit('Moved to start {}'.format(NOWEIGHT))
-     return True
-
-
-   def protocol0(self, minusDegrees, plusDegrees):
-
-     self.threadpool = QtCore.QThreadPool()
-     print("Multithreading with maximum %d threads" % self.threadpool.maxThreadCount())
-#     self.pressureWorker = KeepPressure(3)
- #    self.threadpool.start(self.pressureWorker)
-
-     if(self.setToDistance(degrees) == False):
-       self.signals.finished.emit(False)
-       return
-
-#     self.pressureWorker.stop()
-
-     self.signals.finished.emit(True)
-
-
-
-   def protocol1(self, minusDegrees, plusDegrees, cycles):
-
-     self.signals.progress.emit('>>Pressure to {} lbs'.format(STARTWEIGHT))
-     if(self.setToPressure(STARTWEIGHT) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Pressure to {} lbs'.format(STARTWEIGHT))
-
-     for cycle in range(1, cycles+1):
-
-       for oneCycle in range(2):
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, plusDegrees))
-         if(self.setToDistance(plusDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, plusDegrees))
-         self.exitFlag.wait(timeout=3)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, minusDegrees))
-         if(self.setToDistance(minusDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, minusDegrees))
-         self.exitFlag.wait(timeout=3)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-   def protocol2(self, minusDegrees, plusDegrees, cycles):
-
-     self.signals.progress.emit('>>Pressure to {} lbs'.format(STARTWEIGHT))
-     if(self.setToPressure(STARTWEIGHT) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Pressure to {} lbs'.format(STARTWEIGHT))
-
-     for cycle in range(1, cycles+1):
-       print('cycle {}'.format(cycle))
-
-       currentDegrees = plusDegrees
-       while(currentDegrees < minusDegrees):
-         print('currentDegrees {}:-{} +{}'.format(currentDegrees, minusDegrees, plusDegrees))
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, plusDegrees))
-         if(self.setToDistance(plusDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, plusDegrees))
-         self.exitFlag.wait(timeout=3)
-
-         currentDegrees += 5
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 5 secs'.format(cycle, currentDegrees))
-         if(self.setToDistance(currentDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 5 secs'.format(cycle, currentDegrees))
-         self.exitFlag.wait(timeout=5)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
-   def protocol3(self, minusDegrees, plusDegrees, cycles):
-
-     self.signals.progress.emit('>>Pressure to {} lbs'.format(STARTWEIGHT))
-     if(self.setToPressure(STARTWEIGHT) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Pressure to {} lbs'.format(STARTWEIGHT))
-
-     for cycle in range(1, cycles+1):
-
-       currentDegrees = plusDegrees
-       while(currentDegrees <= minusDegrees):
-         print('currentDegrees {}:-{} +{}'.format(currentDegrees, minusDegrees, plusDegrees))
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         if(self.setToDistance(currentDegrees) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 3 secs'.format(cycle, currentDegrees))
-         self.exitFlag.wait(timeout=3)
-
-         currentDegrees += 5
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-       self.signals.progress.emit('')
-
-
@@ -7,6 +7,11 @@ from datetime import datetime
 import time
 import threading
 
+from Protocols.clock import RealClock
+from Protocols.completion import Completion
+from Protocols.definitions import compileProtocol
+from Protocols.interpreter import runSteps, wake
+
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import QObject, QThread, pyqtSignal, QTimer
@@ -103,7 +108,8 @@ class Protocols(QtCore.QRunnable):
    cycles = 0
 
    protocolList = ['S', 'C1', 'C2', 'C3', 'C0']
-   def __init__(self, _CFactor, protocol, leftDegrees, rightDegrees, cycles, ser, config, parent=None):
+   def __init__(self, _CFactor, protocol, leftDegrees, rightDegrees, cycles, ser, config, parent=None, clock=None,
+                streaming=False):
 #     QThread.__init__(self, parent)
      super(Protocols, self).__init__()
 
@@ -119,6 +125,12 @@ class Protocols(QtCore.QRunnable):
      self.degreeList = {1:.025, 5:.625, 10:.75, 15:.875, 20:1, 0:.5, -5:.375, -10:.25, -15:.125, -20:0}
 
      self.I2Cstatus = 0
+     self.completion = Completion()
+     self.clock = RealClock() if clock is None else clock   # SimulatedClock to fast-forward
+     self.streaming = streaming     # moves and holds run from a firmware profile, see streaming.py
+     self.steps = []          # compiled schedule, see Protocols/definitions.py
+     self.stepIndex = 0
+     self.measuredPressure = None   # last status() reading, self.pressure stays the target
 
      self.protocol = protocol
      self.leftDegrees = leftDegrees
@@ -140,67 +152,54 @@ class Protocols(QtCore.QRunnable):
      print("Thread start")
 
      self.isRunning = True
+     self.arduino.doneEmit.connect(self.completion.set, QtCore.Qt.DirectConnection)
 
-     if(self.protocol[0] == 'S'):
-       print('setup')
-       self.setup()
+     try:
+       if(self.protocol[0] == 'S'):
+         print('setup')
+         self.setup()
 
-     if(self.protocol[0] == 'C'):
-       self.CProtocol(self.protocol, self.leftDegrees, self.rightDegrees, self.cycles)
-     print('thread END')
+       if(self.protocol[0] == 'C'):
+         self.CProtocol(self.protocol, self.leftDegrees, self.rightDegrees, self.cycles)
+       print('thread END')
 #     self.completed.emit()
 #     self.signals.finished.emit()  # Done
+     finally:
+       self.arduino.doneEmit.disconnect(self.completion.set)
 
    def stop(self):
      print('stop')
      self.isRunning = False
-     self.exitFlag.set()
 
      try:
-       self.arduino.send('X')                #transmit data serially 
+       self.arduino.emergencyStop()          #X ahead of anything queued
      except Exception as e:
        print(str(e))
-
+     wake(self)
 
    def CProtocol(self, protocol, leftDegrees, rightDegrees, cycles):
      print('*** {} degrees {}/{} cycles {}'.format(protocol, leftDegrees, rightDegrees, cycles))
 
-     print('sendCalibration')
-     self.arduino.send('L1')
-     self.I2Cstatus = 0
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-
-     if(self.setAToDistance(STARTPOSITION) == False):
-        self.signals.finished.emit(False)
-        return
-     self.signals.progress.emit('Moved to start {}'.format(STARTPOSITION))
+     try:
+       self.steps = compileProtocol(protocol, left=leftDegrees, right=rightDegrees, cycles=cycles,
+                                  marks=self.config.CMarks)
+     except ValueError as e:
+       print(str(e))
+       self.signals.progress.emit(str(e))
+       self.signals.finished.emit(False)
+       return False
 
-     if(protocol == 'C1'):
-        self.protocol1(-leftDegrees, cycles)
-     if(protocol == 'C2'):
-        self.protocol2(rightDegrees, cycles)
-     if(protocol == 'C3'):
-        self.protocol3(-leftDegrees, rightDegrees, cycles)
-     if(protocol == 'C0'):
-        self.protocol0(leftDegrees)
+     return runSteps(self, self.steps)
 
    def status(self, positionA, positionB, steps, pressure):
 #     print('>> A {} B {} C {} Pressure {}'.format(positionA, positionB, steps, pressure))
 #     self.startPosition = positionA
-     self.pressure = pressure
-     self.signals.APressure.emit('Pressure at {} lbs'.format(self.pressure))
-
+     self.measuredPressure = pressure
+     self.signals.APressure.emit('Pressure at {} lbs'.format(self.measuredPressure))
 
    def killProtocol(self):
      self.isRunning = False
+     self.completion.cancel()
 
    def setup(self):
      inches = self.degreeList[10] #set as initial angle
@@ -213,242 +212,3 @@ class Protocols(QtCore.QRunnable):
 
    def setToPosition(self, speed, position):
      pass
-
-   def setAToDistance(self, inches):
-     print(' positioned to deg {} in.'.format(inches))
-
-     command = 'A12{}'.format(inches)
-     self.arduino.send(command)
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('STOPPED')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setToDistance(self, degrees):
-     print(degrees)
-
-     position = self.config.CMarks['{:.1f}'.format(degrees)]
-     print(' positioned to {} degrees pos {}'.format(degrees, position))
-     command = 'K{}'.format(position)
-     self.arduino.send(command)
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def setToPressure(self, desiredPressure):
-
-     command = 'P{}'.format(desiredPressure)
-     self.arduino.send(command)                #transmit data serially 
-     print('cmd {}'.format(command.strip()))
-
-     while(self.I2Cstatus == 0):
-       if(not self.isRunning):
-          self.arduino.send('X')                #transmit data serially 
-          print('stopped')
-          return False
-
-       time.sleep(0.1)
-     self.I2Cstatus = 0
-     print('end')
-     return True
-
-   def resetA(self):
-     self.signals.progress.emit('>>Move to start {} Degrees'.format(DEGREES0))
-     if(self.setToDistance(DEGREES0) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Move to start {} Degrees'.format(DEGREES0))
-
-     self.signals.progress.emit('>>Moved to start {}'.format(NOWEIGHT))
-     if(self.setAToDistance(NOWEIGHT) == False):
-        self.signals.finished.emit(False)
-        return False
-     self.signals.progress.emit('Moved to start {}'.format(NOWEIGHT))
-     return True
-
-   def protocol0(self, degrees):
-
-     self.threadpool = QtCore.QThreadPool()
-     print("Multithreading with maximum %d threads" % self.threadpool.maxThreadCount())
-     self.pressureWorker = KeepPressure(self.ser, 3)
-     self.threadpool.start(self.pressureWorker)
-
-     if(self.setToDistance(degrees) == False):
-        self.signals.finished.emit(False)
-        return
-     print(' positioned to {} in.'.format(inches))
-     time.sleep(10)
-     self.pressureWorker.stop()
-
-     self.signals.finished.emit(True)
-
-
-   def protocol1(self, degrees, cycles):
-
-     self.signals.progress.emit('>>Pressure to {} lbs'.format(STARTWEIGHT))
-     if(self.setToPressure(STARTWEIGHT) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Pressure to {} lbs'.format(STARTWEIGHT))
-
-     dir = 1
-     if(degrees < 0):
-       dir = -1
-     for cycle in range(1, cycles+1):
-       self.signals.progress.emit('>>Cycle {} at {} Degrees'.format(cycle, DEGREES0))
-       if(self.setToDistance(DEGREES0) == False):
-          self.signals.finished.emit(False)
-          return
-       self.signals.progress.emit('Cycle {} at {} Degrees'.format(cycle, DEGREES0))
-
-       push = 2.5
-       while (push <= abs(degrees)):
-#       self.setToPressure(5)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 5 secs'.format(cycle, push * dir))
-         if(self.setToDistance(push * dir) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 5 secs'.format(cycle, push * dir))
-         self.exitFlag.wait(timeout=5)
-
-         push = push + 2.5
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees hold 10 secs'.format(cycle, degrees))
-       if(self.setToDistance(degrees * dir) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} {} Degrees hold 10 secs'.format(cycle, degrees))
-       self.exitFlag.wait(timeout=10)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-
-
-   def protocol2(self, degrees, cycles):
-
-     self.signals.progress.emit('>>Pressure to {} lbs'.format(STARTWEIGHT))
-     if(self.setToPressure(STARTWEIGHT) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Pressure to {} lbs'.format(STARTWEIGHT))
-
-     dir = 1
-     if(degrees < 0):
-       dir = -1
-     for cycle in range(1, cycles+1):
-       self.signals.progress.emit('>>Cycle {} at {} Degrees'.format(cycle, DEGREES0))
-       if(self.setToDistance(DEGREES0) == False):
-          self.signals.finished.emit(False)
-          return
-       self.signals.progress.emit('Cycle {} at {} Degrees'.format(cycle, DEGREES0))
-
-       push = 2.5
-       while (push <= abs(degrees)):
-#       self.setToPressure(5)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 5 secs'.format(cycle, push * dir))
-         if(self.setToDistance(push * dir) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 5 secs'.format(cycle, push * dir))
-         self.exitFlag.wait(timeout=5)
-
-         push = push + 2.5
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees hold 10 secs'.format(cycle, degrees))
-       if(self.setToDistance(degrees * dir) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} {} Degrees hold 10 secs'.format(cycle, degrees))
-       self.exitFlag.wait(timeout=10)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-
-   def protocol3(self, leftDegrees, rightDegrees, cycles):
-
-     self.signals.progress.emit('>>Pressure to {} lbs'.format(STARTWEIGHT))
-     if(self.setToPressure(STARTWEIGHT) == False):
-       self.signals.finished.emit(False)
-       return
-     self.signals.progress.emit('Pressure to {} lbs'.format(STARTWEIGHT))
-
-     for cycle in range(1, cycles+1):
-       self.signals.progress.emit('>>Cycle {} at {} Degrees'.format(cycle, DEGREES0))
-       if(self.setToDistance(DEGREES0) == False):
-          self.signals.finished.emit(False)
-          return
-       self.signals.progress.emit('Cycle {} at {} Degrees'.format(cycle, DEGREES0))
-
-       dir = -1
-       push = 2.5
-       while (push <= abs(leftDegrees)):
-#       self.setToPressure(5)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 5 secs'.format(cycle, push * dir))
-         if(self.setToDistance(push * dir) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 5 secs'.format(cycle, push * dir))
-         self.exitFlag.wait(timeout=5)
-
-         push = push + 2.5
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees hold 10 secs'.format(cycle, leftDegrees * dir))
-       if(self.setToDistance(leftDegrees * dir) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} {} Degrees hold 10 secs'.format(cycle, leftDegrees * dir))
-       self.exitFlag.wait(timeout=10)
-
-
-       self.signals.progress.emit('>>Move to start {} Degrees'.format(DEGREES0))
-       if(self.setToDistance(DEGREES0) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Move to start {} Degrees'.format(DEGREES0))
-
-       dir = 1
-       push = 2.5
-       while (push <= abs(rightDegrees)):
-#       self.setToPressure(5)
-
-         self.signals.progress.emit('>>Cycle {} {} Degrees hold 5 secs'.format(cycle, push * dir))
-         if(self.setToDistance(push * dir) == False):
-           self.signals.finished.emit(False)
-           return
-         self.signals.progress.emit('Cycle {} {} Degrees hold 5 secs'.format(cycle, push * dir))
-         self.exitFlag.wait(timeout=5)
-
-         push = push + 2.5
-
-       self.signals.progress.emit('>>Cycle {} {} Degrees hold 10 secs'.format(cycle, rightDegrees * dir))
-       if(self.setToDistance(rightDegrees * dir) == False):
-         self.signals.finished.emit(False)
-         return
-       self.signals.progress.emit('Cycle {} {} Degrees hold 10 secs'.format(cycle, rightDegrees * dir))
-       self.exitFlag.wait(timeout=10)
-
-     if(self.resetA()):
-       self.signals.finished.emit(True)
-
-
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Host-side overhead of every protocol against a zero-latency firmware.
+
+   python -m Protocols.benchmark [--cycles 3] [--json bench.json] [--compare previous.json]
+
+FakeFirmware answers each command with DONE from its own thread the moment
+it is written, like the serial reader would with an infinitely fast
+Arduino, and holds run on a SimulatedClock, so everything the run takes is
+host overhead.  Per protocol it reports, in milliseconds:
+
+   doneToWrite  DONE emitted -> next command written (interpreter, emits,
+                waiter wake-up)
+   emit         time inside signals.progress.emit
+   wake         Completion.wakeLatency, DONE set() -> waiter running
+   compile      compileProtocol(), where the progress texts are formatted
+
+and overheadSeconds, the whole run, against holdSeconds, the hold and
+sleep time the schedule asks for.  --compare prints the change of each
+p50 against an earlier JSON report.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import queue
+import threading
+import time
+import types
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from Arduino.latency import LatencyHistogram, opcodeOf, acked
+from Protocols.clock import SimulatedClock
+from Protocols.definitions import compileProtocol, protocols
+from Protocols.schedule import analyze
+from Protocols.simulate import makeEngine, defaultMarks
+
+
+class FakeFirmware(QObject):
+   '''Stands in for comm.Arduino: every acked command is DONE at once, from another thread.'''
+   doneEmit = pyqtSignal()
+
+   def __init__(self):
+     super(FakeFirmware, self).__init__()
+     self.queue = queue.Queue()
+     self.lastDone = None
+     self.engine = None
+     self.commands = 0
+     self.doneToWrite = LatencyHistogram()
+     self.wake = LatencyHistogram()
+     self.thread = threading.Thread(target=self.run, name='FakeFirmware', daemon=True)
+     self.thread.start()
+
+   def run(self):
+     while True:
+       command = self.queue.get()
+       if(command is None):
+          return
+       self.lastDone = time.perf_counter()
+       self.doneEmit.emit()
+
+   def send(self, command):
+     now = time.perf_counter()
+     self.commands += 1
+     if(self.lastDone is not None):
+        self.doneToWrite.record(now - self.lastDone)
+        self.wake.record(self.engine.completion.wakeLatency)
+        self.lastDone = None
+     if(acked(opcodeOf(command))):
+        self.queue.put(command)
+
+   def close(self):
+     self.queue.put(None)
+     self.thread.join()
+
+
+class TimedSignal():
+   def __init__(self, owner, name, histogram):
+     self.owner = owner          # the QObject must outlive its bound signal
+     self.signal = getattr(owner, name)
+     self.histogram = histogram
+
+   def connect(self, *args):
+     self.signal.connect(*args)
+
+   def emit(self, *args):
+     start = time.perf_counter()
+     self.signal.emit(*args)
+     self.histogram.record(time.perf_counter() - start)
+
+
+def benchmark(protocol, marks, **params):
+   start = time.perf_counter()
+   steps = compileProtocol(protocol, marks=marks, **params)
+   compileSeconds = time.perf_counter() - start
+   summary = analyze(steps)
+
+   firmware = FakeFirmware()
+   clock = SimulatedClock()
+   emit = LatencyHistogram()
+
+   # the engines' prints are part of the overhead, only keep them off the table
+   with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+     engine = makeEngine(protocol, firmware, clock, types.SimpleNamespace(CMarks=marks), **params)
+     firmware.engine = engine
+     signals = engine.signals
+     signals.progress.connect(lambda text: None)
+     engine.signals = types.SimpleNamespace(progress=TimedSignal(signals, 'progress', emit),
+                                            finished=signals.finished, APressure=signals.APressure)
+
+     start = time.perf_counter()
+     engine.run()
+     seconds = time.perf_counter() - start
+   firmware.close()
+
+   return {'steps': summary['steps'], 'commands': firmware.commands, 'progress': summary['progress'],
+           'holdSeconds': round(clock.now(), 3), 'overheadSeconds': round(seconds, 6),
+           'overheadPerStepMs': round(seconds * 1000 / max(1, summary['steps']), 4),
+           'compileMs': round(compileSeconds * 1000, 3),
+           'doneToWrite': firmware.doneToWrite.report(), 'emit': emit.report(), 'wake': firmware.wake.report()}
+
+def compare(report, previous):
+   '''Lines with the change of each p50 (and overhead) against an earlier report.'''
+   lines = []
+   for protocol, now in sorted(report['protocols'].items()):
+     before = previous['protocols'].get(protocol)
+     if(before is None):
+        continue
+     changes = []
+     for key in ('doneToWrite', 'emit', 'wake'):
+       old, new = before[key].get('p50'), now[key].get('p50')
+       if(old):
+          changes.append('{} {:+.0f}%'.format(key, (new - old) * 100.0 / old))
+     if(before['overheadSeconds']):
+        changes.append('total {:+.0f}%'.format((now['overheadSeconds'] - before['overheadSeconds']) * 100.0 / before['overheadSeconds']))
+     lines.append('{:5} {}'.format(protocol, '  '.join(changes)))
+   return lines
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description='Host overhead of every protocol against a zero-latency firmware')
+   parser.add_argument('protocols', nargs='*', help='default all')
+   parser.add_argument('--cycles', type=int, default=3)
+   parser.add_argument('--pressure', type=int, default=30)
+   parser.add_argument('--left', type=float, default=15)
+   parser.add_argument('--right', type=float, default=15)
+   parser.add_argument('--minus', type=int, default=30)
+   parser.add_argument('--plus', type=int, default=15)
+   parser.add_argument('--json', help='save the report here')
+   parser.add_argument('--compare', help='earlier report to compare against')
+   args = parser.parse_args(argv)
+
+   marks = defaultMarks()
+   params = {'pressure': args.pressure, 'cycles': args.cycles, 'left': args.left, 'right': args.right,
+             'minus': args.minus, 'plus': args.plus}
+   report = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+             'machine': platform.machine(), 'params': params, 'protocols': {}}
+
+   print('{:5} {:>5} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10} {:>9}'.format(
+         'proto', 'steps', 'd2w p50', 'd2w p99', 'emit p50', 'wake p50', 'wake p99', 'overhead s', 'hold s'))
+   for protocol in args.protocols or protocols():
+     result = benchmark(protocol, marks, **params)
+     report['protocols'][protocol] = result
+     print('{:5} {:>5} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10.4f} {:>9.1f}'.format(
+           protocol, result['steps'], result['doneToWrite'].get('p50', '-'), result['doneToWrite'].get('p99', '-'),
+           result['emit'].get('p50', '-'), result['wake'].get('p50', '-'), result['wake'].get('p99', '-'),
+           result['overheadSeconds'], result['holdSeconds']))
+
+   if(args.compare):
+      with open(args.compare) as f:
+        print('\n'.join(compare(report, json.load(f))))
+
+   if(args.json):
+      with open(args.json, 'w') as f:
+        json.dump(report, f, indent=1)
+
+if __name__ == '__main__':
+   main()
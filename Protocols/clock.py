@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Clocks for the protocol engines.
+
+The interpreter takes its holds and sleeps from engine.clock.  RealClock
+waits for real.  SimulatedClock only moves a virtual time forward, so a
+schedule runs as fast as the firmware answers.  Arduino/emulator.py can
+share the same clock and jump it to the next actuator arrival, which
+makes the whole session run in virtual time (see simulate.py).
+"""
+import threading
+import time
+
+
+class RealClock():
+   simulated = False
+
+   def now(self):
+     return time.monotonic()
+
+   def sleep(self, seconds):
+     time.sleep(seconds)
+
+   def wait(self, event, timeout):
+     '''event.wait(timeout), True if the event was set.'''
+     return event.wait(timeout=timeout)
+
+
+class SimulatedClock():
+   simulated = True
+
+   def __init__(self, start=0.0):
+     self.lock = threading.Lock()
+     self.time = start
+
+   def now(self):
+     with self.lock:
+       return self.time
+
+   def advance(self, seconds):
+     with self.lock:
+       self.time += max(0.0, seconds)
+       return self.time
+
+   def sleep(self, seconds):
+     self.advance(seconds)
+
+   def wait(self, event, timeout):
+     '''Return at once: True if event is already set, otherwise the timeout passes in virtual time.'''
+     if(event.is_set()):
+        return True
+     if(timeout is None):
+        return event.wait()
+     self.advance(timeout)
+     return event.is_set()
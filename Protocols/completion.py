@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Completion flag shared by the protocol engines.
+
+The engine arms it before sending a firmware command and blocks in wait()
+until the serial reader thread calls set() on DONE, so the next command goes
+out as soon as the firmware reports completion instead of on the next
+100 ms poll.  cancel() wakes every waiter immediately for stop().
+"""
+import threading
+import time
+
+
+class Completion():
+   def __init__(self):
+     self.condition = threading.Condition()
+     self.done = False
+     self.cancelled = False
+
+     self.doneAt = 0.0
+     self.wakeLatency = 0.0   # seconds between set() and the waiter running again
+
+   def arm(self):
+     with self.condition:
+       self.done = False
+
+   def set(self):
+     with self.condition:
+       self.done = True
+       self.doneAt = time.monotonic()
+       self.condition.notify_all()
+
+   def cancel(self):
+     with self.condition:
+       self.cancelled = True
+       self.condition.notify_all()
+
+   def isCancelled(self):
+     return self.cancelled
+
+   def wait(self, timeout=None):
+     '''Block until set() or cancel(); True only for a completed command.'''
+     with self.condition:
+       self.condition.wait_for(lambda: self.done or self.cancelled, timeout)
+       if(self.cancelled or not self.done):
+          return False
+       self.done = False
+       self.wakeLatency = time.monotonic() - self.doneAt
+       return True
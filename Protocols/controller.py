@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Host-side closed-loop pressure control of actuator A.
+
+The firmware P{lbs} command drives A at full speed until the load cell
+passes lbs and answers DONE, so a ramp is one round trip per increment and
+holding a pressure means sending P again.  PressureController instead
+listens to every streamed PR| and A| frame on the reader thread and sets
+the speed of A with V{speed} (-MAXSPEED..MAXSPEED, firmware units, no
+DONE) from a PID on the pressure error.  The reader thread only computes
+the speed, the V commands go out from the controller's writer thread:
+
+   control = PressureController(arduino, gains=(400, 100, 0))
+   engine = AProtocols.Protocols(..., pressureControl=control)
+
+The interpreter then runs each P step of the schedule as rampTo(lbs): the
+setpoint moves from the last one to lbs at rampRate lbs/s and the step ends
+once the reading has settled within tolerance.  The loop keeps regulating
+through the holds and the angle moves that follow, until a command that
+moves A itself (A12, J, R) or the end of the run releases it with V0.
+
+V needs firmware that takes a proportional speed and stops A by itself
+when no V arrived for a while (motor.ino after VELOCITYTIMEOUT, the
+emulator after velocityTimeout); keepAlive resends the last speed well
+inside that.  Such firmware lists 'speed' in its CAPS| reply, without it
+the interpreter sends the P steps as before.
+"""
+import threading
+
+MAXSPEED = 3200
+
+
+class PID():
+   '''
+   PID with derivative on the measurement and conditional integration: the
+   integral does not grow while the output is saturated in the direction of
+   the error, so it cannot wind up during a ramp the actuator cannot follow.
+   '''
+   def __init__(self, kp, ki=0.0, kd=0.0, limit=MAXSPEED):
+     self.kp = kp
+     self.ki = ki
+     self.kd = kd
+     self.limit = limit
+     self.reset()
+
+   def reset(self):
+     self.integral = 0.0
+     self.lastMeasured = None
+
+   def update(self, setpoint, measured, dt):
+     error = setpoint - measured
+     derivative = 0.0
+     if(self.lastMeasured is not None and dt > 0):
+        derivative = -(measured - self.lastMeasured) / dt
+     self.lastMeasured = measured
+
+     integral = self.integral + error * dt
+     output = self.kp * error + self.ki * integral + self.kd * derivative
+     clamped = max(-self.limit, min(self.limit, output))
+     if(clamped == output or (output > 0) != (error > 0)):
+        self.integral = integral
+     return clamped
+
+
+class Trajectory():
+   '''Pressure setpoint over time, linear between (seconds, lbs) points.'''
+   def __init__(self, points):
+     self.points = sorted(points)
+
+   @classmethod
+   def ramp(cls, start, lbs, rate, now):
+     return cls([(now, start), (now + abs(lbs - start) / rate if rate > 0 else now, lbs)])
+
+   def at(self, now):
+     if(now <= self.points[0][0]):
+        return self.points[0][1]
+     for (t0, p0), (t1, p1) in zip(self.points, self.points[1:]):
+       if(now <= t1):
+          return p0 + (p1 - p0) * (now - t0) / (t1 - t0) if t1 > t0 else p1
+     return self.points[-1][1]
+
+   def end(self):
+     return self.points[-1][0]
+
+   def target(self):
+     return self.points[-1][1]
+
+
+class PressureController():
+   def __init__(self, arduino, gains=(400.0, 100.0, 0.0), clock=None, rampRate=4.0,
+                tolerance=0.5, settleSamples=3, settleTimeout=10.0, deadband=50,
+                keepAlive=0.5, maxDt=0.5):
+     self.arduino = arduino
+     self.pid = PID(*gains)
+     self.clock = clock                  # engine.clock when None, set by engage()
+     self.rampRate = rampRate            # lbs/s the setpoint moves at
+     self.tolerance = tolerance          # lbs from the target that counts as reached
+     self.settleSamples = settleSamples  # readings in tolerance in a row
+     self.settleTimeout = settleTimeout  # seconds past the end of the ramp before giving up
+     self.deadband = deadband            # speed change worth a V command
+     self.keepAlive = keepAlive          # resend an unchanged speed after this
+     self.maxDt = maxDt                  # longest sample gap the integral sees
+
+     self.lock = threading.Lock()
+     self.pending = threading.Condition(self.lock)
+     self.sendLock = threading.Lock()    # one V on its way at a time, in order
+     self.outgoing = None                # speed for the writer thread to send
+     self.settled = threading.Event()
+     self.trajectory = None
+     self.exitFlag = None
+     self.active = False
+     self.measured = None
+     self.lastSample = None
+     self.lastSpeed = None
+     self.lastSent = None
+     self.inTolerance = 0
+     self.samples = 0
+     self.commands = 0
+
+     arduino.addListener(self.sample)
+     self.writer = threading.Thread(target=self.writeLoop, name='PressureControl', daemon=True)
+     self.writer.start()
+
+   def available(self):
+     '''The firmware has the V speed mode.'''
+     return self.arduino.supports('speed')
+
+   def now(self):
+     return self.clock.now()
+
+   def engage(self, engine):
+     '''Start regulating for engine's run; stop() on the engine ends it through exitFlag.'''
+     with self.lock:
+       if(self.clock is None):
+          self.clock = engine.clock
+       self.exitFlag = engine.exitFlag
+
+   def setTarget(self, lbs):
+     '''Ramp the setpoint from where it is to lbs, without waiting.'''
+     with self.lock:
+       now = self.now()
+       if(self.trajectory is not None and self.active):
+          start = self.trajectory.at(now)
+       elif(self.measured is not None):
+          start = self.measured
+       else:
+          start = lbs
+       self.trajectory = Trajectory.ramp(start, lbs, self.rampRate, now)
+       if(not self.active):
+          self.pid.reset()
+          self.lastSample = None
+          self.lastSpeed = 0
+       self.lastSent = now
+       speed = self.lastSpeed
+       self.active = True
+       self.inTolerance = 0
+       self.settled.clear()
+       self.post(speed)           # (re)starts speed mode, the firmware streams PR| while in it
+
+   def waitSettled(self, exitFlag):
+     '''Until the reading settles on the target; False if exitFlag was set first.'''
+     deadline = self.trajectory.end() + self.settleTimeout
+     samples = self.samples
+     quiet = 0
+     while not self.settled.is_set():
+       if(exitFlag.is_set()):
+          return False
+       if(self.now() >= deadline):
+          print('pressure not settled at {} lbs, measured {}'.format(self.trajectory.target(), self.measured))
+          return True
+       self.settled.wait(0.05)   # real time also on a SimulatedClock, the emulator moves it
+       quiet = quiet + 1 if self.samples == samples else 0
+       samples = self.samples
+       if(quiet * 0.05 >= self.keepAlive):
+          # no readings, the firmware left speed mode; ask again
+          with self.lock:
+            self.post(self.lastSpeed or 0)
+          quiet = 0
+     return not exitFlag.is_set()
+
+   def wake(self):
+     '''Let waitSettled() look at exitFlag now instead of at its next poll.'''
+     self.settled.set()
+
+   def rampTo(self, lbs, exitFlag):
+     self.setTarget(lbs)
+     return self.waitSettled(exitFlag)
+
+   def release(self):
+     '''Stop regulating and stop A; V0 is written before this returns.'''
+     with self.sendLock:
+       with self.lock:
+         wasActive = self.active
+         self.active = False
+         self.trajectory = None
+         self.lastSpeed = None
+         self.outgoing = None
+       if(wasActive):
+          self.send(0)
+
+   def sample(self, tag, values):
+     '''Reader thread: every PR| and A| frame.'''
+     try:
+       if(tag == 'PR'):
+          measured = float(values[0])
+       elif(tag == 'A'):
+          measured = float(values[3])
+       else:
+          return
+     except (IndexError, ValueError):
+       return
+
+     with self.lock:
+       self.measured = measured
+       self.samples += 1
+       if(not self.active or self.exitFlag is None or self.exitFlag.is_set()):
+          return
+       if(getattr(self.arduino, 'stopped', False)):
+          self.active = False      # X is out, not one more V
+          return
+       now = self.now()
+       dt = 0.0 if self.lastSample is None else min(self.maxDt, now - self.lastSample)
+       self.lastSample = now
+
+       setpoint = self.trajectory.at(now)
+       speed = int(round(self.pid.update(setpoint, measured, dt)))
+
+       if(now >= self.trajectory.end() and abs(self.trajectory.target() - measured) <= self.tolerance):
+          self.inTolerance += 1
+       else:
+          self.inTolerance = 0
+       if(self.inTolerance >= self.settleSamples):
+          self.settled.set()
+
+       if(self.lastSpeed is not None and abs(speed - self.lastSpeed) < self.deadband
+          and (speed != 0 or self.lastSpeed == 0) and now - self.lastSent < self.keepAlive):
+          return
+       self.lastSpeed = speed
+       self.lastSent = now
+       self.post(speed)
+
+   def post(self, speed):
+     '''Hand speed to the writer thread, the caller holds lock; a newer one replaces it.'''
+     self.outgoing = speed
+     self.pending.notify()
+
+   def writeLoop(self):
+     while True:
+       with self.pending:
+         self.pending.wait_for(lambda: self.outgoing is not None)
+       with self.sendLock:
+         with self.lock:
+           speed, self.outgoing = self.outgoing, None
+         if(speed is not None):
+            self.send(speed)
+
+   def send(self, speed):
+     self.commands += 1
+     self.arduino.sendLine('V{}'.format(speed))
@@ -0,0 +1,545 @@
+# -*- coding: utf-8 -*-
+"""
+Protocol definitions for every engine family.
+
+Each definition describes one protocol with the schedule.Builder
+primitives and compileProtocol() turns it into the flat step list the
+interpreter runs, e.g.
+
+   steps = compileProtocol('AC3', pressure=30, left=15, right=15, cycles=10, marks=config.CMarks)
+   schedule.analyze(steps)
+
+The definitions reproduce the command and progress sequence of the former
+hand-coded protocolN methods, including their texts and quirks (C1/C3
+ending on the mirrored angle, 'Set to start Degrees', AB3 easing to 5 lbs
+while reporting 10).  left is the UI's left angle as a positive number;
+the families negate it where the engines did.
+"""
+from Protocols import schedule
+from Protocols.schedule import Builder, FAILIGNORE
+
+DEGREES0 = 0
+DEGREES15 = 15
+POUNDS5 = 5
+POUNDS10 = 10
+STARTWEIGHT = 5
+
+# horizontal actuator B: degrees -> inches, shared by the B and AB families
+BDEGREES = {0:5, 5:4, 10:3, 15:2, 20:1, 25:0, 30:0}
+
+
+def held(cycle, value, unit, seconds):
+   return 'Cycle {} {} {} hold {} secs'.format(cycle, value, unit, seconds)
+
+def pressureText(cycle, lbs, seconds=None):
+   if(seconds is None):
+      return 'Cycle {} Pressure {} lbs'.format(cycle, lbs)
+   return 'Cycle {} Pressure {} lbs hold {} secs'.format(cycle, lbs, seconds)
+
+def degreesText(cycle, degrees, seconds=None):
+   if(seconds is None):
+      return 'Cycle {} {} Degrees'.format(cycle, degrees)
+   return 'Cycle {} {} Degrees hold {} secs'.format(cycle, degrees, seconds)
+
+def nextPressure(current, step, pressure):
+   '''Raise by step, clamped to the target; True once the target is reached.'''
+   if(current + step > pressure):
+      return pressure, True
+   return current + step, False
+
+
+### A: axial pressure ###
+
+TENLBS = 10
+
+def A0(b, p):
+   b.send('S', fail=FAILIGNORE)
+   b.say('A Positioned at {:.1f} in. for start.'.format(0.0))
+   b.finish()
+
+def A1(b, p):
+   for cycle in range(1, p['cycles']+1):
+     for push in range(TENLBS, p['pressure']+1, 3):
+       b.pressure(push, pressureText(cycle, push, 5), hold=5)
+     b.axial(0, 'Moved to start.')
+   b.resetA()
+   b.finish()
+
+def AStepBack(b, p, step, inclusive):
+   pressure = p['pressure']
+   for cycle in range(1, p['cycles']+1):
+     b.axial(0, 'Moved to start.')
+     current = TENLBS
+     b.pressure(current, pressureText(cycle, current, 5), hold=5)
+     while(current <= pressure if inclusive else current < pressure):
+       current -= 1
+       b.pressure(current, pressureText(cycle, current, 5), hold=5)
+       current, last = nextPressure(current, step, pressure)
+       b.pressure(current, pressureText(cycle, current, 5), hold=5)
+       if(last):
+         break
+     b.say(pressureText(cycle, current, 10))
+     b.hold(10)
+   b.resetA()
+   b.finish()
+
+def A2(b, p):
+   AStepBack(b, p, 3, True)
+
+def A3(b, p):
+   for cycle in range(1, p['cycles']+1):
+     for push in range(TENLBS, p['pressure']+1, 5):
+       b.pressure(push, pressureText(cycle, push, 5), hold=5)
+     b.hold(5)
+   b.resetA()
+   b.finish()
+
+def A4(b, p):
+   AStepBack(b, p, 5, False)
+
+def A5(b, p):
+   for cycle in range(1, p['cycles']+1):
+     b.pressure(p['pressure'], pressureText(cycle, p['pressure'], 60), hold=60)
+   b.resetA()
+   b.finish()
+
+def A6(b, p):
+   b.axial(0, 'Moved to start.')
+   b.pressure(TENLBS, 'Pressure {} lbs hold 5 secs'.format(TENLBS), hold=5)
+   for cycle in range(1, p['cycles']+1):
+     b.pressure(p['pressure'], pressureText(cycle, p['pressure'], 60), hold=60)
+     b.pressure(TENLBS, pressureText(cycle, TENLBS, 5), hold=5)
+   b.resetA()
+   b.finish()
+
+def A7(b, p):
+   for cycle in range(1, p['cycles']+1):
+     for push in range(TENLBS, p['pressure']+1, 5):
+       b.pressure(push, pressureText(cycle, push))
+       b.jerk()
+       b.hold(6)
+   b.resetA()
+   b.finish()
+
+def A8(b, p):
+   for cycle in range(1, p['cycles']+1):
+     b.pressure(p['pressure'], pressureText(cycle, p['pressure']))
+     for i in range(10):
+       b.jerk()
+       b.hold(3)
+   b.resetA()
+   b.finish()
+
+
+### B: horizontal actuator ###
+
+def resetB(b):
+   b.angle(DEGREES15, 'Moved to start {} Degrees'.format(DEGREES15), after='Set to start {} Degrees'.format(DEGREES15))
+   b.resetA()
+   b.finish()
+   b.say('')
+
+def B0(b, p):
+   # the hand-coded B0 referenced an undefined name, this is what it meant to do
+   b.angle(p['minus'])
+   b.finish()
+
+def B1(b, p):
+   b.pressure(STARTWEIGHT, 'Pressure to {} lbs'.format(STARTWEIGHT))
+   for cycle in range(1, p['cycles']+1):
+     for oneCycle in range(2):
+       b.angle(p['plus'], degreesText(cycle, p['plus'], 3), hold=3)
+       b.angle(p['minus'], degreesText(cycle, p['minus'], 3), hold=3)
+   resetB(b)
+
+def B2(b, p):
+   b.pressure(STARTWEIGHT, 'Pressure to {} lbs'.format(STARTWEIGHT))
+   for cycle in range(1, p['cycles']+1):
+     current = p['plus']
+     while(current < p['minus']):
+       b.angle(p['plus'], degreesText(cycle, p['plus'], 3), hold=3)
+       current += 5
+       b.angle(current, degreesText(cycle, current, 5), hold=5)
+   resetB(b)
+
+def B3(b, p):
+   b.pressure(STARTWEIGHT, 'Pressure to {} lbs'.format(STARTWEIGHT))
+   for cycle in range(1, p['cycles']+1):
+     current = p['plus']
+     while(current <= p['minus']):
+       b.angle(current, degreesText(cycle, current, 3), hold=3)
+       current += 5
+   resetB(b)
+
+
+### C and D: lateral actuator ###
+
+def resetC(b):
+   b.angle(DEGREES0, 'Move to start {} Degrees'.format(DEGREES0))
+   b.resetA()
+   b.finish()
+
+def lateral0(b, p):
+   # C0/D0 started a KeepPressure worker that never pressed, then held 10 s
+   b.angle(p['left'])
+   b.sleep(10)
+   b.finish()
+
+def sweep(b, cycle, direction, limit):
+   push = 2.5
+   while(push <= limit):
+     b.angle(push * direction, degreesText(cycle, push * direction, 5), hold=5)
+     push = push + 2.5
+
+def CSide(b, p, degrees):
+   b.pressure(STARTWEIGHT, 'Pressure to {} lbs'.format(STARTWEIGHT))
+   direction = -1 if degrees < 0 else 1
+   for cycle in range(1, p['cycles']+1):
+     b.angle(DEGREES0, 'Cycle {} at {} Degrees'.format(cycle, DEGREES0))
+     sweep(b, cycle, direction, abs(degrees))
+     b.angle(degrees * direction, degreesText(cycle, degrees, 10), hold=10)
+   resetC(b)
+
+def C1(b, p):
+   CSide(b, p, -p['left'])
+
+def C2(b, p):
+   CSide(b, p, p['right'])
+
+def C3(b, p):
+   left, right = -p['left'], p['right']
+   b.pressure(STARTWEIGHT, 'Pressure to {} lbs'.format(STARTWEIGHT))
+   for cycle in range(1, p['cycles']+1):
+     b.angle(DEGREES0, 'Cycle {} at {} Degrees'.format(cycle, DEGREES0))
+     sweep(b, cycle, -1, abs(left))
+     b.angle(left * -1, degreesText(cycle, left * -1, 10), hold=10)
+     b.angle(DEGREES0, 'Move to start {} Degrees'.format(DEGREES0))
+     sweep(b, cycle, 1, abs(right))
+     b.angle(right, degreesText(cycle, right, 10), hold=10)
+   resetC(b)
+
+def DSide(b, p, degrees, direction):
+   b.pressure(STARTWEIGHT, 'Pressure to {} lbs'.format(STARTWEIGHT))
+   b.angle(DEGREES0, 'Start at {} Degrees'.format(DEGREES0))
+   for cycle in range(1, p['cycles']+1):
+     sweep(b, cycle, direction, abs(degrees) - 2.5)
+     b.angle(degrees * direction, degreesText(cycle, degrees, 10), hold=10)
+   resetC(b)
+
+def D1(b, p):
+   DSide(b, p, p['right'], -1 if p['right'] < 0 else 1)
+
+def D2(b, p):
+   DSide(b, p, -p['left'], -1)
+
+def D3(b, p):
+   first, second = p['right'], -p['left']
+   b.pressure(STARTWEIGHT, 'Pressure to {} lbs'.format(STARTWEIGHT))
+   b.angle(DEGREES0, 'Start at {} Degrees'.format(DEGREES0))
+   for cycle in range(1, p['cycles']+1):
+     sweep(b, cycle, -1, abs(first) - 2.5)
+     b.angle(first * -1, degreesText(cycle, first * -1, 10), hold=10)
+     b.angle(DEGREES0, 'Move to start {} Degrees'.format(DEGREES0))
+     sweep(b, cycle, 1, abs(second))
+     b.angle(second, degreesText(cycle, second, 10), hold=10)
+   resetC(b)
+
+
+### AB: axial pressure with horizontal angle ###
+
+def resetAB(b):
+   b.angle(DEGREES15, 'Degrees {}'.format(DEGREES15))
+   b.resetA()
+   b.finish()
+   b.say('')
+
+def ABStart(b):
+   b.angle(DEGREES15, 'Set to start {} Degrees'.format(DEGREES15), after='Set to {} Degrees'.format(DEGREES15))
+
+def ABRamp(b, p, step, rampText, ease):
+   ABStart(b)
+   for cycle in range(1, p['cycles']+1):
+     b.angle(p['plus'], degreesText(cycle, p['plus']))
+     b.pressure(POUNDS10, 'Cycle {} Pressure to {} lbs hold 5 secs'.format(cycle, POUNDS10), hold=5)
+     for push in range(POUNDS10 + step, p['pressure']+1, step):
+       b.pressure(push, rampText.format(cycle, push), hold=5)
+     ease(b, cycle)
+     for push in range(p['plus'] + 5, p['minus']+1, 5):
+       b.angle(push, degreesText(cycle, push, 3), hold=3)
+   resetAB(b)
+
+def AB1(b, p):
+   def ease(b, cycle):
+     b.pressure(POUNDS10, 'Cycle {} Pressure to {} lbs hold 5 secs'.format(cycle, POUNDS10),
+                after='Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10))
+   ABRamp(b, p, 3, 'Cycle {} Pressure to {} lbs hold 5 secs', ease)
+
+def AB3(b, p):
+   def ease(b, cycle):
+     b.pressure(POUNDS5, 'Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10))
+   ABRamp(b, p, 5, 'Cycle {} Pressure {} lbs hold 5 secs', ease)
+
+def ABInterleaved(b, p, step):
+   pressure = p['pressure']
+   ABStart(b)
+   for cycle in range(1, p['cycles']+1):
+     degrees = p['plus']
+     current = POUNDS10
+     PMet = False
+     DMet = False
+     while True:
+       b.angle(p['plus'], degreesText(cycle, p['plus']))
+       b.pressure(POUNDS10, 'Cycle {} Pressure to {} lbs'.format(cycle, POUNDS10), hold=5)
+
+       if(current + step > pressure):
+         PMet = True
+       if(not PMet):
+         current += step
+       if(PMet and DMet):
+         break
+       b.pressure(current, pressureText(cycle, current, 5), hold=5)
+       current -= 1
+       b.pressure(current, pressureText(cycle, current, 5), hold=5)
+
+       if(current + step > pressure):
+         PMet = True
+       if(not PMet):
+         current += step
+       if(PMet and DMet):
+         break
+       b.pressure(current, pressureText(cycle, current, 5), hold=5)
+       current -= 1
+       b.pressure(current, pressureText(cycle, current))
+
+       if(degrees + 5 > p['minus']):
+         DMet = True
+       if(not DMet):
+         degrees += 5
+       if(PMet and DMet):
+         break
+       b.angle(degrees, degreesText(cycle, degrees, 3), hold=3)
+   resetAB(b)
+
+def AB2(b, p):
+   ABInterleaved(b, p, 3)
+
+def AB4(b, p):
+   ABInterleaved(b, p, 5)
+
+
+### AC and AD: axial pressure with lateral angle ###
+
+def resetAC(b):
+   if(b.concurrent):
+      b.together([b.angleStep(DEGREES0), b.axialStep(schedule.NOWEIGHT)],
+                 'Moved to start {} Degrees'.format(DEGREES0), after='Moved to start Degrees')
+   else:
+      b.angle(DEGREES0, 'Moved to start {} Degrees'.format(DEGREES0), after='Moved to start Degrees')
+      b.resetA()
+   b.finish()
+   b.say('')
+
+def pressureAndAngle(b, cycle, lbs, pressureHold, shown, target, angleHold):
+   '''
+   A pressure step followed by an angle step.  With b.concurrent A and C
+   move at once and hold for both holds together, the session's hold time
+   stays the same and only the travel overlaps.
+   '''
+   if(not b.concurrent):
+      b.pressure(lbs, pressureText(cycle, lbs, pressureHold), hold=pressureHold)
+      b.angle(target, degreesText(cycle, shown, angleHold), hold=angleHold)
+      return
+   seconds = pressureHold + angleHold
+   b.together([b.pressureStep(lbs), b.angleStep(target)],
+              'Cycle {} Pressure {} lbs {} Degrees hold {} secs'.format(cycle, lbs, shown, seconds), hold=seconds)
+
+def ACStart(b, after):
+   b.angle(DEGREES0, 'Set to start {} Degrees'.format(DEGREES0), after=after)
+
+def ACRamp(b, p, angle, step, descending, negate, pressureHold, settle):
+   '''Pressure and angle stepped together until both reach their targets.'''
+   pressure = p['pressure']
+   ACStart(b, 'Set to start {} Degrees'.format(DEGREES0) if not descending else 'Set to start Degrees')
+   for cycle in range(1, p['cycles']+1):
+     current = POUNDS10
+     degrees = DEGREES0
+     b.pressure(current, pressureText(cycle, current, 5), hold=5)
+
+     pressureMet = degreesMet = False
+     while(not (pressureMet and degreesMet)):
+       current, pressureMet = nextPressure(current, step, pressure)
+
+       if(descending):
+         if(degrees - 2.5 <= angle):
+           degrees, degreesMet = angle, True
+         else:
+           degrees -= 2.5
+       else:
+         if(degrees + 2.5 > angle):
+           degrees, degreesMet = angle, True
+         else:
+           degrees += 2.5
+
+       shown = -degrees if negate else degrees
+       pressureAndAngle(b, cycle, current, pressureHold, shown, shown, 3)
+
+     if(settle):
+       b.say('Cycle {} hold 5 secs'.format(cycle))
+       b.hold(5)
+   resetAC(b)
+
+def ACPullback(b, p, step, shown, target):
+   '''Ease off 1 lb, step up, swing to the angle and back to 0 each round.'''
+   pressure = p['pressure']
+   ACStart(b, 'Set to start {} Degrees'.format(DEGREES0))
+   for cycle in range(1, p['cycles']+1):
+     current = POUNDS10
+     b.pressure(POUNDS10, pressureText(cycle, POUNDS10, 5), hold=5)
+
+     done = False
+     while(not done):
+       current -= 1
+       b.pressure(current, pressureText(cycle, current, 3), hold=3)
+       current, done = nextPressure(current, step, pressure)
+       pressureAndAngle(b, cycle, current, 5, shown, target, 3)
+       b.angle(DEGREES0, degreesText(cycle, DEGREES0, 3), hold=3)
+   resetAC(b)
+
+def ACBothSides(b, p, first, second):
+   '''AC9/AD9: pullback rounds swinging to both sides, (shown, target) per side.'''
+   pressure = p['pressure']
+
+   def swing(cycle, firstHold):
+     b.angle(first[1], degreesText(cycle, first[0], firstHold), hold=firstHold)
+     swingBack(cycle)
+
+   def swingBack(cycle):
+     b.angle(DEGREES0, degreesText(cycle, DEGREES0, 3), hold=3)
+     b.angle(second[1], degreesText(cycle, second[0], 3), hold=3)
+     b.angle(DEGREES0, degreesText(cycle, DEGREES0, 3), hold=3)
+
+   ACStart(b, 'Set to start Degrees')
+   for cycle in range(1, p['cycles']+1):
+     current = POUNDS10
+     b.pressure(current, pressureText(cycle, current, 5), hold=5)
+
+     while True:
+       current -= 1
+       b.pressure(current, pressureText(cycle, current, 3), hold=3)
+       current, done = nextPressure(current, 6, pressure)
+       if(done):
+         break
+       swing(cycle, 5)
+
+       current, done = nextPressure(current, 6, pressure)
+       if(done):
+         break
+       b.pressure(current, pressureText(cycle, current, 5), hold=5)
+
+       current -= 1
+       b.pressure(current, pressureText(cycle, current, 3), hold=3)
+       current, done = nextPressure(current, 6, pressure)
+       if(done):
+         break
+       pressureAndAngle(b, cycle, current, 5, first[0], first[1], 3)
+       swingBack(cycle)
+
+     swing(cycle, 3)
+   resetAC(b)
+
+def ACDefinitions(mirrored):
+   '''
+   AC1-9, or AD1-9 with mirrored=True: the AD engine ran the same bodies
+   with the left and right angles swapped and some angles negated.
+   '''
+   def L(p):
+     return -p['left']
+
+   def R(p):
+     return p['right']
+
+   first, second = (R, L) if mirrored else (L, R)
+   if(not mirrored):
+      table = {
+        '1': lambda b, p: ACRamp(b, p, L(p), 4, True, False, 3, True),
+        '2': lambda b, p: ACRamp(b, p, R(p), 4, False, False, 5, True),
+        '3': lambda b, p: ACRamp(b, p, L(p), 6, True, False, 3, False),
+        '4': lambda b, p: ACRamp(b, p, R(p), 6, False, False, 5, True),
+        '5': lambda b, p: ACPullback(b, p, 4, L(p), L(p)),
+        '6': lambda b, p: ACPullback(b, p, 4, R(p), R(p)),
+        '7': lambda b, p: ACPullback(b, p, 6, -L(p), L(p)),
+        '8': lambda b, p: ACPullback(b, p, 6, R(p), R(p)),
+        '9': lambda b, p: ACBothSides(b, p, (-L(p), L(p)), (R(p), R(p))),
+      }
+   else:
+      table = {
+        '1': lambda b, p: ACRamp(b, p, R(p), 4, True, False, 3, True),
+        '2': lambda b, p: ACRamp(b, p, L(p), 4, False, True, 5, True),
+        '3': lambda b, p: ACRamp(b, p, R(p), 6, True, False, 3, False),
+        '4': lambda b, p: ACRamp(b, p, L(p), 6, False, True, 5, True),
+        '5': lambda b, p: ACPullback(b, p, 4, R(p), R(p)),
+        '6': lambda b, p: ACPullback(b, p, 4, -L(p), -L(p)),
+        '7': lambda b, p: ACPullback(b, p, 6, -R(p), -R(p)),
+        '8': lambda b, p: ACPullback(b, p, 6, -L(p), -L(p)),
+        '9': lambda b, p: ACBothSides(b, p, (R(p), R(p)), (-L(p), L(p))),
+      }
+   return table
+
+
+def nothing(b, p):
+   '''AB0, AC0 and AD0 were listed but never dispatched: calibrate and stop.'''
+   pass
+
+FAMILIES = {
+   'A': {'0': A0, '1': A1, '2': A2, '3': A3, '4': A4, '5': A5, '6': A6, '7': A7, '8': A8},
+   'B': {'0': B0, '1': B1, '2': B2, '3': B3},
+   'C': {'0': lateral0, '1': C1, '2': C2, '3': C3},
+   'D': {'0': lateral0, '1': D1, '2': D2, '3': D3},
+   'AB': {'0': nothing, '1': AB1, '2': AB2, '3': AB3, '4': AB4},
+   'AC': dict(ACDefinitions(False), **{'0': nothing}),
+   'AD': dict(ACDefinitions(True), **{'0': nothing}),
+}
+
+def familyOf(protocol):
+   for family in ('AB', 'AC', 'AD', 'A', 'B', 'C', 'D'):
+     if(protocol.startswith(family) and protocol[len(family):] in FAMILIES[family]):
+        return family, protocol[len(family):]
+   raise ValueError('unknown protocol {}'.format(protocol))
+
+def protocols():
+   return [family + number for family in FAMILIES for number in sorted(FAMILIES[family])]
+
+def compileProtocol(protocol, pressure=0, cycles=1, left=0, right=0, minus=0, plus=0, marks=None,
+                    concurrent=False, synchronized=False):
+   '''
+   Flat step list for protocol.  marks is the CMarks table (config.CMarks)
+   for the families that move actuator C.  Raises ValueError for unknown
+   protocols and for angles without a calibrated position, before anything
+   is sent.  concurrent moves pressure and angle together where AC/AD
+   stepped them one after the other, synchronized also lines up their
+   arrival (see interpreter.py).
+   '''
+   family, number = familyOf(protocol)
+
+   def lateral(degrees):
+     key = '{:.1f}'.format(degrees)
+     if(marks is None or key not in marks):
+        raise ValueError('{}: no C mark for {} degrees'.format(protocol, key))
+     return marks[key]
+
+   def horizontal(degrees):
+     if(degrees not in BDEGREES):
+        raise ValueError('{}: no B position for {} degrees'.format(protocol, degrees))
+     return BDEGREES[degrees]
+
+   if(family in ('C', 'D', 'AC', 'AD')):
+      b = Builder(lateral=lateral, concurrent=concurrent and family in ('AC', 'AD'), synchronized=synchronized)
+   else:
+      b = Builder(horizontal=horizontal)
+
+   b.prologue()
+   if(family == 'A'):
+      b.sleep(0.5)
+   FAMILIES[family][number](b, {'pressure': pressure, 'cycles': cycles, 'left': left, 'right': right,
+                                'minus': minus, 'plus': plus})
+   return b.steps
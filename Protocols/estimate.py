@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Session duration from a compiled schedule.
+
+Holds and sleeps come straight from the schedule.  Each command adds its
+learned mean round trip from the latency histograms comm.Arduino keeps
+(arduino.latency.means()), or DEFAULTLATENCY for an opcode that has not
+been timed yet, so the estimate for a protocol gets closer to real
+sessions as the histograms fill:
+
+   seconds = protocolSeconds('AC3', arduino.latency.means(), pressure=30,
+                             left=15, right=15, cycles=10, marks=config.CMarks)
+"""
+from Arduino.latency import opcodeOf
+from Protocols.definitions import compileProtocol
+from Protocols.schedule import SEND, HOLD, SLEEP, PARALLEL
+
+# seconds per command until the histograms have samples
+DEFAULTLATENCY = {'L1': 0.5, 'A12': 3.0, 'A13': 3.0, 'K': 3.0, 'P': 4.0, 'J': 1.0, 'S': 0.1}
+FALLBACK = 1.0
+
+
+def stepSeconds(step, latencies=None):
+   if(step.op in (HOLD, SLEEP)):
+      return step.arg
+   if(step.op == SEND):
+      opcode = opcodeOf(step.arg)
+      if(latencies is not None and opcode in latencies):
+         return latencies[opcode]
+      return DEFAULTLATENCY.get(opcode, FALLBACK)
+   if(step.op == PARALLEL):
+      return max(stepSeconds(move, latencies) for move in step.arg)
+   return 0.0
+
+def durations(steps, latencies=None):
+   '''Expected seconds of every step.'''
+   return [stepSeconds(step, latencies) for step in steps]
+
+def estimate(steps, latencies=None):
+   '''Expected seconds for the whole schedule.'''
+   return sum(durations(steps, latencies))
+
+def remaining(steps, index, latencies=None):
+   '''Expected seconds from step index (engine.stepIndex) to the end.'''
+   return sum(durations(steps[index:], latencies))
+
+def protocolSeconds(protocol, latencies=None, **params):
+   '''Compile protocol with the compileProtocol() params and estimate it.'''
+   return estimate(compileProtocol(protocol, **params), latencies)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a compiled schedule (schedule.py) on a protocol engine.
+
+The engine supplies what the hand-coded protocols used: arduino.send,
+completion (armed before each command, woken by DONE or cancelled by
+stop()), exitFlag for interruptible holds and signals.progress/finished.
+Holds and sleeps go through engine.clock (clock.py), so a SimulatedClock
+runs them in virtual time.  engine.stepIndex follows the step being run.
+
+PARALLEL steps go through arduino.submit(), the sequence-numbered queue in
+Arduino/commands.py.  With taggedCommands over the binary framing each
+actuator channel has its own command in flight and the moves overlap.
+Untagged firmware cannot say which move finished, and text commands have
+no terminator to keep two of them apart, so otherwise they are sent one
+after the other as before.
+
+With engine.pressureControl (controller.py), on firmware that lists the
+'speed' capability, P steps are not sent: the controller ramps to the
+pressure from the streamed readings and keeps holding it until a command
+that moves A itself, or the end of the run.
+
+stop() on an engine writes X through arduino.emergencyStop() and wake()s
+the run, a stopped run sends nothing more.  arduino refuses everything
+but X after the stop until runSteps() starts the next run; the operator's
+commands from the GUI go out through arduino.sendManual() meanwhile.
+
+With engine.checkpoints (journal.py) every completed step is journaled,
+and a resumed session starts after its checkpoint.
+
+With engine.streaming, on firmware that lists 'profile', the runs of plain
+moves and holds are handed to the firmware as profiles (streaming.py) and
+only the other steps run here.
+"""
+from Protocols import streaming
+from Protocols.journal import checkpoint
+from Protocols.estimate import stepSeconds
+from Protocols.schedule import SAY, SEND, HOLD, SLEEP, FINISH, PARALLEL, FAILFINISH, FAILIGNORE
+from Protocols.schedule import AXIAL, PRESSURE, JERK
+
+# commands that move A, the pressure controller lets go of it first
+MOVESA = (AXIAL, JERK)
+
+
+def wake(engine):
+   '''
+   Everything engine's run can be waiting in returns now: the DONE wait,
+   holds (exitFlag), the pressure controller and a streamed profile.
+   '''
+   engine.exitFlag.set()
+   engine.completion.cancel()
+   control = getattr(engine, 'pressureControl', None)
+   if(control is not None):
+      control.wake()
+   events = getattr(engine, 'profileEvents', None)
+   if(events is not None):
+      events.put(('X', None))
+
+def halt(arduino):
+   '''X, unless stop() wrote it already.'''
+   emergencyStop = getattr(arduino, 'emergencyStop', None)
+   if(emergencyStop is None):
+      arduino.send('X')
+   else:
+      emergencyStop()
+
+def sendAndWait(engine, command):
+   if(engine.completion.isCancelled()):
+      return False               # stopped, not one more move
+   engine.completion.arm()
+   engine.arduino.send(command)
+
+   if(not engine.completion.wait()):
+     halt(engine.arduino)
+     print('STOPPED')
+     return False
+   return True
+
+def startDelays(engine, moves):
+   '''
+   Seconds to hold back each move so all arrive with the slowest, from the
+   learned mean round trip of each opcode (estimate.py).
+   '''
+   recorder = getattr(engine.arduino, 'latency', None)
+   expected = [stepSeconds(move, None if recorder is None else recorder.means()) for move in moves]
+   return [max(expected) - seconds for seconds in expected]
+
+def sendStep(engine, step, control):
+   if(control is not None):
+      if(step.actuator == PRESSURE):
+         return control.rampTo(step.target, engine.exitFlag)
+      if(step.actuator in MOVESA or step.arg == 'R'):
+         control.release()
+   return sendAndWait(engine, step.arg)
+
+def sendTogether(engine, step, control=None):
+   '''Submit the moves of a PARALLEL step and wait for every DONE.'''
+   moves = step.arg
+   if(control is not None):
+      for move in moves:
+        if(move.actuator == PRESSURE):
+           control.setTarget(move.target)
+        elif(move.actuator in MOVESA):
+           control.release()
+      moves = [move for move in moves if move.actuator != PRESSURE]
+   delays = startDelays(engine, moves) if step.target and moves else [0.0] * len(moves)
+   overlap = getattr(engine.arduino, 'taggedCommands', False) and getattr(engine.arduino, 'framing', False)
+
+   start = engine.clock.now()
+   futures = []
+   ok = True
+   for delay, move in sorted(zip(delays, moves), key=lambda pair: pair[0]):
+     wait = delay - (engine.clock.now() - start)
+     if(wait > 0):
+        engine.clock.wait(engine.exitFlag, wait)
+     if(engine.exitFlag.is_set() or engine.completion.isCancelled()):
+        ok = False
+        break
+     futures.append(engine.arduino.submit(move.arg))
+     if(not overlap and not futures[-1].wait()):
+        ok = False
+        break
+
+   if(ok):
+      ok = all([future.wait() for future in futures])
+   if(ok and control is not None and control.active):
+      ok = control.waitSettled(engine.exitFlag)
+   if(not ok):
+      halt(engine.arduino)
+      print('STOPPED')
+   return ok
+
+def runSteps(engine, steps):
+   '''Run steps in order; False if a command failed and the run was ended.'''
+   resume = getattr(engine.arduino, 'resume', None)
+   if(resume is not None and not engine.completion.isCancelled()):
+      resume()                   # a new run, commands go out again after an earlier stop
+   checkpoints = getattr(engine, 'checkpoints', None)
+   start = 0 if checkpoints is None else checkpoints.begin(steps)
+   ok = False
+   try:
+     control = getattr(engine, 'pressureControl', None)
+     if(control is not None and not control.available()):
+        print('firmware has no speed mode, P steps are sent')
+        control = None
+     if(control is None):
+        ok = runFrom(engine, steps, start, None)
+     else:
+        control.engage(engine)
+        try:
+          ok = runFrom(engine, steps, start, control)
+        finally:
+          control.release()
+     return ok
+   finally:
+     if(checkpoints is not None):
+        checkpoints.end(ok and not engine.exitFlag.is_set())
+
+def runFrom(engine, steps, start, control):
+   if(start > 0):
+      # resuming: a fresh S status decides whether A, B and C need homing.
+      # Only a status written after the S counts, the firmware answers a
+      # bare DONE while noStatus is set and then A, B and C are re-homed.
+      telemetry = getattr(engine.arduino, 'telemetry', None)
+      before = None if telemetry is None else telemetry.count
+      if(not sendAndWait(engine, 'S')):
+         return False
+      prefix = engine.checkpoints.resumeSteps(start, None if telemetry is None else telemetry.latestStatus(before))
+      if(not runLoop(engine, prefix, control, None)):
+         return False
+   if(control is None and getattr(engine, 'streaming', False)):
+      if(engine.arduino.supports('profile')):
+         return runStreamed(engine, steps, start)
+      print('firmware has no profiles, steps are sent one by one')
+   return runLoop(engine, steps[start:], control, start)
+
+def runStreamed(engine, steps, first=0):
+   for start, end, streamed in streaming.blocks(steps[first:]):
+     start, end = start + first, end + first
+     if(streamed):
+        ok = streaming.runProfile(engine, steps, start, end)
+     else:
+        ok = runLoop(engine, steps[start:end], None, start)
+     if(not ok):
+        return False
+   return True
+
+def runLoop(engine, steps, control, offset=0):
+   '''steps is the schedule from index offset on; offset None for steps outside it, not checkpointed.'''
+   for index, step in enumerate(steps, offset or 0):
+     if(offset is not None):
+        engine.stepIndex = index
+
+     if(step.op == SAY):
+        engine.signals.progress.emit(step.arg)
+
+     elif(step.op == SEND):
+        if(not sendStep(engine, step, control)):
+           if(step.fail == FAILIGNORE):
+              continue
+           if(step.fail == FAILFINISH):
+              engine.signals.finished.emit(False)
+           return False
+
+     elif(step.op == PARALLEL):
+        if(not sendTogether(engine, step, control)):
+           if(step.fail == FAILFINISH):
+              engine.signals.finished.emit(False)
+           return False
+
+     elif(step.op == HOLD):
+        engine.clock.wait(engine.exitFlag, step.arg)
+
+     elif(step.op == SLEEP):
+        engine.clock.sleep(step.arg)
+
+     elif(step.op == FINISH):
+        engine.signals.finished.emit(step.arg)
+
+     if(offset is not None and step.op in (SEND, PARALLEL, HOLD, SLEEP)):
+        checkpoint(engine, index)
+
+   return True
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only checkpoint journal for resuming interrupted sessions.
+
+Every session writes JSON lines to one journal file:
+
+   begin    session id, protocol, the params to rebuild the engine with and
+            a fingerprint of the compiled schedule
+   step     after each completed step: step index, cycle, pressure and
+            degrees so far, and the last reported A/B/C/pressure sample
+   resume   the session was picked up again at index
+   end      completed, or not (stopped, failed, resume declined)
+
+A writer thread appends and fsyncs the lines as they come, so the engine
+never waits for the disk and a crash loses at most the last few records;
+a torn last line is skipped on reading and the next session's records
+start on a line of their own.
+pending() gives the last checkpoint of a session that did not complete:
+
+   journal = Journal('sessions.journal')
+   checkpoint = journal.pending()
+   engine.checkpoints = journal.resume(checkpoint)   # or journal.start(protocol, params)
+
+The interpreter then runs the schedule from the step after the checkpoint.
+It asks for an S status first and when A, B and C are still where the
+checkpoint saw them it skips the L1 calibration and the move to the start
+position, and only sends the last move of each actuator again.
+"""
+import collections
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+from Protocols.schedule import Builder, SAY, SEND, PARALLEL
+from Protocols.schedule import AXIAL, HORIZONTAL, LATERAL, PRESSURE
+
+CYCLE = re.compile(r'Cycle (\d+)')
+DEGREES = re.compile(r'(-?\d+(?:\.\d+)?) Degrees')
+
+# raw units of the S| frame: A and B 455 a inch, C in steps (70 a degree)
+TOLERANCE = (115, 115, 35)
+
+# the actuator a move leaves in place, P and A12 both position A
+HOLDS = {AXIAL: 'A', PRESSURE: 'A', HORIZONTAL: 'B', LATERAL: 'C'}
+
+Checkpoint = collections.namedtuple('Checkpoint', ['session', 'protocol', 'params', 'fingerprint', 'index',
+                                                   'cycle', 'pressure', 'degrees', 'reported', 'time'])
+
+
+def fingerprint(steps):
+   return hashlib.sha1(repr(list(steps)).encode()).hexdigest()[:16]
+
+def reportedOf(sample):
+   '''[positionA, positionB, steps, pressure] of a telemetry sample, or None.'''
+   if(sample is None):
+      return None
+   return [sample['positionA'], sample['positionB'], sample['steps'], sample['pressure']]
+
+def checkpoint(engine, index):
+   '''Record that step index of engine's schedule completed, if it keeps a journal.'''
+   checkpoints = getattr(engine, 'checkpoints', None)
+   if(checkpoints is None or engine.exitFlag.is_set()):
+      return           # a hold cut short by stop() did not complete
+   telemetry = getattr(engine.arduino, 'telemetry', None)
+   checkpoints.after(index, None if telemetry is None else telemetry.latest())
+
+
+class Journal():
+   def __init__(self, path, maxBytes=1 << 20):
+     self.path = path
+     self.maxBytes = maxBytes      # rotated to path.1 when a session starts past this
+     self.lock = threading.Lock()
+     self.torn = self.tornTail()
+     # a writer thread does the fsync, the engine does not wait for the card
+     self.queue = queue.Queue()
+     self.thread = threading.Thread(target=self.write, name='Journal', daemon=True)
+     self.thread.start()
+
+   def append(self, record):
+     self.queue.put(json.dumps(record, separators=(',', ':')) + '\n')
+
+   def write(self):
+     while True:
+       lines = [self.queue.get()]
+       while not self.queue.empty():
+         lines.append(self.queue.get())
+       try:
+         with self.lock:
+           with open(self.path, 'a') as f:
+             if(self.torn):
+                f.write('\n')     # end the line a crash cut short
+                self.torn = False
+             f.write(''.join(lines))
+             f.flush()
+             os.fsync(f.fileno())
+       except OSError as e:
+         print('journal: {}'.format(e))
+       for line in lines:
+         self.queue.task_done()
+
+   def tornTail(self):
+     '''The file ends in a line without its newline.'''
+     try:
+       with open(self.path, 'rb') as f:
+         f.seek(-1, os.SEEK_END)
+         return f.read(1) != b'\n'
+     except OSError:
+       return False         # missing or empty
+
+   def flush(self):
+     '''Until every appended record is on disk.'''
+     self.queue.join()
+
+   def records(self):
+     self.flush()
+     if(not os.path.exists(self.path)):
+        return []
+     records = []
+     with open(self.path) as f:
+       for line in f:
+         try:
+           records.append(json.loads(line))
+         except ValueError:
+           pass             # torn write
+     return records
+
+   def rotate(self):
+     self.flush()
+     with self.lock:
+       if(os.path.exists(self.path) and os.path.getsize(self.path) > self.maxBytes):
+          os.replace(self.path, self.path + '.1')
+
+   def pending(self):
+     '''Last checkpoint of the newest session if it did not complete, else None.'''
+     begin = None
+     last = None
+     for record in self.records():
+       event = record.get('event')
+       if(event == 'begin'):
+          begin, last = record, None
+       elif(begin is None or record.get('session') != begin['session']):
+          continue
+       elif(event == 'step'):
+          last = record
+       elif(event == 'end' and (record.get('completed') or record.get('discarded'))):
+          begin, last = None, None
+     if(begin is None or last is None):
+        return None
+     return Checkpoint(begin['session'], begin['protocol'], begin['params'], begin['fingerprint'],
+                       last['index'], last.get('cycle'), last.get('pressure'), last.get('degrees'),
+                       last.get('reported'), last['time'])
+
+   def start(self, protocol, params):
+     '''Checkpointer for a new session of protocol.'''
+     self.rotate()
+     return Checkpointer(self, '{:x}'.format(int(time.time() * 1000)), protocol, params)
+
+   def resume(self, checkpoint):
+     return Checkpointer(self, checkpoint.session, checkpoint.protocol, checkpoint.params, checkpoint)
+
+   def discard(self, checkpoint):
+     '''Resume declined, the session is not offered again.'''
+     self.append({'event': 'end', 'session': checkpoint.session, 'completed': False,
+                  'discarded': True, 'time': time.time()})
+
+
+class Checkpointer():
+   '''One session's view of the journal, engine.checkpoints.'''
+   def __init__(self, journal, session, protocol, params, resumeFrom=None, tolerance=TOLERANCE):
+     self.journal = journal
+     self.session = session
+     self.protocol = protocol
+     self.params = params
+     self.resumeFrom = resumeFrom
+     self.tolerance = tolerance
+     self.steps = []
+     self.reset()
+
+   def reset(self):
+     self.walked = 0
+     self.cycle = None
+     self.pressure = 0.0
+     self.degrees = None
+     self.holding = {}      # 'A'/'B'/'C' -> the last SEND step that moved it
+
+   def record(self, event, **fields):
+     fields.update(event=event, session=self.session, time=time.time())
+     self.journal.append(fields)
+
+   def begin(self, steps):
+     '''Index of the first step to run: 0, or the one after the checkpoint when resuming this schedule.'''
+     self.steps = steps
+     self.reset()
+     printed = fingerprint(steps)
+     checkpoint = self.resumeFrom
+     if(checkpoint is not None and checkpoint.fingerprint == printed and checkpoint.index + 1 < len(steps)):
+        self.record('resume', index=checkpoint.index)
+        return checkpoint.index + 1
+     if(checkpoint is not None):
+        print('{} changed since the checkpoint, starting over'.format(self.protocol))
+        self.resumeFrom = None
+     self.record('begin', protocol=self.protocol, params=self.params, fingerprint=printed)
+     return 0
+
+   def walk(self, index):
+     '''Bring cycle, pressure, degrees and holding up to step index.'''
+     for step in self.steps[self.walked:index + 1]:
+       if(step.op == SAY):
+          cycle = CYCLE.search(step.arg)
+          if(cycle):
+             self.cycle = int(cycle.group(1))
+          degrees = DEGREES.search(step.arg)
+          if(degrees):
+             self.degrees = float(degrees.group(1))
+       elif(step.op in (SEND, PARALLEL)):
+          for send in (step.arg if step.op == PARALLEL else (step,)):
+            if(send.actuator in HOLDS):
+               self.holding[HOLDS[send.actuator]] = send
+            if(send.actuator == PRESSURE):
+               self.pressure = float(send.target)
+            elif(send.actuator == AXIAL):
+               self.pressure = 0.0
+     self.walked = max(self.walked, index + 1)
+
+   def after(self, index, sample=None):
+     self.walk(index)
+     self.record('step', index=index, cycle=self.cycle, pressure=self.pressure, degrees=self.degrees,
+                 reported=reportedOf(sample))
+
+   def end(self, completed):
+     self.record('end', completed=completed)
+
+   def inPlace(self, sample):
+     '''A, B and C are where the checkpoint last saw them.'''
+     reported = reportedOf(sample)
+     saved = None if self.resumeFrom is None else self.resumeFrom.reported
+     if(reported is None or saved is None):
+        return False
+     return all(abs(now - then) <= tolerance for now, then, tolerance in zip(reported, saved, self.tolerance))
+
+   def resumeSteps(self, start, sample):
+     '''Steps that bring the actuators back to where step start expects them.'''
+     self.walk(start - 1)
+     b = Builder()
+     inPlace = self.inPlace(sample)
+     if(not inPlace):
+        b.prologue()
+     b.say('Resuming at cycle {}'.format(self.cycle) if self.cycle is not None else 'Resuming')
+     # angles first, pressure on A last
+     for actuator in ('B', 'C', 'A'):
+       if(actuator in self.holding):
+          b.steps.append(self.holding[actuator])
+     print('resume {} at step {}, {}'.format(self.protocol, start, 'in place' if inPlace else 're-homing'))
+     return b.steps
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Flat step schedules for the protocol engines.
+
+A protocol is compiled once, before the session starts, into a list of
+Steps that the interpreter in interpreter.py runs in order:
+
+   SAY     arg = progress text for signals.progress
+   SEND    arg = firmware command, wait for its DONE
+   HOLD    arg = seconds, exitFlag.wait(timeout=arg) so stop() cuts it short
+   SLEEP   arg = seconds, plain time.sleep
+   FINISH  arg = bool for signals.finished
+   PARALLEL arg = tuple of SEND steps on different actuators, sent together
+           and waited for together; target True lines up their arrival
+
+A SEND that does not complete (stop, killProtocol) sends X and then, by its
+fail field, emits finished(False) and ends the run (FAILFINISH), ends the
+run silently (FAILSTOP, the L1 calibration step) or carries on (FAILIGNORE,
+the jerk and S position requests that were never checked).
+
+The Builder has one method per primitive the hand-coded engines repeated,
+so protocol definitions (definitions.py) read as the schedule itself.
+analyze() walks a schedule without hardware: hold time, command counts and
+actuator travel.
+"""
+import collections
+
+SAY = 'say'
+SEND = 'send'
+HOLD = 'hold'
+SLEEP = 'sleep'
+FINISH = 'finish'
+PARALLEL = 'parallel'
+
+FAILFINISH = 'finish'
+FAILSTOP = 'stop'
+FAILIGNORE = 'ignore'
+
+# actuator fields of SEND steps, target is in the actuator's own unit
+AXIAL = 'A'        # A12{inches}
+HORIZONTAL = 'B'   # A13{inches}
+LATERAL = 'C'      # K{steps}
+PRESSURE = 'P'     # P{lbs}, moves A until the load cell reads lbs
+JERK = 'J'
+OTHER = ''
+
+Step = collections.namedtuple('Step', ['op', 'arg', 'fail', 'actuator', 'target'])
+Step.__new__.__defaults__ = (FAILFINISH, OTHER, None)
+
+NOWEIGHT = 0
+STARTPOSITION = 0.5
+
+
+class Builder():
+   def __init__(self, lateral=None, horizontal=None, concurrent=False, synchronized=False):
+     '''
+     lateral(degrees) -> K steps (CMarks), horizontal(degrees) -> inches of
+     actuator B (the B/AB degree table); either may be None for families
+     that do not move that actuator.  concurrent lets definitions combine
+     moves with together(), synchronized asks for matched arrival.
+     '''
+     self.steps = []
+     self.lateral = lateral
+     self.horizontal = horizontal
+     self.concurrent = concurrent
+     self.synchronized = synchronized
+
+   ### primitives ###
+
+   def say(self, text):
+     self.steps.append(Step(SAY, text))
+
+   def send(self, command, actuator=OTHER, target=None, fail=FAILFINISH):
+     self.steps.append(Step(SEND, command, fail, actuator, target))
+
+   def hold(self, seconds):
+     self.steps.append(Step(HOLD, seconds))
+
+   def sleep(self, seconds):
+     self.steps.append(Step(SLEEP, seconds))
+
+   def finish(self, ok=True):
+     self.steps.append(Step(FINISH, ok))
+
+   ### moves ###
+
+   def pressureStep(self, lbs):
+     return Step(SEND, 'P{}'.format(lbs), FAILFINISH, PRESSURE, lbs)
+
+   def axialStep(self, inches):
+     return Step(SEND, 'A12{}'.format(inches), FAILFINISH, AXIAL, inches)
+
+   def angleStep(self, degrees):
+     '''Lateral (K) for the C/D/AC/AD families, horizontal (A13) for B/AB.'''
+     if(self.lateral is not None):
+        position = self.lateral(degrees)
+        return Step(SEND, 'K{}'.format(position), FAILFINISH, LATERAL, float(position))
+     inches = self.horizontal(degrees)
+     return Step(SEND, 'A13{}'.format(inches), FAILFINISH, HORIZONTAL, float(inches))
+
+   def move(self, step, text=None, after=None, hold=None):
+     '''
+     '>>text' progress, the command, 'text' (or after) progress, optional
+     hold; the pattern every engine step followed.
+     '''
+     if(text is not None):
+        self.say('>>' + text)
+     self.steps.append(step)
+     if(after is None):
+        after = text
+     if(after is not None):
+        self.say(after)
+     if(hold is not None):
+        self.hold(hold)
+
+   def pressure(self, lbs, text=None, after=None, hold=None):
+     self.move(self.pressureStep(lbs), text, after, hold)
+
+   def axial(self, inches, text=None, after=None, hold=None):
+     self.move(self.axialStep(inches), text, after, hold)
+
+   def angle(self, degrees, text=None, after=None, hold=None):
+     self.move(self.angleStep(degrees), text, after, hold)
+
+   def together(self, steps, text=None, after=None, hold=None):
+     '''Several SEND steps on different actuators as one PARALLEL step.'''
+     self.move(Step(PARALLEL, tuple(steps), FAILFINISH, OTHER, self.synchronized), text, after, hold)
+
+   def jerk(self, option=''):
+     self.send('J{}'.format(option), JERK, None, FAILIGNORE)
+
+   ### shared sections ###
+
+   def prologue(self):
+     '''Load-cell calibration marks, then A to the start position.'''
+     self.send('L1', fail=FAILSTOP)
+     self.axial(STARTPOSITION)
+     self.say('Moved to start {}'.format(STARTPOSITION))
+
+   def resetA(self):
+     self.axial(NOWEIGHT, 'Moved to start {}'.format(NOWEIGHT))
+
+
+def analyze(steps):
+   '''
+   Static summary of a schedule: seconds of holds and sleeps, commands by
+   opcode and travel per actuator (inches for A and B, steps for C, lbs of
+   pressure change for P) counted from the first target of each.
+   '''
+   holdTime = 0.0
+   commands = collections.Counter()
+   moves = collections.Counter()
+   travel = collections.defaultdict(float)
+   position = {}
+   progress = 0
+
+   for step in steps:
+     if(step.op in (HOLD, SLEEP)):
+        holdTime += step.arg
+     elif(step.op == SAY):
+        progress += 1
+     elif(step.op in (SEND, PARALLEL)):
+        for send in (step.arg if step.op == PARALLEL else (step,)):
+          commands[send.arg[:3] if send.arg[:3] in ('A12', 'A13') else send.arg[:1]] += 1
+          if(send.target is not None):
+             moves[send.actuator] += 1
+             if(send.actuator in position):
+                travel[send.actuator] += abs(send.target - position[send.actuator])
+             position[send.actuator] = send.target
+
+   return {'steps': len(steps), 'holdTime': holdTime, 'commands': sum(commands.values()),
+           'opcodes': dict(commands), 'moves': dict(moves),
+           'travel': {actuator: round(value, 3) for actuator, value in travel.items()},
+           'progress': progress}
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+One protocol session at a time on a dedicated control thread.
+
+SessionManager owns the engines' lifecycle: submit() queues an engine as a
+Session and the 'ProtocolControl' thread runs the sessions one after the
+other.  Submitting an engine that is running or queued already returns its
+session instead of starting it twice, so two command streams can never
+reach the firmware at once.
+
+The engine's finished/progress/APressure signals are relayed through the
+manager's own signals, connected for the session and disconnected when it
+ends, so the GUI connects to the manager once instead of to every engine:
+
+   sessions = SessionManager(stopLine=stop_line)
+   sessions.finished.connect(protocol_completed)
+   sessions.submit(ACProtocols.Protocols(...))
+   sessions.stop('stop button')
+
+With a stopLine (Arduino/estop.py) the running engine's stop() is
+registered on it and every session starts a new set of stop latencies.
+With a journal (journal.py) a session submitted with the params to rebuild
+its engine is checkpointed step by step, and resume= a checkpoint from
+journal.pending() picks an interrupted one up where it stopped.
+"""
+import collections
+import threading
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QObject, pyqtSignal
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+STOPPED = 'stopped'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+RELAYED = ('finished', 'progress', 'APressure')
+
+
+class Session():
+   def __init__(self, number, engine, name=None):
+     self.number = number
+     self.engine = engine
+     self.name = name if name is not None else getattr(engine, 'protocol', '')
+     self.state = PENDING
+     self.queuedAt = time.time()
+     self.startedAt = None
+     self.endedAt = None
+     self.finished = []       # values of the engine's finished signal
+     self.error = None
+
+   def seconds(self):
+     if(self.startedAt is None):
+        return 0.0
+     return (self.endedAt or time.time()) - self.startedAt
+
+   def __repr__(self):
+     return '<Session #{} {} {}>'.format(self.number, self.name, self.state)
+
+
+class SessionManager(QObject):
+   started = pyqtSignal(object)
+   ended = pyqtSignal(object)
+   finished = pyqtSignal(bool)
+   progress = pyqtSignal(str)
+   APressure = pyqtSignal(str)
+
+   def __init__(self, stopLine=None, journal=None, parent=None):
+     super(SessionManager, self).__init__(parent)
+     self.stopLine = stopLine
+     self.journal = journal
+     self.condition = threading.Condition()
+     self.pending = collections.deque()
+     self.active = None
+     self.count = 0
+     self.history = collections.deque(maxlen=100)
+     self.running = True
+
+     self.thread = threading.Thread(target=self.run, name='ProtocolControl', daemon=True)
+     self.thread.start()
+
+   def submit(self, engine, name=None, params=None, resume=None):
+     '''
+     Queue engine to run after the sessions before it; its Session.  params
+     are journaled with the session, resume is the checkpoint to go on from.
+     '''
+     with self.condition:
+       for session in ([self.active] if self.active is not None else []) + list(self.pending):
+         if(session.engine is engine):
+            print('{} already {}'.format(session, session.state))
+            return session
+       if(not self.running):
+          raise RuntimeError('session manager shut down')
+       self.count += 1
+       session = Session(self.count, engine, name)
+       if(self.journal is not None and (params is not None or resume is not None)):
+          engine.checkpoints = self.journal.resume(resume) if resume is not None else \
+                               self.journal.start(session.name, params)
+       self.pending.append(session)
+       self.condition.notify_all()
+     return session
+
+   def busy(self):
+     with self.condition:
+       return self.active is not None or len(self.pending) > 0
+
+   def engine(self):
+     '''The running engine, or None.'''
+     session = self.active
+     return None if session is None else session.engine
+
+   def cancelPending(self):
+     with self.condition:
+       cancelled = list(self.pending)
+       self.pending.clear()
+     for session in cancelled:
+       session.state = CANCELLED
+       self.history.append(session)
+     return cancelled
+
+   def stop(self, source='stop', clearPending=True):
+     '''Stop the running session, and drop the queued ones unless clearPending is False.'''
+     if(clearPending):
+        self.cancelPending()
+     if(self.stopLine is not None):
+        self.stopLine.trigger(source)    # X also when nothing is running
+        return
+     engine = self.engine()
+     if(engine is not None):
+        engine.stop()
+
+   def shutdown(self, timeout=5.0):
+     with self.condition:
+       self.running = False
+       self.condition.notify_all()
+     self.stop('shutdown')
+     self.thread.join(timeout)
+
+   def run(self):
+     while True:
+       with self.condition:
+         self.condition.wait_for(lambda: len(self.pending) > 0 or not self.running)
+         if(not self.running):
+            return
+         session = self.pending.popleft()
+         self.active = session
+
+       try:
+         self.begin(session)
+         session.engine.run()
+       except Exception as e:
+         print('{} failed: {}'.format(session, e))
+         session.error = str(e)
+       finally:
+         self.end(session)
+
+   def begin(self, session):
+     engine = session.engine
+     engine.signals.finished.connect(session.finished.append, QtCore.Qt.DirectConnection)
+     for name in RELAYED:
+       getattr(engine.signals, name).connect(getattr(self, name))
+     if(self.stopLine is not None):
+        self.stopLine.newSession()
+        self.stopLine.register(engine.stop)
+     session.state = RUNNING
+     session.startedAt = time.time()
+     self.started.emit(session)
+
+   def end(self, session):
+     '''
+     Disconnect session's engine and record how it ended.  Whatever goes
+     wrong here the session counts as FAILED and the next one can start.
+     '''
+     engine = session.engine
+     session.endedAt = time.time()
+     try:
+       if(self.stopLine is not None):
+          self.stopLine.unregister(engine.stop)
+       for name in RELAYED:
+         try:
+           getattr(engine.signals, name).disconnect(getattr(self, name))
+         except TypeError:
+           pass
+       try:
+         engine.signals.finished.disconnect(session.finished.append)
+       except TypeError:
+         pass
+
+       # engines for an unknown protocol return from __init__ before exitFlag
+       exitFlag = getattr(engine, 'exitFlag', None)
+       if(session.error is not None):
+          session.state = FAILED
+       elif((exitFlag is not None and exitFlag.is_set()) or False in session.finished):
+          session.state = STOPPED
+       else:
+          session.state = DONE
+     except Exception as e:
+       print('{} failed to end: {}'.format(session, e))
+       if(session.error is None):
+          session.error = str(e)
+       session.state = FAILED
+     finally:
+       with self.condition:
+         self.active = None
+         self.history.append(session)
+     self.ended.emit(session)
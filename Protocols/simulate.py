@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Fast-forward protocol runs against the emulated firmware.
+
+   python -m Protocols.simulate AD9 --pressure 30 --left 15 --right 15 --cycles 10
+   python -m Protocols.simulate --all --cycles 1,10
+
+The engine, comm.Arduino and Arduino/emulator.py run as in a real session,
+over the emulator's pty, but share a SimulatedClock: holds and sleeps
+pass in virtual time and the emulator jumps the clock to each actuator
+arrival.  A session that takes most of an hour finishes in a second or so
+with the same commands and progress messages; virtualSeconds in the result
+is how long it would have taken.
+"""
+import argparse
+import json
+import threading
+import time
+import types
+
+from Arduino import comm, estop
+from Arduino.emulator import VirtualArduino
+from Protocols import AProtocols, BProtocols, CProtocols, DProtocols, ABProtocols, ACProtocols, ADProtocols
+from Protocols.clock import SimulatedClock
+from Protocols.controller import PressureController
+from Protocols.definitions import familyOf, protocols
+
+FACTOR = 3640
+
+def defaultMarks():
+   '''CMarks for -20..20 degrees in 2.5 degree steps, 70 steps a degree around 1400.'''
+   return {'{:.1f}'.format(-20 + 2.5 * i): str(1400 + int((-20 + 2.5 * i) * 70)) for i in range(17)}
+
+def makeEngine(protocol, arduino, clock, config, pressure=10, cycles=1, left=0, right=0, minus=30, plus=15,
+               concurrent=False, synchronized=False, pressureControl=None, streaming=False):
+   family, number = familyOf(protocol)
+   if(family == 'A'):
+      return AProtocols.Protocols(FACTOR, protocol, pressure, cycles, arduino, clock=clock,
+                                  pressureControl=pressureControl, streaming=streaming)
+   if(family == 'B'):
+      return BProtocols.Protocols(FACTOR, protocol, minus, plus, cycles, arduino, clock=clock, streaming=streaming)
+   if(family == 'C'):
+      return CProtocols.Protocols(FACTOR, protocol, left, right, cycles, arduino, config, clock=clock, streaming=streaming)
+   if(family == 'D'):
+      return DProtocols.Protocols(FACTOR, protocol, left, right, cycles, arduino, config, clock=clock, streaming=streaming)
+   if(family == 'AB'):
+      return ABProtocols.Protocols(FACTOR, protocol, pressure, minus, plus, cycles, arduino, clock=clock,
+                                   pressureControl=pressureControl, streaming=streaming)
+   if(family == 'AC'):
+      return ACProtocols.Protocols(FACTOR, protocol, pressure, left, right, 0, cycles, arduino, config, clock=clock,
+                                   concurrent=concurrent, synchronized=synchronized,
+                                   pressureControl=pressureControl, streaming=streaming)
+   return ADProtocols.Protocols(FACTOR, protocol, pressure, left, right, 0, cycles, arduino, config, clock=clock,
+                                concurrent=concurrent, synchronized=synchronized,
+                                pressureControl=pressureControl, streaming=streaming)
+
+
+class Simulator():
+   '''One emulator and serial link in virtual time, reused for any number of runs.'''
+   def __init__(self, marks=None, speed=1.0, CSpeed=1000.0, wireMode='text', taggedCommands=False,
+                pressureControl=False, connectTimeout=10.0):
+     self.clock = SimulatedClock()
+     self.config = types.SimpleNamespace(CMarks=defaultMarks() if marks is None else marks)
+     self.emulator = VirtualArduino(speed=speed, CSpeed=CSpeed, clock=self.clock)
+     port = self.emulator.start()
+
+     self.arduino = comm.Arduino(port=port, statusSignals=False, wireMode=wireMode,
+                                 taggedCommands=taggedCommands)
+     self.thread = threading.Thread(target=self.arduino.run, name='SimulatedLink', daemon=True)
+     self.thread.start()
+     deadline = time.monotonic() + connectTimeout
+     while not self.arduino.connected and time.monotonic() < deadline:
+       time.sleep(0.05)
+     if(not self.arduino.connected):
+        raise RuntimeError('no link to the emulator on {}'.format(port))
+     self.pressureControl = PressureController(self.arduino, clock=self.clock) if pressureControl else None
+     self.stopLine = estop.StopLine(self.arduino)
+
+   def run(self, protocol, stopAfter=None, **params):
+     '''
+     Run protocol to the end; the commands, progress messages, finished
+     values and the virtual and wall seconds it took.  stopAfter triggers
+     the stop line that many wall seconds in, 'stop' has its latencies.
+     '''
+     if(self.pressureControl is not None and familyOf(protocol)[0] in ('A', 'AB', 'AC', 'AD')):
+        params = dict(params, pressureControl=self.pressureControl)
+     engine = makeEngine(protocol, self.arduino, self.clock, self.config, **params)
+     progress = []
+     finished = []
+     engine.signals.progress.connect(progress.append)
+     engine.signals.finished.connect(finished.append)
+
+     self.stopLine.newSession()
+     self.stopLine.register(engine.stop)
+     timer = None
+     if(stopAfter is not None):
+        timer = threading.Timer(stopAfter, self.stopLine.trigger, ('simulate',))
+        timer.start()
+
+     first = len(self.emulator.received)
+     virtualStart = self.clock.now()
+     start = time.monotonic()
+     try:
+       engine.run()
+     finally:
+       if(timer is not None):
+          timer.cancel()
+       self.stopLine.unregister(engine.stop)
+     seconds = time.monotonic() - start
+
+     params.pop('pressureControl', None)
+     return {'protocol': protocol, 'params': params,
+             'commands': [command for when, command in self.emulator.received[first:]],
+             'progress': progress, 'finished': finished,
+             'virtualSeconds': round(self.clock.now() - virtualStart, 3), 'seconds': round(seconds, 3),
+             'stop': self.stopLine.report()['last']}
+
+   def close(self):
+     self.emulator.close()
+
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description='Run protocols in virtual time against the emulator')
+   parser.add_argument('protocol', nargs='?', help='e.g. AC3')
+   parser.add_argument('--all', action='store_true', help='every protocol')
+   parser.add_argument('--pressure', type=int, default=30)
+   parser.add_argument('--cycles', default='1', help='cycle counts, comma separated')
+   parser.add_argument('--left', type=float, default=15)
+   parser.add_argument('--right', type=float, default=15)
+   parser.add_argument('--minus', type=int, default=30, help='B/AB minus degrees')
+   parser.add_argument('--plus', type=int, default=15, help='B/AB plus degrees')
+   parser.add_argument('--concurrent', action='store_true', help='AC/AD: move pressure and angle together')
+   parser.add_argument('--synchronized', action='store_true', help='with --concurrent, line up the arrivals')
+   parser.add_argument('--tagged', action='store_true', help='tag and frame commands so moves on different actuators overlap')
+   parser.add_argument('--control', action='store_true', help='run the P steps with the host pressure controller')
+   parser.add_argument('--stream', action='store_true', help='run moves and holds as firmware profiles')
+   parser.add_argument('--stop-after', type=float, help='stop each run this many wall seconds in')
+   parser.add_argument('--json', help='write the full results here')
+   args = parser.parse_args(argv)
+
+   names = protocols() if args.all else [args.protocol]
+   if(names == [None]):
+      parser.error('give a protocol or --all')
+
+   simulator = Simulator(wireMode='binary' if args.tagged else 'text', taggedCommands=args.tagged,
+                         pressureControl=args.control)
+   results = []
+   try:
+     for name in names:
+       for cycles in [int(c) for c in args.cycles.split(',')]:
+         result = simulator.run(name, pressure=args.pressure, cycles=cycles, left=args.left,
+                                right=args.right, minus=args.minus, plus=args.plus,
+                                concurrent=args.concurrent, synchronized=args.synchronized,
+                                streaming=args.stream, stopAfter=args.stop_after)
+         results.append(result)
+         print('{:5} cycles {:3} {:5} commands {:5} progress  virtual {:8.1f} s  wall {:6.3f} s  finished {}{}'.format(
+               name, cycles, len(result['commands']), len(result['progress']),
+               result['virtualSeconds'], result['seconds'], result['finished'],
+               '' if result['stop'] is None else '  stop {}'.format(result['stop'])))
+   finally:
+     simulator.close()
+
+   if(args.json):
+      with open(args.json, 'w') as f:
+        json.dump(results, f, indent=1)
+
+if __name__ == '__main__':
+   main()
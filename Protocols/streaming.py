@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Streamed setpoint profiles: the firmware runs the moves and holds itself.
+
+A run of move steps in a compiled schedule (SAY, P/A12/A13/K SENDs, HOLD,
+SLEEP) becomes a profile of segments, each a command and the hold after
+it.  The host queues the segments ahead of execution and only follows the
+firmware's progress frames:
+
+   Q{index}:{command}:{holdMs}   append a segment, empty command = hold only
+   QG                            start, segments keep running as they arrive
+   QZ                            no more segments, QF|{count} after the last
+   X                             stop and drop the profile
+
+   QS|{index}  segment started   '>>' progress texts
+   QR|{index}  target reached    the progress texts after the move
+   QE|{index}  hold over         one more segment goes out
+
+At most window segments are queued at once, the firmware's buffer.  The
+steps between the move runs (L1, J, S, PARALLEL, FINISH) run through the
+interpreter as before; blocks() splits a schedule into both kinds.  Needs
+firmware that takes the Q commands and lists 'profile' in its CAPS| reply,
+Arduino/motor/motor.ino and Arduino/emulator.py do.
+"""
+import collections
+import queue
+import time
+
+from Protocols.journal import checkpoint
+from Protocols.schedule import SAY, SEND, HOLD, SLEEP, FAILFINISH
+from Protocols.schedule import AXIAL, HORIZONTAL, LATERAL, PRESSURE
+
+WINDOW = 16
+EVENTS = ('QS', 'QR', 'QE', 'QF')
+STALL = 30.0    # seconds a segment may take to start or arrive, or past its hold to end
+
+Segment = collections.namedtuple('Segment', ['index', 'command', 'hold', 'started', 'reached', 'step'])
+
+# SEND steps the firmware can run from a profile
+MOVES = (AXIAL, HORIZONTAL, LATERAL, PRESSURE)
+
+
+def streamable(step):
+   if(step.op in (SAY, HOLD, SLEEP)):
+      return True
+   return step.op == SEND and step.actuator in MOVES and step.fail == FAILFINISH
+
+def blocks(steps):
+   '''(start, end, streamed) ranges covering steps; streamed ranges hold at least one move.'''
+   ranges = []
+   start = 0
+   while start < len(steps):
+     end = start
+     kind = streamable(steps[start])
+     while end < len(steps) and streamable(steps[end]) == kind:
+       end += 1
+     ranges.append([start, end, kind and any(step.op == SEND for step in steps[start:end])])
+     start = end
+
+   merged = []
+   for start, end, streamed in ranges:
+     if(merged and merged[-1][2] == streamed):
+        merged[-1][1] = end
+     else:
+        merged.append([start, end, streamed])
+   return [tuple(r) for r in merged]
+
+def profile(steps, offset=0):
+   '''
+   Segments for a streamable run of steps, and the progress texts left
+   after the last one.  offset is the index of steps[0] in the schedule.
+   '''
+   segments = []
+   pending = []
+   command = None
+   hold = 0.0
+   reached = []
+   first = None
+   closed = True
+
+   def close():
+     segments.append(Segment(len(segments), command, hold, started, reached, first))
+
+   started = []
+   for index, step in enumerate(steps, offset):
+     if(step.op == SAY):
+        if(not closed and hold == 0.0):
+           reached.append(step.arg)
+        else:
+           pending.append(step.arg)
+     elif(step.op == SEND):
+        if(not closed):
+           close()
+        command, hold, reached, first, closed = step.arg, 0.0, [], index, False
+        started, pending = pending, []
+     elif(step.op in (HOLD, SLEEP)):
+        if(closed or pending):
+           if(not closed):
+              close()
+           command, hold, reached, first, closed = '', 0.0, [], index, False
+           started, pending = pending, []
+        hold += step.arg
+   if(not closed):
+      close()
+   return segments, pending
+
+def segmentCommand(segment):
+   return 'Q{}:{}:{}'.format(segment.index, segment.command, int(round(segment.hold * 1000)))
+
+def runProfile(engine, steps, start, end, window=WINDOW):
+   '''
+   Stream steps[start:end] and follow it to the end; False, after
+   finished(False), when it was stopped or the firmware went quiet.
+   '''
+   segments, trailing = profile(steps[start:end], start)
+   # schedule index of the last step each segment covers, for the journal
+   lastStep = [segment.step - 1 for segment in segments[1:]] + [end - 1]
+   events = queue.Queue()
+
+   def listener(tag, values):
+     if(tag in EVENTS):
+        events.put((tag, int(values[0]) if values else None))
+
+   arduino = engine.arduino
+   arduino.addListener(listener)
+   engine.profileEvents = events      # interpreter.wake() puts an X here
+   try:
+     sent = 0
+     for segment in segments[:window]:
+       arduino.sendLine(segmentCommand(segment))
+       sent += 1
+     if(sent == len(segments)):
+        arduino.sendLine('QZ')
+     arduino.sendLine('QG')
+
+     # measured from the last progress frame, a QR| allows for its hold
+     allowed = STALL
+     progress = time.monotonic()
+     while True:
+       if(engine.exitFlag.is_set()):
+          break
+       try:
+         tag, index = events.get(timeout=0.1)
+       except queue.Empty:
+         if(time.monotonic() - progress >= allowed):
+            print('profile stalled')
+            break
+         continue
+
+       if(tag == 'X'):
+          continue
+       progress = time.monotonic()
+       allowed = STALL + (segments[index].hold if tag == 'QR' else 0.0)
+       if(tag == 'QF'):
+          for text in trailing:
+            engine.signals.progress.emit(text)
+          checkpoint(engine, end - 1)
+          return True
+       segment = segments[index]
+       if(tag == 'QS'):
+          engine.stepIndex = segment.step
+          for text in segment.started:
+            engine.signals.progress.emit(text)
+       elif(tag == 'QR'):
+          for text in segment.reached:
+            engine.signals.progress.emit(text)
+       elif(tag == 'QE' and not engine.exitFlag.is_set()):
+          if(sent < len(segments)):
+             arduino.sendLine(segmentCommand(segments[sent]))
+             sent += 1
+             if(sent == len(segments)):
+                arduino.sendLine('QZ')
+          checkpoint(engine, lastStep[index])
+
+     arduino.emergencyStop()
+     print('STOPPED')
+     engine.signals.finished.emit(False)
+     return False
+   finally:
+     engine.profileEvents = None
+     arduino.removeListener(listener)
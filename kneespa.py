@@ -19,7 +19,7 @@ from PyQt5.QtWidgets import (
     QTime,
     QElapsedTimer,
 )
-from Arduino import comm, config
+from Arduino import comm, config, bridge, estop
 from UI.video_player import VideoPlayer
 from UI.timer_dialog import TimerDialog
 from UI.pressure_dialog import PressureDialog
@@ -31,6 +31,10 @@ from Protocols import (
     ABProtocols,
     ACProtocols,
     ADProtocols,
+    controller,
+    estimate,
+    journal,
+    session,
 )
 
 
@@ -66,6 +70,11 @@ os.chdir("/home/pi/kneespa")
 
 DEGREES = "\u00b0"
 
+# per-command round-trip histograms, kept across sessions for the duration estimate
+LATENCY_FILE = "latency.json"
+# append-only step checkpoints, an interrupted session can be resumed from it
+JOURNAL_FILE = "sessions.journal"
+
 
 # Main Python class
 class KneeSpaApp(QMainWindow):
@@ -92,7 +101,7 @@ class KneeSpaApp(QMainWindow):
                 command = "K{}".format(position)
             else:
                 command = "A{}{}".format(actuator, inches)
-        self.arduino.send(command)
+        self.arduino.sendManual(command)
         print("cmd {}".format(command.strip()))
         self.I2C_status = False
         print("end")
@@ -103,7 +112,7 @@ class KneeSpaApp(QMainWindow):
 
         print(" positioned to {} degrees pos {}".format(degrees, position))
         command = "K{}".format(position)
-        self.arduino.send(command)
+        self.arduino.sendManual(command)
         print("cmd {}".format(command.strip()))
 
         self.I2C_status = False
@@ -217,8 +226,6 @@ class KneeSpaApp(QMainWindow):
         self.timer_dialog = TimerDialog(self)
         self.pressure_dialog = PressureDialog(self)
 
-        self.threadpool = QtCore.QThreadPool()
-        print(f"Multithreading with maximum {self.threadpool.maxThreadCount()} threads")
         self.worker = None
 
         self.setup_arduino()
@@ -1346,7 +1353,7 @@ class KneeSpaApp(QMainWindow):
                 self.current_leg_length += 0.5
                 self.update_leg_length_field()
                 self.adjust_leg_length()
-                self.arduino.send("F+")
+                self.arduino.sendManual("F+")
                 GPIO.output(EXTRABACKWARD, GPIO.LOW)
                 GPIO.output(EXTRAFORWARD, GPIO.HIGH)
                 print(f"Leg length increased to {self.current_leg_length}")
@@ -1363,7 +1370,7 @@ class KneeSpaApp(QMainWindow):
                 self.current_leg_length -= 0.5
                 self.update_leg_length_field()
                 self.adjust_leg_length()
-                self.arduino.send("F-")
+                self.arduino.sendManual("F-")
                 GPIO.output(EXTRAFORWARD, GPIO.LOW)
                 GPIO.output(EXTRABACKWARD, GPIO.HIGH)
                 print(f"Leg length decreased to {self.current_leg_length}")
@@ -1377,7 +1384,7 @@ class KneeSpaApp(QMainWindow):
         print(f"Adjusting leg length to {self.current_leg_length:.1f}")
         try:
             command = f"L{self.current_leg_length:.1f}"
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
             print(f"Sent command to Arduino: {command}")
         except Exception as e:
             print(f"Error in adjust_leg_length: {str(e)}")
@@ -1546,7 +1553,7 @@ class KneeSpaApp(QMainWindow):
 
         self.ui.statusLbl.setText("Protocol Started")
 
-        self.arduino.send(
+        self.arduino.sendManual(
             "L5{:3} {:3}".format(self.config.AMarks["0.0"], self.config.BMarks["0.0"])
         )
         self.I2C_status = 0
@@ -1566,6 +1573,8 @@ class KneeSpaApp(QMainWindow):
                 self.axialPressure,
                 self.cycles,
                 self.arduino,
+                pressureControl=self.pressure_control,
+                streaming=self.config.streamProfiles,
             )
             options = "Pressure: " + str(self.axialPressure)
 
@@ -1586,6 +1595,7 @@ class KneeSpaApp(QMainWindow):
                 self.plusHorizontalDegrees,
                 self.cycles,
                 self.arduino,
+                streaming=self.config.streamProfiles,
             )
             options = (
                 "Minus "
@@ -1605,6 +1615,7 @@ class KneeSpaApp(QMainWindow):
                 self.cycles,
                 self.arduino,
                 self.config,
+                streaming=self.config.streamProfiles,
             )
             options = (
                 "Left: "
@@ -1624,6 +1635,7 @@ class KneeSpaApp(QMainWindow):
                 self.cycles,
                 self.arduino,
                 self.config,
+                streaming=self.config.streamProfiles,
             )
             options = (
                 "Left: "
@@ -1643,6 +1655,8 @@ class KneeSpaApp(QMainWindow):
                 self.plusHorizontalDegrees,
                 self.cycles,
                 self.arduino,
+                pressureControl=self.pressure_control,
+                streaming=self.config.streamProfiles,
             )
             options = "Pressure: " + str(self.axialPressure)
 
@@ -1658,6 +1672,9 @@ class KneeSpaApp(QMainWindow):
                 self.cycles,
                 self.arduino,
                 self.config,
+                **self.concurrent_moves(),
+                pressureControl=self.pressure_control,
+                streaming=self.config.streamProfiles,
             )
             options = "Pressure: " + str(self.axialPressure)
 
@@ -1673,50 +1690,56 @@ class KneeSpaApp(QMainWindow):
                 self.cycles,
                 self.arduino,
                 self.config,
+                **self.concurrent_moves(),
+                pressureControl=self.pressure_control,
+                streaming=self.config.streamProfiles,
             )
             options = "Pressure: " + str(self.axialPressure)
 
-        self.worker.signals.finished.connect(self.protocolCompleted)
-        self.worker.signals.progress.connect(self.protocolProgress)
-        self.worker.signals.APressure.connect(self.AProtocolPressure)
-
-        self.threadpool.start(self.worker)
-
         self.goTimer.start(500)
 
     def stop_protocol(self):
         """Stop protocol sequence."""
         print("Stopping protocol")
-        self.arduino.send("X")
+        # X, the e-stop pin and the worker's stop() go out from the EStop thread
+        self.sessions.stop("stop button")
         self.ui.start_button.setText("Start")
-        if self.worker:
-            self.worker.stop()
 
-    def execute_protocol(self, protocol, pressure, cycles):
-        """Carry out the protocol after initation."""
+    def execute_protocol(self, protocol, pressure, cycles, resume=None):
+        """Carry out the protocol after initation, or go on from the checkpoint resume."""
         print(f"Executing protocol: {protocol}, pressure: {pressure}, cycles: {cycles}")
         if protocol.isdigit() and 1 <= int(protocol) <= 9:
-            protocol_number = PROTOCOL_MAPPING[int(protocol)]
+            protocol_name = PROTOCOL_MAPPING[int(protocol)]
             start_degrees = 0
+            seconds = self.estimate_protocol_seconds(protocol_name, pressure, cycles)
 
             self.worker = ACProtocols.Protocols(
                 self.config.CFactor,
-                f"AC{protocol_number}",
+                protocol_name,
                 pressure,
+                getattr(self, "left_lat_angle", 0),
+                getattr(self, "right_lat_angle", 0),
                 start_degrees,
                 cycles,
                 self.arduino,
                 self.config,
+                **self.concurrent_moves(),
+                pressureControl=self.pressure_control,
+                streaming=self.config.streamProfiles,
             )
-            self.worker.signals.finished.connect(self.protocol_completed)
-            self.worker.signals.progress.connect(self.update_protocol_progress)
-            self.threadpool.start(self.worker)
+            params = {
+                "protocol": protocol,
+                "pressure": pressure,
+                "cycles": cycles,
+                "left": getattr(self, "left_lat_angle", 0),
+                "right": getattr(self, "right_lat_angle", 0),
+            }
+            self.sessions.submit(self.worker, protocol_name, params=params, resume=resume)
 
             # Start the protocol timer
             self.protocol_start_time = datetime.now()
-            self.protocol_total_time = timedelta(
-                seconds=cycles * 60  # Assuming 1 minute per cycle
-            )
+            self.protocol_total_time = timedelta(seconds=seconds)
+            self.timer_dialog.update_time(str(self.protocol_total_time).split(".")[0])
             self.protocol_timer.start(1000)  # Update every second
         else:
             print("Invalid protocol selected")
@@ -1724,6 +1747,28 @@ class KneeSpaApp(QMainWindow):
                 self, "Invalid Protocol", "Please select a valid protocol (1-9)."
             )
 
+    def concurrent_moves(self):
+        """AC/AD engine options from the concurrentMoves setting."""
+        mode = getattr(self.config, "concurrentMoves", "off")
+        return {"concurrent": mode in ("on", "sync"), "synchronized": mode == "sync"}
+
+    def estimate_protocol_seconds(self, protocol, pressure, cycles):
+        """Expected duration from the protocol's schedule and the learned command latencies."""
+        try:
+            return estimate.protocolSeconds(
+                protocol,
+                self.arduino.latency.means(),
+                pressure=pressure,
+                cycles=cycles,
+                left=getattr(self, "left_lat_angle", 0),
+                right=getattr(self, "right_lat_angle", 0),
+                marks=self.config.CMarks,
+                **self.concurrent_moves(),
+            )
+        except ValueError as e:
+            print(f"Cannot estimate {protocol}: {e}")
+            return 0
+
     def update_protocol_time(self):
         """Populat the remaining time in a protocol."""
         print("Updating protocol time")
@@ -1756,35 +1801,71 @@ class KneeSpaApp(QMainWindow):
 
     def reset_arduino(self, event):
         print("Resetting Arduino")
-        self.arduino.send("Y")
+        self.arduino.resume()
+        self.arduino.sendManual("Y")
         QMessageBox.information(self, "Arduino Reset", "Arduino has been reset.")
 
     def send_zero_mark(self):
         """Send zero mark to Arduino."""
         print("Sending zero mark to Arduino")
-        self.arduino.send(
+        self.arduino.sendManual(
             "L5{:3} {:3}".format(self.config.AMarks["0.0"], self.config.BMarks["0.0"])
         )
 
     def send_calibration(self):
         """Send calibration data to Arduino."""
         print("Sending calibration data to Arduino")
-        self.arduino.send("L0{}".format(self.config.calibration))
+        self.arduino.sendManual("L0{}".format(self.config.calibration))
 
     def measure_weight_btn_clicked(self):
-        """Measure weight."""
+        """Measure weight; the firmware weighs until the load cell settles."""
         print("Measuring weight")
-        self.arduino.send("L4")
+        self.arduino.sendManual("L4")
+
+    def weight_measured(self, weight, confidence):
+        """Log the weight from L4 and warn when it did not settle."""
+        print(f"Weight {weight:.2f} lbs, confidence {confidence:.2f}")
+        if confidence < 0.5:
+            print("Weight did not settle, ask the patient to hold still and measure again")
+
+    def command_refused(self, command, reason):
+        """Show a command the Arduino link did not write."""
+        self.ui.statusLbl_2.setText(f"{command} not sent: {reason}")
 
     def measure_location_btn_clicked(self):
         """Measure location."""
         print("Measuring location")
-        self.arduino.send("L6")
+        self.arduino.sendManual("L6")
 
     def ready_to_go(self):
         """Set I2C status to ready."""
         print("Setting I2C status to ready")
         self.i2c_status = True
+        self.offer_resume()
+
+    def offer_resume(self):
+        """After a (re)connect, offer to go on with a session that was interrupted."""
+        if self.sessions.busy():
+            return
+        checkpoint = self.journal.pending()
+        if checkpoint is None:
+            return
+        params = checkpoint.params
+        answer = QMessageBox.question(
+            self,
+            "Resume Protocol",
+            f"Protocol {checkpoint.protocol} was interrupted at cycle {checkpoint.cycle}, "
+            f"{checkpoint.pressure} lbs. Resume where it stopped?",
+            QMessageBox.Yes | QMessageBox.No,
+        )
+        if answer != QMessageBox.Yes:
+            self.journal.discard(checkpoint)
+            return
+        self.left_lat_angle = params["left"]
+        self.right_lat_angle = params["right"]
+        self.execute_protocol(
+            params["protocol"], params["pressure"], params["cycles"], resume=checkpoint
+        )
 
     def status(self, position_a, position_b, steps, pressure):
         """Log the status data received from the Arduino."""
@@ -1797,13 +1878,13 @@ class KneeSpaApp(QMainWindow):
     def close_event(self, event):
         """Handle window close event."""
         print("Closing application")
+        self.sessions.shutdown()
+        self.arduino.dumpLatency(LATENCY_FILE)
+        self.arduino.closeCapture()
         GPIO.cleanup()
         self.arduino.disconnect()
         event.accept()
 
-        if self.worker:
-            self.worker.stop()
-
     def forward_flexion_btn(self, actuator, step, speed_factor):
         """Handle forward flexion button press."""
         print(
@@ -1823,7 +1904,7 @@ class KneeSpaApp(QMainWindow):
 
             command = "E{}+{}".format(actuator, speed_factor)
 
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
             return
 
         if actuator == self.actuator_a:
@@ -1838,11 +1919,11 @@ class KneeSpaApp(QMainWindow):
             command = "E{}+{}".format(actuator, speed_factor)
             command = "A12{}".format(self.axial_flexion_position)
 
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
             print(f"Actuator A new position: {self.axial_flexion_position}")
 
             time.sleep(0.3)
-            self.arduino.send("L5")
+            self.arduino.sendManual("L5")
             return
 
         if actuator == self.actuator_c:
@@ -1861,7 +1942,7 @@ class KneeSpaApp(QMainWindow):
             )
             command = "K{}".format(position)
 
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
 
     def reverse_flexion_btn(self, actuator, step, speed_factor):
         """Handle reverse flexion button press."""
@@ -1881,7 +1962,7 @@ class KneeSpaApp(QMainWindow):
             self.axial_flexion_position -= step
             command = "A12{}".format(self.axial_flexion_position)
 
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
             print(f"Actuator A new position: {self.axial_flexion_position}")
 
         if actuator == self.actuator_b:
@@ -1897,7 +1978,7 @@ class KneeSpaApp(QMainWindow):
 
             command = "E{}-{}".format(actuator, speed_factor)
 
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
 
         if actuator == self.actuator_c:
             print(f"Actuator C current position: {self.lateral_flexion_position}")
@@ -1917,7 +1998,7 @@ class KneeSpaApp(QMainWindow):
             )
             command = "K{}".format(position)
 
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
 
     def reset_flexion_btn(self, actuator):
         """Reset flexion for the given actuator."""
@@ -1925,30 +2006,33 @@ class KneeSpaApp(QMainWindow):
         if actuator == self.actuator_b:
             command = "A{}2".format(actuator)
 
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
             self.horizontal_flexion_position = -15
             return
 
         if actuator == self.actuator_a:
             command = "R{}".format(actuator)
 
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
             self.axial_flexion_position = 0
             time.sleep(5)
-            self.arduino.send("L0{}".format(self.config.calibration))
+            self.arduino.sendManual("L0{}".format(self.config.calibration))
             return
 
         if actuator == self.actuator_c:
             position = self.config.c_marks["{:.1f}".format(0)]
             print(f"Actuator C positioned to {0} degrees pos {position}")
             command = "I14{}".format(position)
-            self.arduino.send(command)
+            self.arduino.sendManual(command)
             self.lateral_flexion_position = 0
             return
 
     def protocol_completed(self, finished):
         self.ui.a_program_lbl.setText(" ")
         self.protocol_timer.invalidate()
+        self.arduino.dumpLatency(LATENCY_FILE)
+        print(f"Status frames: {self.bridge.stats()}")
+        print(f"Stop latency: {self.stop_line.report()}")
         if finished:
             print("protocol_completed")
             self.reset_btns(True)
@@ -2043,8 +2127,8 @@ class KneeSpaApp(QMainWindow):
         self.first_letter = ""
         self.ui.status_lbl_2.setText("")
 
-        if self.worker is not None:
-            self.worker.stop()
+        if self.sessions.busy():
+            self.sessions.stop("clear")
 
         self.ui.setup_btn.show()
 
@@ -2146,20 +2230,58 @@ class KneeSpaApp(QMainWindow):
     def setup_arduino(self):
         """Setup Arduino interface."""
         print("Setting up Arduino interface")
-        self.arduino = comm.Arduino()
+        self.arduino = comm.Arduino(
+            port=self.config.port,
+            statusSignals=False,
+            capture=self.config.capture or None,
+            baudRates=self.config.baudRates,
+            wireMode=self.config.wireMode,
+            taggedCommands=self.config.taggedCommands,
+        )
+        self.arduino.latency.load(LATENCY_FILE)
+        self.pressure_control = None
+        if self.config.pressureControl:
+            self.pressure_control = controller.PressureController(
+                self.arduino, gains=self.config.pressureGains
+            )
+        # stop path off the Qt event loop; pulses EMERGENCYSTOP only when estopPulse is set
+        self.stop_line = estop.StopLine(
+            self.arduino,
+            gpio=GPIO,
+            pin=EMERGENCYSTOP if self.config.estopPulse > 0 else None,
+            pulse=self.config.estopPulse,
+        )
+
+        # one protocol session at a time on its own control thread, the
+        # manager's signals are connected here once for every session
+        self.journal = journal.Journal(JOURNAL_FILE)
+        self.sessions = session.SessionManager(
+            stopLine=self.stop_line, journal=self.journal, parent=self
+        )
+        self.sessions.finished.connect(self.protocol_completed)
+        self.sessions.progress.connect(self.update_protocol_progress)
         self.thread = QThread()
 
         print("Connecting Arduino signals to KneeSpaApp slots")
         self.arduino.doneEmit.connect(self.setDone)
         self.arduino.moveToThread(self.thread)
         self.arduino.finished.connect(self.thread.quit)
-        self.arduino.astatus_emit.connect(self.status_emit)
-        self.arduino.readyToGoEmit.connect(self.readyToGo)
+        self.arduino.readyToGoEmit.connect(self.ready_to_go)
+        self.arduino.weightEmit.connect(self.weight_measured)
+        self.arduino.refusedEmit.connect(self.command_refused)
         self.thread.started.connect(self.arduino.run)
 
-        self.arduino.positionEmit.connect(self.readPosition)
-        self.arduino.status_emit.connect(self.status)
-        self.arduino.pressureEmit.connect(self.readPressure)
+        # Status, position and pressure frames reach the GUI thread coalesced,
+        # newest value per channel at most 30 times a second
+        self.bridge = bridge.CoalescingBridge(self.arduino, maxRate=30, parent=self)
+        self.bridge.statusReady.connect(self.status)
+        self.bridge.AstatusReady.connect(self.status_emit)
+        self.bridge.positionReady.connect(
+            lambda position, steps, pressure, actuator: self.read_position(
+                position, steps, actuator
+            )
+        )
+        self.bridge.pressureReady.connect(self.read_pressure)
         self.update_leg_length_field
 
         self.thread.start()
@@ -2195,7 +2317,8 @@ class KneeSpaApp(QMainWindow):
         self.reset_timer.start(500)
     
         self.i2c_status = 0
-        self.arduino.send("Y")
+        self.arduino.resume()
+        self.arduino.sendManual("Y")
         self.i2c_status = 1
         while self.i2c_status == 0:
             time.sleep(0.5)
@@ -2227,7 +2350,7 @@ class KneeSpaApp(QMainWindow):
         position = 0
         print(" positioned to {}".format(position))
         command = "I12{}".format(position)
-        self.arduino.send(command)
+        self.arduino.sendManual(command)
         self.i2c_status = 0
         QApplication.processEvents()
         while self.i2c_status == 0:
@@ -2243,7 +2366,7 @@ class KneeSpaApp(QMainWindow):
         position = 1213
         print(" positioned to {}".format(position))
         command = "A132.0"
-        self.arduino.send(command)
+        self.arduino.sendManual(command)
         self.i2c_status = 0
         while self.i2c_status == 0:
             QApplication.processEvents()
@@ -2258,7 +2381,7 @@ class KneeSpaApp(QMainWindow):
         position = self.config.c_marks["{:.1f}".format(0)]
         print(" positioned to {} degrees pos {}".format(0, position))
         command = "I14{}".format(position)
-        self.arduino.send(command)
+        self.arduino.sendManual(command)
         self.i2c_status = 0
         while self.i2c_status == 0:
             QApplication.processEvents()
@@ -2269,7 +2392,7 @@ class KneeSpaApp(QMainWindow):
             QApplication.processEvents()
             time.sleep(0.3)
     
-        self.arduino.send("L0{}".format(self.config.calibration))
+        self.arduino.sendManual("L0{}".format(self.config.calibration))
     
         self.ui.horizontal_position_flexion_slider.setValue(-15)
         self.ui.horizontal_position_flexion_lbl.setText("-15" + DEGREES)
@@ -0,0 +1,97 @@
+# coding: utf-8
+'''
+Arduino/commands.py: each DONE releases the future it belongs to, cancelAll
+releases the rest, and a refused write does not leave a command in flight.
+'''
+
+import threading
+
+import pytest
+
+from Arduino.commands import CommandQueue, SEQMODULO, channelOf
+
+
+class Wire():
+   def __init__(self, refuse=False):
+     self.sent = []
+     self.refuse = refuse
+
+   def write(self, command, seq):
+     if(self.refuse):
+        return False
+     self.sent.append((command, seq))
+     return True
+
+@pytest.mark.parametrize('command, channel', [
+   ('A122.5', 'A'), ('I12800', 'A'), ('P20', 'A'), ('J1', 'A'), ('R', 'A'),
+   ('A130.0', 'B'), ('K1400', 'C'), ('A1410', 'C'), ('L5 80 160', 'L'), ('S', 'S'),
+])
+def test_channels(command, channel):
+   assert channelOf(command) == channel
+
+def test_tagged_acks_match_by_seq():
+   wire = Wire()
+   queue = CommandQueue(wire.write, tagged=True)
+   a = queue.submit('A122.5')
+   c = queue.submit('K1400')
+   assert wire.sent == [('A122.5', 1), ('K1400', 2)]
+
+   assert queue.acknowledge(2) is c
+   assert c.wait(0) and not a.done()
+   assert queue.acknowledge(1) is a
+   assert a.wait(0) and a.latency >= 0.0
+   assert [seq for seq, command, latency in queue.latencies()] == [2, 1]
+
+def test_tagged_same_channel_waits():
+   wire = Wire()
+   queue = CommandQueue(wire.write, tagged=True)
+   queue.submit('A122.5')
+   with pytest.raises(TimeoutError):
+     queue.submit('P20', timeout=0.05)
+   queue.acknowledge(1)
+   assert queue.submit('P20', timeout=0.05).seq == 2
+
+def test_untagged_keeps_one_in_flight():
+   wire = Wire()
+   queue = CommandQueue(wire.write)
+   first = queue.submit('A122.5')
+   with pytest.raises(TimeoutError):
+     queue.submit('K1400', timeout=0.05)
+   assert queue.acknowledge() is first
+   second = queue.submit('K1400')
+   queue.acknowledge()
+   assert second.wait(0)
+
+   assert queue.acknowledge() is None
+   assert queue.acknowledge(7) is None
+   assert queue.strayAcks == 2
+
+def test_cancel_all_releases_waiters():
+   wire = Wire()
+   queue = CommandQueue(wire.write, tagged=True)
+   moving = queue.submit('A122.5')
+   waiting = []
+   thread = threading.Thread(target=lambda: waiting.append(queue.submit('P20', timeout=5)))
+   thread.start()
+
+   assert queue.cancelAll() == 1
+   thread.join(5)
+   assert not moving.wait(0) and moving.cancelled
+   assert waiting[0].cancelled and not waiting[0].wait(0)
+   assert wire.sent == [('A122.5', 1)]
+   assert queue.acknowledge(1) is None
+
+def test_refused_write_is_cancelled():
+   queue = CommandQueue(Wire(refuse=True).write, tagged=True)
+   future = queue.submit('A122.5')
+   assert future.cancelled and not future.wait(0)
+   assert len(queue.inFlight) == 0
+
+def test_seq_wraps_past_zero():
+   queue = CommandQueue(Wire().write, tagged=True)
+   seqs = []
+   for i in range(SEQMODULO + 1):
+     seqs.append(queue.submit('S').seq)
+     queue.acknowledge(seqs[-1])
+   assert 0 not in seqs and max(seqs) == SEQMODULO - 1
+   assert seqs[SEQMODULO - 1] == 1
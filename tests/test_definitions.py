@@ -0,0 +1,101 @@
+# coding: utf-8
+'''
+Protocols/definitions.py: compiled protocols run through the interpreter
+send, say and hold exactly what the hand-coded engines did.
+
+data/legacy_traces.json holds the traces of the engines before
+compileProtocol (one or two protocols per family, run to the end and failed
+half way), recorded with the same fake link as below.
+'''
+
+import json
+import os
+
+import pytest
+
+from Protocols.definitions import compileProtocol, protocols
+from Protocols.interpreter import runSteps
+
+TRACES = os.path.join(os.path.dirname(__file__), 'data', 'legacy_traces.json')
+MARKS = {'{:.1f}'.format(-20 + 2.5 * i): str(1000 + 50 * i) for i in range(17)}
+
+with open(TRACES) as f:
+   CASES = json.load(f)
+
+
+class Trace():
+   '''The engine and link of a run, recording what they are asked to do.'''
+   def __init__(self, failAt=None):
+     self.trace = []
+     self.waits = 0
+     self.failAt = failAt          # the DONE wait that fails, 1-based
+     self.arduino = self
+     self.completion = self
+     self.exitFlag = self
+     self.clock = Clock(self.trace)
+     self.signals = self
+     self.progress = Signal(self.trace, 'say')
+     self.finished = Signal(self.trace, 'finish')
+
+   # arduino
+   def send(self, command):
+     self.trace.append(['send', command])
+
+   def write(self, command):
+     self.trace.append(['send', command.strip()])
+
+   # completion
+   def arm(self):
+     pass
+
+   def isCancelled(self):
+     return False
+
+   def wait(self, timeout=None):
+     self.waits += 1
+     return self.waits != self.failAt
+
+   # exitFlag
+   def is_set(self):
+     return False
+
+class Clock():
+   def __init__(self, trace):
+     self.trace = trace
+
+   def wait(self, event, seconds):
+     self.trace.append(['hold', seconds])
+
+   def sleep(self, seconds):
+     self.trace.append(['sleep', seconds])
+
+class Signal():
+   def __init__(self, trace, kind):
+     self.trace = trace
+     self.kind = kind
+
+   def emit(self, *values):
+     self.trace.append([self.kind] + list(values))
+
+def run(protocol, params, failAt):
+   engine = Trace(failAt)
+   runSteps(engine, compileProtocol(protocol, marks=MARKS, **params))
+   return engine.trace
+
+@pytest.mark.parametrize('case', CASES, ids=lambda case: '{protocol}-{failAt}'.format(**case))
+def test_matches_legacy_engine(case):
+   assert run(case['protocol'], case['params'], case['failAt']) == case['trace']
+
+@pytest.mark.parametrize('protocol', protocols())
+def test_every_protocol_compiles(protocol):
+   steps = compileProtocol(protocol, pressure=20, cycles=2, left=10, right=5, minus=20, plus=10, marks=MARKS)
+   assert len(steps) > 0
+
+@pytest.mark.parametrize('protocol, params', [
+   ('Z1', {}),
+   ('C1', {'left': 10, 'right': 5}),                          # no marks
+   ('B1', {'minus': 22, 'plus': 5}),                          # no B position for 22 degrees
+])
+def test_bad_protocols_raise_before_sending(protocol, params):
+   with pytest.raises(ValueError):
+     compileProtocol(protocol, **params)
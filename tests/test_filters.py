@@ -0,0 +1,139 @@
+# coding: utf-8
+'''
+Arduino/hx711/filters.py: the skiplist-backed SlidingFilter against the
+median and MAD of the window computed from scratch.
+'''
+
+import collections
+import random
+import statistics as stat
+
+import pytest
+
+from Arduino.hx711 import filters
+from Arduino.hx711.filters import IndexableSkiplist, SlidingFilter
+
+
+def brute_mad(window):
+   center = stat.median(window)
+   return stat.median([abs(v - center) for v in window])
+
+def readings(seed, count=600):
+   # 24 bit-ish readings around a load, with repeats, steps and spikes
+   rng = random.Random(seed)
+   level = 80000
+   values = []
+   for i in range(count):
+     if(rng.random() < 0.01):
+        level += rng.randint(-5000, 5000)
+     if(rng.random() < 0.03):
+        values.append(level + rng.choice([-1, 1]) * rng.randint(20000, 90000))
+     else:
+        values.append(level + rng.randint(-40, 40) // 8 * 8)
+   return values
+
+@pytest.mark.parametrize('seed', range(3))
+def test_skiplist_matches_sorted_list(seed):
+   rng = random.Random(seed)
+   skiplist = IndexableSkiplist(64)
+   reference = []
+   for i in range(2000):
+     if(reference and rng.random() < 0.45):
+        value = rng.choice(reference)
+        skiplist.remove(value)
+        reference.remove(value)
+     else:
+        value = rng.randint(-50, 50)
+        skiplist.insert(value)
+        reference.append(value)
+     reference.sort()
+     assert len(skiplist) == len(reference)
+     probe = rng.randint(-60, 60)
+     assert skiplist.rank(probe) == sum(1 for v in reference if v < probe)
+     if(reference):
+        index = rng.randrange(len(reference))
+        assert skiplist[index] == reference[index]
+   with pytest.raises(KeyError):
+     skiplist.remove(1000)
+
+@pytest.mark.parametrize('size', [1, 2, 5, 8, 31, 32])
+@pytest.mark.parametrize('seed', range(3))
+def test_sliding_median_and_mad(size, seed):
+   window = collections.deque(maxlen=size)
+   sliding = SlidingFilter(size)
+   for reading in readings(seed):
+     window.append(reading)
+     assert sliding.update(reading) == stat.median(window)
+     assert sliding.median() == stat.median(window)
+     assert sliding.mad() == brute_mad(window)
+     assert len(sliding) == len(window)
+
+@pytest.mark.parametrize('seed', range(3))
+def test_mad_about_any_center(seed):
+   rng = random.Random(seed)
+   sliding = SlidingFilter(15)
+   for reading in readings(seed, 100):
+     sliding.update(reading)
+   window = list(sliding._window)
+   for center in [stat.median(window), min(window) - 5, max(window) + 5, rng.choice(window) + 0.5]:
+     assert sliding.mad(center) == stat.median([abs(v - center) for v in window])
+
+def test_spikes_take_the_median():
+   sliding = SlidingFilter(9, spike=4.0)
+   values = [1000, 1003, 998, 1001, 1002, 999, 1000]
+   for value in values:
+     sliding.update(value)
+   assert sliding.update(50000) == stat.median(values + [50000])
+   assert sliding.spikes == 1
+
+   smoothed = SlidingFilter(9, alpha=0.5, spike=4.0)
+   for value in values:
+     smoothed.update(value)
+   before = smoothed.value
+   smoothed.update(50000)                      # smoothed toward the median, spike included
+   assert smoothed.value == pytest.approx(before + 0.5 * (stat.median(values + [50000]) - before))
+
+def test_smoothing_without_spikes():
+   sliding = SlidingFilter(5, alpha=0.25)
+   expected = None
+   for value in [10, 20, 30, 40]:
+     expected = float(value) if expected is None else expected + 0.25 * (value - expected)
+     assert sliding.update(value) == pytest.approx(expected)
+
+def test_bad_arguments():
+   with pytest.raises(ValueError):
+     SlidingFilter(0)
+   with pytest.raises(ValueError):
+     SlidingFilter(5, alpha=1.5)
+   with pytest.raises(ValueError):
+     SlidingFilter(5, spike=0)
+   with pytest.raises(ValueError):
+     SlidingFilter(5).median()
+
+@pytest.mark.skipif(filters.np is None, reason='NumPy paths need NumPy')
+@pytest.mark.parametrize('count', [31, 64, 100])
+def test_numpy_paths_match_python(count):
+   values = readings(7, count)
+   assert filters.median(filters.np.array(values)) == stat.median(values)
+   batch = filters.np.array([values, list(reversed(values))])
+   assert list(filters.median(batch)) == [stat.median(values)] * 2
+   python = sorted(values)
+   cut = int(count * 0.2)
+   assert filters.trimmed_mean(filters.np.array(values)) == pytest.approx(stat.mean(python[cut:count - cut]))
+
+@pytest.mark.skipif(filters.np is None, reason='NumPy paths need NumPy')
+@pytest.mark.parametrize('count', [10, 30, 31, 100])
+def test_lists_come_back_as_lists(monkeypatch, count):
+   values = readings(3, count)
+   values[count // 2] = False                  # a failed read
+   results = []
+   for small in (count + 1, 0):                # the Python path, then NumPy
+     monkeypatch.setitem(filters.SMALL, 'outliers_filter', small)
+     monkeypatch.setitem(filters.SMALL, 'hampel', small)
+     results.append((filters.outliers_filter(values), filters.hampel(values)))
+   for kept, cleaned in results:
+     assert type(kept) is list and type(cleaned) is list
+     assert False not in kept and len(cleaned) == count
+   assert results[0][0] == results[1][0]
+   assert results[0][1] == pytest.approx(results[1][1])
+   assert all(type(v) is int for v in results[1][0])
@@ -0,0 +1,78 @@
+# coding: utf-8
+'''
+Arduino/framing.py: frames survive the trip through FrameDecoder, and a
+frame with a bad CRC costs only itself.
+'''
+
+import pytest
+
+from Arduino import framing
+from Arduino.framing import FrameDecoder
+
+
+def frames(data, chunk=None):
+   '''Items FrameDecoder(framing=True) returns for data, fed chunk bytes at a time.'''
+   decoder = FrameDecoder(framing=True)
+   chunk = chunk or len(data)
+   items = []
+   for i in range(0, len(data), chunk):
+     items += decoder.feed(data[i:i + chunk])
+   return items, decoder
+
+def test_crc16_is_ccitt_false():
+   assert framing.crc16(b'123456789') == 0x29B1
+
+@pytest.mark.parametrize('command', ['X', 'S', 'Y', 'A121.5', 'A132.25', 'I14350', 'K1400', 'P12.5', 'L5 80 160', 'QG'])
+@pytest.mark.parametrize('seq', [None, 1, 255])
+def test_command_round_trip(command, seq):
+   items, decoder = frames(framing.encodeCommand(command, seq))
+   assert len(items) == 1 and items[0][0] == 'frame'
+   msgType, payload = items[0][1:]
+   assert framing.decodeCommand(msgType, payload) == command
+   assert framing.splitSeq(msgType, payload)[2] == seq
+   assert decoder.crcErrors == 0
+
+def test_packed_commands_are_binary():
+   assert framing.packCommand('A121.5')[0] == framing.CMD_MOVE_A
+   assert framing.packCommand('P12.5')[0] == framing.CMD_PRESSURE
+   assert framing.packCommand('A12x')[0] == framing.CMD_TEXT
+
+@pytest.mark.parametrize('tag, values, expected', [
+   ('DONE', (), ()),
+   ('DONE', (17,), (17,)),
+   ('S', (120, 130, 1400, 12.5), (120, 130, 1400, 12.5)),
+   ('A', (121, 0, 350, 30.25), (121, 0, 350, 30.25)),
+   ('PR', ('9.75',), ('9.75',)),
+   ('E', (1400, 3, 12.5, 14), (1400, 3, '12.5', 14)),
+   ('weight', ('3.10', '0.95'), ('3.10', '0.95')),
+   ('QR', (4,), ('4',)),
+])
+def test_message_round_trip(tag, values, expected):
+   items, _ = frames(framing.encodeMessage(tag, values))
+   assert framing.decodeMessage(*items[0][1:]) == (tag, expected)
+
+def test_lines_and_frames_byte_by_byte():
+   data = b'Ready to Go\n' + framing.encodeMessage('DONE', (3,)) + b'BIN|1\n' + framing.encodeMessage('PR', (1.5,))
+   items, decoder = frames(data, chunk=1)
+   assert [item[0] for item in items] == ['line', 'frame', 'line', 'frame']
+   assert items[0][1] == 'Ready to Go' and items[2][1] == 'BIN|1'
+   assert decoder.frames == 2
+
+def test_text_mode_ignores_sync():
+   decoder = FrameDecoder()
+   assert decoder.feed(b'S|1|2|3|4.00\nDONE\n') == [('line', 'S|1|2|3|4.00'), ('line', 'DONE')]
+
+@pytest.mark.parametrize('corrupt', [1, 2, 4, -1])
+def test_crc_error_drops_only_that_frame(corrupt):
+   # a corrupt LEN (1) makes the decoder wait for a longer frame, the
+   # frames after it are still there once it gives up on it
+   bad = bytearray(framing.encodeMessage('S', (1, 2, 3, 4.0)))
+   bad[corrupt] ^= 0x5A
+   good = b''.join(framing.encodeMessage('DONE', (seq,)) for seq in range(20))
+   items, decoder = frames(bytes(bad) + good)
+   assert decoder.crcErrors == 1
+   assert [framing.decodeMessage(*item[1:]) for item in items] == [('DONE', (seq,)) for seq in range(20)]
+
+def test_payload_limit():
+   with pytest.raises(ValueError):
+     framing.encodeFrame(framing.MSG_TEXT, bytes(framing.MAXPAYLOAD + 1))
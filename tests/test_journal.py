@@ -0,0 +1,163 @@
+# coding: utf-8
+'''
+Protocols/journal.py: a stopped session is resumed after its last
+checkpoint, re-homing only when the actuators moved meanwhile.
+'''
+
+import json
+import threading
+
+import pytest
+
+from Arduino.telemetry import TelemetryRing, STATUS
+from Protocols.definitions import compileProtocol
+from Protocols.interpreter import runSteps
+from Protocols.journal import Journal
+from Protocols.schedule import SEND
+
+MARKS = {'{:.1f}'.format(-20 + 2.5 * i): str(1000 + 50 * i) for i in range(17)}
+PARAMS = {'pressure': 30, 'cycles': 3, 'left': 15, 'right': 15}
+
+
+class Link():
+   '''arduino with telemetry: every command leaves a status sample at position.'''
+   def __init__(self):
+     self.sent = []
+     self.position = (500, 0, 1400, 20.0)
+     self.quiet = False       # noStatus in the firmware, a bare DONE
+     self.telemetry = TelemetryRing()
+
+   def send(self, command):
+     self.sent.append(command)
+     if(not self.quiet):
+        self.telemetry.write(STATUS, *self.position)
+
+class Completion():
+   def __init__(self, failAt=None):
+     self.waits = 0
+     self.failAt = failAt
+     self.cancelled = False
+
+   def arm(self):
+     pass
+
+   def isCancelled(self):
+     return self.cancelled
+
+   def wait(self, timeout=None):
+     self.waits += 1
+     self.cancelled = self.waits == self.failAt
+     return not self.cancelled
+
+class Clock():
+   def wait(self, event, seconds):
+     pass
+
+   def sleep(self, seconds):
+     pass
+
+class Signal():
+   def __init__(self):
+     self.values = []
+
+   def emit(self, value):
+     self.values.append(value)
+
+class Engine():
+   def __init__(self, link, checkpoints, failAt=None):
+     self.arduino = link
+     self.checkpoints = checkpoints
+     self.completion = Completion(failAt)
+     self.exitFlag = threading.Event()
+     self.clock = Clock()
+     self.progress = Signal()
+     self.finished = Signal()
+     self.signals = self
+     self.stepIndex = 0
+
+def steps():
+   return compileProtocol('AC5', marks=MARKS, **PARAMS)
+
+def stopped(journal, link, failAt):
+   '''Run AC5 until the DONE wait failAt fails, return its pending checkpoint.'''
+   engine = Engine(link, journal.start('AC5', PARAMS), failAt)
+   assert not runSteps(engine, steps())
+   checkpoint = journal.pending()
+   assert checkpoint is not None and checkpoint.index < len(steps()) - 1
+   return checkpoint
+
+def resumed(journal, link, checkpoint):
+   link.sent = []
+   engine = Engine(link, journal.resume(checkpoint))
+   assert runSteps(engine, steps())
+   return engine
+
+def tail(checkpoint):
+   return [step.arg for step in steps()[checkpoint.index + 1:] if step.op == SEND]
+
+@pytest.fixture
+def journal(tmp_path):
+   return Journal(str(tmp_path / 'sessions.journal'))
+
+def test_complete_run_leaves_nothing_pending(journal):
+   assert runSteps(Engine(Link(), journal.start('AC5', PARAMS)), steps())
+   assert journal.pending() is None
+   assert [r['event'] for r in journal.records()][-1] == 'end'
+
+@pytest.mark.parametrize('failAt', [5, 12, 20])
+def test_resume_in_place(journal, failAt):
+   link = Link()
+   checkpoint = stopped(journal, link, failAt)
+   assert checkpoint.reported == list(link.position)
+
+   engine = resumed(journal, link, checkpoint)
+   assert link.sent[0] == 'S'
+   assert 'L1' not in link.sent                   # no re-homing
+   assert link.sent[-len(tail(checkpoint)):] == tail(checkpoint)
+   assert engine.progress.values[0].startswith('Resuming')
+   assert journal.pending() is None
+
+def test_resume_after_moving_rehomes(journal):
+   link = Link()
+   checkpoint = stopped(journal, link, 12)
+   link.position = (100, 0, 1400, 0.0)          # A moved by hand meanwhile
+
+   resumed(journal, link, checkpoint)
+   assert link.sent[:3] == ['S', 'L1', 'A120.5']
+   assert link.sent[-len(tail(checkpoint)):] == tail(checkpoint)
+
+def test_resume_without_a_fresh_status_rehomes(journal):
+   link = Link()
+   checkpoint = stopped(journal, link, 12)
+   link.quiet = True                            # older samples do not count
+
+   resumed(journal, link, checkpoint)
+   assert link.sent[:3] == ['S', 'L1', 'A120.5']
+
+def test_changed_schedule_starts_over(journal):
+   link = Link()
+   checkpoint = stopped(journal, link, 12)
+   link.sent = []
+   engine = Engine(link, journal.resume(checkpoint._replace(fingerprint='changed')))
+   assert runSteps(engine, steps())
+   assert link.sent[:2] == ['L1', 'A120.5']
+
+def test_discarded_after_a_torn_line(journal):
+   link = Link()
+   checkpoint = stopped(journal, link, 12)
+   journal.flush()
+   with open(journal.path, 'a') as f:
+     f.write('{"event":"step","sess')              # crashed mid-write
+   journal = Journal(journal.path)                 # and started again
+   assert journal.pending() == checkpoint
+
+   journal.discard(checkpoint)
+   assert journal.pending() is None
+   events = [r['event'] for r in journal.records()]
+   assert events[0] == 'begin' and events.count('end') == 2
+
+def test_records_are_json_lines(journal):
+   stopped(journal, Link(), 5)
+   journal.flush()
+   with open(journal.path) as f:
+     assert all(json.loads(line)['session'] for line in f)
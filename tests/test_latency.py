@@ -0,0 +1,93 @@
+# coding: utf-8
+'''
+Arduino/latency.py: bucket bounds, percentiles against the exact ones and
+the per-opcode recorder.
+'''
+
+import random
+
+import pytest
+
+from Arduino.latency import LatencyHistogram, LatencyRecorder, HALFCOUNT, SUBCOUNT, opcodeOf
+
+
+def exact(values, p):
+   ordered = sorted(values)
+   rank = max(1, int(round(p / 100.0 * len(ordered))))
+   return ordered[rank - 1]
+
+def test_buckets_cover_every_value():
+   rng = random.Random(0)
+   for value in list(range(0, 4 * SUBCOUNT)) + [rng.randrange(1, 1 << 40) for i in range(2000)]:
+     index = LatencyHistogram.index(value)
+     low, high = LatencyHistogram.lowest(index), LatencyHistogram.lowest(index + 1)
+     assert low <= value < high
+     if(value >= SUBCOUNT):
+        assert (high - low) / float(low) <= 1.0 / HALFCOUNT
+
+@pytest.mark.parametrize('seed', range(5))
+def test_percentiles_within_bucket_precision(seed):
+   rng = random.Random(seed)
+   seconds = [rng.lognormvariate(-3, 1.5) for i in range(5000)]
+   histogram = LatencyHistogram()
+   for s in seconds:
+     histogram.record(s)
+   values = [int(s * 1e6) for s in seconds]
+   for p in (1, 50, 90, 99, 100):
+     assert histogram.percentile(p) == pytest.approx(exact(values, p), rel=1.0 / HALFCOUNT, abs=1)
+   assert histogram.min == min(values) and histogram.max == max(values)
+   assert histogram.count == len(values) and histogram.total == sum(values)
+
+def test_merge_and_state():
+   a, b, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+   for i in range(300):
+     s = (i * 37 % 101) / 1000.0
+     (a if i % 2 else b).record(s)
+     both.record(s)
+   a.merge(b)
+   assert a.report() == both.report()
+   restored = LatencyHistogram.fromState(a.state())
+   assert restored.report() == both.report() and restored.counts == both.counts
+
+def test_empty_report():
+   assert LatencyHistogram().report() == {'count': 0}
+   assert LatencyHistogram().percentile(50) == 0
+
+@pytest.mark.parametrize('command, opcode', [('A122.5', 'A12'), ('I14350', 'I14'), ('K1400', 'K'), ('L5 80 160', 'L5'), (' P20\n', 'P')])
+def test_opcodes(command, opcode):
+   assert opcodeOf(command) == opcode
+
+def test_recorder_matches_done():
+   recorder = LatencyRecorder()
+   recorder.sent('A122.5', 1, now=10.0)
+   recorder.sent('K1400', 2, now=10.5)
+   recorder.sent('V800', None, now=10.6)        # no DONE for V
+   assert recorder.done(2, now=11.0) == ('K', 0.5)
+   assert recorder.done(None, now=12.0) == ('A12', 2.0)
+   assert recorder.done(None, now=12.5) is None
+   assert recorder.unmatched == 1
+
+   recorder.sent('P20', now=13.0)
+   recorder.sent('X', now=13.1)
+   assert recorder.done(now=13.2) is None
+
+   recorder.sent('Y', now=20.0)
+   assert recorder.ready(now=23.0) == ('Y', 23.0)
+   assert recorder.ready(now=24.0) is None
+   assert recorder.means() == pytest.approx({'K': 0.5, 'A12': 2.0, 'Y': 3.0}, rel=1e-3)
+
+def test_dump_and_load(tmp_path, capsys):
+   recorder = LatencyRecorder()
+   for i in range(10):
+     recorder.sent('K1400', now=float(i))
+     recorder.done(now=i + 0.25)
+   filename = str(tmp_path / 'latency.json')
+   recorder.dump(filename)
+   assert 'K' in capsys.readouterr().out
+
+   learned = LatencyRecorder()
+   assert learned.load(filename)
+   assert learned.load(filename)
+   assert learned.report()['K']['count'] == 20
+   assert learned.means()['K'] == pytest.approx(0.25, rel=0.02)
+   assert not learned.load(str(tmp_path / 'missing.json'))
@@ -0,0 +1,84 @@
+# coding: utf-8
+'''
+Protocols/session.py: sessions run one after the other, and one that fails
+to begin, run or end does not keep the next from starting.
+'''
+
+import threading
+
+import pytest
+
+from PyQt5.QtCore import Qt, QObject, pyqtSignal
+
+from Protocols.session import SessionManager, DONE, STOPPED, FAILED
+
+
+class Signals(QObject):
+   finished = pyqtSignal(bool)
+   progress = pyqtSignal(str)
+   APressure = pyqtSignal(str)
+
+class Engine():
+   def __init__(self, known=True, fail=False, ok=True):
+     self.signals = Signals()
+     self.fail = fail
+     self.ok = ok
+     self.ran = threading.Event()
+     if(known):                # an unknown protocol returns before exitFlag
+        self.exitFlag = threading.Event()
+
+   def run(self):
+     self.ran.set()
+     if(self.fail):
+        raise RuntimeError('engine failed')
+     self.signals.finished.emit(self.ok)
+
+   def stop(self):
+     self.exitFlag.set()
+
+class Broken(Engine):
+   '''No signals to connect, begin() fails.'''
+   def __init__(self):
+     super(Broken, self).__init__()
+     del self.signals
+
+@pytest.fixture
+def sessions():
+   manager = SessionManager()
+   yield manager
+   manager.shutdown()
+
+def ended(sessions, session, timeout=5.0):
+   '''session's state once it is in the history.'''
+   done = threading.Event()
+   sessions.ended.connect(lambda s: done.set() if s is session else None, Qt.DirectConnection)
+   if(session not in sessions.history):
+      done.wait(timeout)
+   assert session in sessions.history
+   return session.state
+
+@pytest.mark.parametrize('engine, state', [
+   (Engine(), DONE),
+   (Engine(ok=False), STOPPED),
+   (Engine(known=False), DONE),
+   (Engine(fail=True), FAILED),
+   (Broken(), FAILED),
+], ids=['done', 'stopped', 'no exitFlag', 'run raises', 'begin raises'])
+def test_next_session_runs_after(sessions, engine, state):
+   first = sessions.submit(engine)
+   second = sessions.submit(Engine())
+   assert ended(sessions, first) == state
+   assert ended(sessions, second) == DONE
+   assert not sessions.busy()
+
+def test_duplicate_submit_returns_the_queued_session(sessions):
+   engine = Engine()
+   gate = threading.Event()
+   blocker = Engine()
+   blocker.run = lambda: gate.wait(5)
+   sessions.submit(blocker)
+   session = sessions.submit(engine)
+   assert sessions.submit(engine) is session
+   gate.set()
+   assert ended(sessions, session) == DONE
+   assert [s.engine for s in sessions.history].count(engine) == 1